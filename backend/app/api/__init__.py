@@ -1,5 +1,6 @@
 from .chat import router as chat_router
 from .memory import router as memory_router
+from .metrics import router as metrics_router
 from .privacy import router as privacy_router
 
-__all__ = ["chat_router", "memory_router", "privacy_router"]
+__all__ = ["chat_router", "memory_router", "metrics_router", "privacy_router"]
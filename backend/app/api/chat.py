@@ -1,33 +1,44 @@
-from fastapi import APIRouter, Depends, Request
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from typing import Optional
 from sse_starlette.sse import EventSourceResponse
 
 from ..core.auth import AuthenticatedUser, get_current_user, get_request_id
+from ..core.rate_limit import enforce_message_quota, enforce_rate_limit
 from ..models.schemas import SendMessageRequest, SendMessageResponse
 from ..services.chat_service import get_chat_service
+from ..services.generation_registry import IdempotencyConflictError
 
 
-router = APIRouter(prefix="/v1/chat", tags=["chat"])
+router = APIRouter(
+    prefix="/v1/chat",
+    tags=["chat"],
+    dependencies=[Depends(enforce_rate_limit)],
+)
 
 
 @router.post("/send", response_model=SendMessageResponse)
 async def send_message(
     body: SendMessageRequest,
-    user: AuthenticatedUser = Depends(get_current_user),
+    user: AuthenticatedUser = Depends(enforce_message_quota),
     request_id: str = Depends(get_request_id),
 ):
     """
     Send a message and receive complete AI response (non-streaming).
-    Simple endpoint that returns the full response at once.
+    Simple endpoint that returns the full response at once. Retrying with
+    the same X-Request-Id returns the original response.
     """
     chat_service = get_chat_service()
-    return await chat_service.send_message(user, body, request_id)
+    try:
+        return await chat_service.send_message(user, body, request_id)
+    except IdempotencyConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
 
 
 @router.post("/send_stream")
 async def send_message_stream(
     request: Request,
     body: SendMessageRequest,
-    user: AuthenticatedUser = Depends(get_current_user),
+    user: AuthenticatedUser = Depends(enforce_message_quota),
     request_id: str = Depends(get_request_id),
 ):
     """
@@ -40,14 +51,49 @@ async def send_message_stream(
     - heartbeat: Keep-alive
     - final: Completion with finish reason
     - error: Error details
+    
+    Retrying with the same X-Request-Id replays the original stream.
     """
     chat_service = get_chat_service()
+    try:
+        events = chat_service.send_message_stream(user, body, request_id)
+    except IdempotencyConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     
     async def event_generator():
-        async for event in chat_service.send_message_stream(user, body, request_id):
+        async for event in events:
             yield event
     
     return EventSourceResponse(
         event_generator(),
         media_type="text/event-stream",
     )
+
+
+@router.get("/streams/{generation_id}")
+async def resume_stream(
+    generation_id: str,
+    cursor: Optional[int] = Query(None, ge=0),
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+    user: AuthenticatedUser = Depends(get_current_user),
+):
+    """
+    Reconnect to a streaming response after the connection dropped.
+    
+    Replays the text after `cursor` (or the Last-Event-ID header), the
+    cursor of the last delta event received and sent as its event id,
+    then continues live with the same events as /send_stream.
+    """
+    if cursor is None:
+        cursor = int(last_event_id) if last_event_id and last_event_id.isdigit() else 0
+    
+    chat_service = get_chat_service()
+    try:
+        events = chat_service.resume_stream(user, generation_id, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    
+    return EventSourceResponse(
+        events,
+        media_type="text/event-stream",
+    )
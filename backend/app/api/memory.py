@@ -1,14 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException
 
 from ..core.auth import AuthenticatedUser, get_current_user
+from ..core.rate_limit import enforce_rate_limit
 from ..models.schemas import CurateMemoryRequest
 from ..services.memory_service import get_memory_service
 
 
-router = APIRouter(prefix="/v1/memory", tags=["memory"])
+router = APIRouter(
+    prefix="/v1/memory",
+    tags=["memory"],
+    dependencies=[Depends(enforce_rate_limit)],
+)
 
 
-@router.post("/curate")
+@router.post("/curate", status_code=202)
 async def curate_memory(
     body: CurateMemoryRequest,
     user: AuthenticatedUser = Depends(get_current_user),
@@ -16,15 +21,30 @@ async def curate_memory(
     """
     Trigger memory curation for a message range.
     
-    Extracts facts from the conversation and stores them for long-term memory.
+    Queues a background job that extracts facts from the conversation and
+    stores them for long-term memory. Poll `/v1/memory/jobs/{job_id}` for
+    the outcome.
     """
     memory_service = get_memory_service()
     
     try:
-        result = await memory_service.curate_memory(user, body)
-        return result
+        job = await memory_service.enqueue_curation(user, body)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    return {"jobId": job.id, "status": job.status}
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    user: AuthenticatedUser = Depends(get_current_user),
+):
+    """Get the status and result of a memory job."""
+    memory_service = get_memory_service()
+    job = await memory_service.get_job(user, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_response()
 
 
 @router.get("/facts")
@@ -0,0 +1,71 @@
+from typing import List
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from ..core.metrics import REGISTRY, stats_metrics
+from ..core.rate_limit import get_rate_limiter
+from ..core.token_verifier import get_token_verifier
+from ..services.context_cache import get_context_cache
+from ..services.generation_registry import get_generation_registry
+from ..services.job_queue import get_job_queue
+from ..services.llm_service import get_llm_service
+
+router = APIRouter(tags=["metrics"])
+
+
+def collect_component_metrics() -> List:
+    """Cache, limiter, job queue and LLM provider counters from their `stats()`."""
+    metrics = [
+        *stats_metrics(
+            "amorae_context_cache", get_context_cache().stats(), gauges=("size", "hit_rate")
+        ),
+        *stats_metrics("amorae_token_cache", get_token_verifier().stats(), gauges=("size",)),
+        *stats_metrics("amorae_rate_limit", get_rate_limiter().stats()),
+        *stats_metrics("amorae_generations", get_generation_registry().stats(), gauges=("size",)),
+    ]
+    
+    job_stats = get_job_queue().stats()
+    if job_stats["depth"] is None:
+        # The shared Redis queue does not report its depth
+        job_stats.pop("depth")
+    metrics.extend(stats_metrics("amorae_jobs", job_stats, gauges=("running", "workers", "depth")))
+    
+    llm_service = get_llm_service()
+    history_stats = llm_service.requests.stats()
+    metrics.extend(stats_metrics("amorae_history_cache", history_stats, gauges=("threads",)))
+    router_stats = llm_service.router.stats()
+    providers = router_stats.pop("providers")
+    metrics.extend(stats_metrics("amorae_llm_router", router_stats))
+    
+    # One sample per provider, merged into one metric per stat
+    by_name = {}
+    for name, provider_stats in providers.items():
+        for metric in stats_metrics(
+            "amorae_llm_provider",
+            provider_stats,
+            gauges=(
+                "latency_seconds",
+                "error_rate",
+                "cooling_down",
+                "concurrency_limit",
+                "in_flight",
+                "queue_depth",
+                "max_queue_depth",
+            ),
+            labels={"provider": name},
+        ):
+            merged = by_name.setdefault(metric.name, metric)
+            if merged is not metric:
+                merged.values.update(metric.values)
+    metrics.extend(by_name.values())
+    return metrics
+
+
+REGISTRY.add_collector(collect_component_metrics)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
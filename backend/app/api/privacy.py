@@ -1,111 +1,136 @@
 from fastapi import APIRouter, Depends, HTTPException
-from google.cloud import firestore as fs
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Literal
 
 from ..core.auth import AuthenticatedUser, get_current_user
-from ..core.firebase import get_firestore_client
+from ..core.rate_limit import enforce_rate_limit
+from ..services.account_deletion import get_deletion_service
+from ..services.data_export import export_filename, export_media_type, get_export_service
 
 
-router = APIRouter(prefix="/v1/privacy", tags=["privacy"])
+router = APIRouter(
+    prefix="/v1/privacy",
+    tags=["privacy"],
+    dependencies=[Depends(enforce_rate_limit)],
+)
 
 
-@router.post("/delete_user")
+@router.post("/delete_user", status_code=202)
 async def delete_user_data(
     user: AuthenticatedUser = Depends(get_current_user),
 ):
     """
     Delete all user data (GDPR compliance).
     
-    This will:
-    1. Delete all user messages
-    2. Delete all user threads
-    3. Delete all user facts
-    4. Delete user document
+    Queues a background job that deletes:
+    1. All user messages
+    2. All user threads
+    3. All user facts
+    4. The user document
+    5. The user's data export files
+    
+    Poll `/v1/privacy/deletions/{job_id}` for progress. A failed deletion
+    can be retried; it continues with whatever data is left.
     
     Note: This does NOT delete the Firebase Auth account.
     """
-    db = get_firestore_client()
-    
-    try:
-        # Delete all threads and their messages
-        threads_ref = db.collection("threads").where("userId", "==", user.uid)
-        threads = list(threads_ref.stream())
-        
-        for thread_doc in threads:
-            # Delete messages in thread
-            messages_ref = thread_doc.reference.collection("messages")
-            messages = list(messages_ref.stream())
-            for msg_doc in messages:
-                msg_doc.reference.delete()
-            
-            # Delete thread
-            thread_doc.reference.delete()
-        
-        # Delete all facts
-        facts_ref = db.collection("users").document(user.uid).collection("facts")
-        facts = list(facts_ref.stream())
-        for fact_doc in facts:
-            fact_doc.reference.delete()
-        
-        # Delete user document
-        db.collection("users").document(user.uid).delete()
-        
-        return {
-            "success": True,
-            "deleted": {
-                "threads": len(threads),
-                "facts": len(facts),
-            },
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to delete data: {str(e)}")
+    job = await get_deletion_service().enqueue_deletion(user)
+    return {"jobId": job.id, "status": job.status}
+
+
+@router.get("/deletions/{job_id}")
+async def get_deletion(
+    job_id: str,
+    user: AuthenticatedUser = Depends(get_current_user),
+):
+    """Get the status of a deletion job and the progress of the deletion."""
+    deletion_service = get_deletion_service()
+    job = await deletion_service.get_job(user, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Deletion not found")
+    return {
+        **job.to_response(),
+        "progress": await deletion_service.get_progress(user),
+    }
 
 
 @router.get("/export_data")
 async def export_user_data(
+    format: Literal["json", "ndjson"] = "json",
+    gzip: bool = False,
     user: AuthenticatedUser = Depends(get_current_user),
 ):
     """
     Export all user data (GDPR compliance).
     
-    Returns all user data in a structured format.
+    Streams the user document, threads with their messages, and facts,
+    either as one JSON document or as NDJSON records, optionally gzipped.
+    For very large accounts prefer `POST /v1/privacy/exports`.
     """
-    db = get_firestore_client()
+    chunks = get_export_service().stream(user, format, gzip)
     
     try:
-        # Get user document
-        user_doc = db.collection("users").document(user.uid).get()
-        user_data = user_doc.to_dict() if user_doc.exists else {}
-        
-        # Get all threads and messages
-        threads_data = []
-        threads_ref = db.collection("threads").where("userId", "==", user.uid)
-        threads = list(threads_ref.stream())
-        
-        for thread_doc in threads:
-            thread = thread_doc.to_dict()
-            
-            # Get messages
-            messages_ref = (
-                thread_doc.reference.collection("messages")
-                .order_by("seq")
-            )
-            messages = [msg.to_dict() for msg in messages_ref.stream()]
-            
-            threads_data.append({
-                **thread,
-                "messages": messages,
-            })
-        
-        # Get all facts
-        facts_ref = db.collection("users").document(user.uid).collection("facts")
-        facts = [fact.to_dict() for fact in facts_ref.stream()]
-        
-        return {
-            "user": user_data,
-            "threads": threads_data,
-            "facts": facts,
-        }
-        
+        # Fail with a status code if the export can't even start
+        first_chunk = await chunks.__anext__()
+    except StopAsyncIteration:
+        first_chunk = b""
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to export data: {str(e)}")
+    
+    async def body():
+        yield first_chunk
+        async for chunk in chunks:
+            yield chunk
+    
+    return _download_response(body(), format, gzip)
+
+
+@router.post("/exports", status_code=202)
+async def create_export(
+    format: Literal["json", "ndjson"] = "json",
+    gzip: bool = True,
+    user: AuthenticatedUser = Depends(get_current_user),
+):
+    """
+    Export all user data to a file in the background.
+    
+    Poll `/v1/privacy/exports/{job_id}` until the job has succeeded, then
+    fetch the file from `/v1/privacy/exports/{job_id}/download`.
+    """
+    job = await get_export_service().enqueue_export(user, format, gzip)
+    return {"jobId": job.id, "status": job.status}
+
+
+@router.get("/exports/{job_id}")
+async def get_export(
+    job_id: str,
+    user: AuthenticatedUser = Depends(get_current_user),
+):
+    """Get the status of an export job."""
+    job = await get_export_service().get_job(user, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Export not found")
+    return job.to_response()
+
+
+@router.get("/exports/{job_id}/download")
+async def download_export(
+    job_id: str,
+    user: AuthenticatedUser = Depends(get_current_user),
+):
+    """Download the file of a finished export job."""
+    export_service = get_export_service()
+    job = await export_service.get_job(user, job_id)
+    chunks = await export_service.open_download(user, job_id)
+    if job is None or chunks is None:
+        raise HTTPException(status_code=404, detail="Export not found or not finished")
+    return _download_response(chunks, job.result["format"], job.result["gzip"])
+
+
+def _download_response(chunks: AsyncIterator[bytes], format: str, gzip: bool) -> StreamingResponse:
+    filename = export_filename(format, gzip)
+    return StreamingResponse(
+        chunks,
+        media_type=export_media_type(format, gzip),
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
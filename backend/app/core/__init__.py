@@ -1,5 +1,11 @@
 from .config import get_settings, Settings
-from .firebase import init_firebase, get_firestore_client, verify_firebase_token
+from .firebase import (
+    init_firebase,
+    get_firestore_client,
+    get_async_firestore_client,
+    verify_firebase_token,
+)
+from .token_verifier import TokenVerifier, get_token_verifier
 from .auth import AuthenticatedUser, get_current_user, get_request_id
 
 __all__ = [
@@ -7,7 +13,10 @@ __all__ = [
     "Settings",
     "init_firebase",
     "get_firestore_client",
+    "get_async_firestore_client",
     "verify_firebase_token",
+    "TokenVerifier",
+    "get_token_verifier",
     "AuthenticatedUser",
     "get_current_user",
     "get_request_id",
@@ -2,7 +2,8 @@ from fastapi import Request, HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import Optional
 
-from .firebase import verify_firebase_token
+from .token_verifier import get_token_verifier
+from .tracing import span
 
 
 security = HTTPBearer()
@@ -36,7 +37,8 @@ async def get_current_user(
     """
     try:
         token = credentials.credentials
-        decoded_token = await verify_firebase_token(token)
+        with span("auth.verify_token"):
+            decoded_token = await get_token_verifier().verify(token)
         return AuthenticatedUser.from_token(decoded_token)
     except ValueError as e:
         raise HTTPException(
@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
-from typing import List
+from typing import Dict, List
 
 
 class Settings(BaseSettings):
@@ -16,6 +16,28 @@ class Settings(BaseSettings):
     openai_api_key: str = ""
     openai_model: str = "gpt-4o-mini"
     openai_vision_model: str = "gpt-4o-mini"
+    openai_embedding_model: str = "text-embedding-3-small"
+    openai_embedding_dimensions: int = 512
+    openai_max_connections: int = 100
+    openai_max_keepalive_connections: int = 20
+    openai_keepalive_expiry_seconds: float = 30
+    openai_http2: bool = True
+    openai_connect_timeout_seconds: float = 5
+    openai_read_timeout_seconds: float = 60  # max gap between streamed chunks
+    openai_write_timeout_seconds: float = 10
+    openai_pool_timeout_seconds: float = 10
+    openai_max_retries: int = 3
+    openai_retry_base_seconds: float = 0.5
+    openai_retry_max_seconds: float = 8
+    openai_max_concurrency: int = 64  # in-flight requests; halves on 429s
+    openai_min_concurrency: int = 4
+    
+    # LLM provider routing
+    # Extra OpenAI-compatible backends, as JSON:
+    # [{"name", "base_url", "api_key", "model", "vision_model"}]
+    llm_fallback_providers: List[Dict[str, str]] = []
+    llm_hedge_after_ms: int = 0  # race the next provider if the first token is slower; 0 disables
+    llm_provider_cooldown_seconds: int = 30
     
     # Database
     database_url: str = "postgresql+asyncpg://localhost:5432/amorae"
@@ -31,12 +53,93 @@ class Settings(BaseSettings):
     debug: bool = False
     environment: str = "development"  # development, staging, production
     
+    # Logging and tracing
+    log_level: str = "INFO"  # DEBUG adds per-request details
+    log_format: str = "text"  # text, json
+    tracing_exporter: str = "none"  # none, log, otlp
+    tracing_otlp_endpoint: str = "http://localhost:4318/v1/traces"
+    tracing_service_name: str = "amorae-backend"
+    metrics_enabled: bool = True  # Prometheus metrics on /metrics
+    
+    # Readiness checks
+    health_cache_seconds: float = 5  # probe results are reused this long
+    health_probe_timeout_seconds: float = 2
+    health_max_loop_lag_ms: float = 500  # not ready above this event loop lag; 0 disables
+    
     # Security
     allowed_origins: str = "http://localhost:3000"
     
+    # Auth
+    auth_token_cache_max_entries: int = 10000
+    auth_cert_refresh_seconds: int = 300
+    
     # Rate Limiting
     rate_limit_requests_per_minute: int = 60
     rate_limit_messages_per_day: int = 100
+    rate_limit_backend: str = "memory"  # memory, redis
+    
+    # User context cache (profile, preferences and active facts). The app
+    # edits profiles and facts directly in Firestore, so the TTL (shared by
+    # both tiers) bounds how long a prompt can use stale data
+    user_context_cache_ttl_seconds: int = 60
+    user_context_cache_max_entries: int = 10000
+    user_context_cache_redis_enabled: bool = False
+    
+    # LLM context window budgeting
+    llm_max_output_tokens: int = 1024
+    # Per-persona sampling, as JSON: {"sherlock": {"temperature": 0.6, "max_tokens": 512}}
+    llm_persona_policies: Dict[str, Dict[str, float]] = {}
+    llm_history_cache_threads: int = 1000  # threads whose converted history is kept
+    context_token_budget: int = 8000
+    context_facts_token_budget: int = 800
+    context_history_fetch_limit: int = 50
+    
+    # Rolling thread summaries
+    summary_trigger_messages: int = 20
+    summary_keep_recent_messages: int = 20
+    summary_max_fold_messages: int = 200
+    summary_max_tokens: int = 512
+    
+    # Idempotent request replay (X-Request-Id)
+    idempotency_ttl_seconds: int = 900
+    idempotency_max_entries: int = 10000
+    
+    # Streaming
+    stream_abandon_grace_seconds: float = 5  # cancel generations with no client for this long
+    stream_checkpoint_chars: int = 400
+    stream_checkpoint_seconds: float = 2.0
+    stream_stale_after_seconds: int = 300  # placeholders older than this are swept at startup
+    stream_coalesce_ms: int = 30  # 0 sends every model chunk as its own delta
+    stream_coalesce_chars: int = 64
+    stream_heartbeat_seconds: float = 15  # 0 disables
+    
+    # Background jobs
+    job_queue_backend: str = "memory"  # memory, redis
+    job_queue_workers: int = 4
+    job_timeout_seconds: int = 120
+    job_result_ttl_seconds: int = 86400
+    memory_auto_curate_every_messages: int = 0  # 0 disables
+    
+    # Privacy data exports
+    privacy_export_page_size: int = 500  # documents per Firestore query
+    privacy_export_store: str = "local"  # local, gcs
+    privacy_export_dir: str = "exports"
+    privacy_export_bucket: str = ""
+    privacy_export_timeout_seconds: int = 3600
+    privacy_export_retention_seconds: int = 86400  # export files are deleted after this
+    
+    # Account deletion
+    privacy_delete_concurrency: int = 8  # threads deleted at once
+    # unfinished deletions older than this resume at startup
+    privacy_delete_stale_after_seconds: int = 300
+    privacy_delete_timeout_seconds: int = 3600
+    
+    # Fact retrieval (pgvector, memory or none). Off by default: the memory
+    # index is per worker and starts empty, so every restart re-embeds each
+    # heavy user's facts; use pgvector in production to turn retrieval on
+    fact_index_backend: str = "none"
+    fact_retrieval_top_k: int = 12
+    fact_retrieval_importance_weight: float = 0.5
     
     @property
     def cors_origins(self) -> List[str]:
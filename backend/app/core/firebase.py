@@ -1,15 +1,17 @@
 import firebase_admin
-from firebase_admin import auth, credentials, firestore
+from firebase_admin import auth, credentials, firestore, firestore_async
 from google.cloud.firestore import AsyncClient
 from functools import lru_cache
 from typing import Optional
+import asyncio
 import os
 
 from .config import get_settings
 
 
 _firebase_app: Optional[firebase_admin.App] = None
-_firestore_client: Optional[AsyncClient] = None
+_firestore_client: Optional[firestore.Client] = None
+_async_firestore_client: Optional[AsyncClient] = None
 
 
 def init_firebase() -> firebase_admin.App:
@@ -47,9 +49,16 @@ async def verify_firebase_token(token: str) -> dict:
     """
     Verify Firebase ID token and return decoded claims.
     
+    Verification (RSA signature check and any certificate fetch) runs in a
+    worker thread so it does not block the event loop.
+    
     Raises:
         ValueError: If token is invalid
     """
+    return await asyncio.to_thread(_verify_id_token, token)
+
+
+def _verify_id_token(token: str) -> dict:
     try:
         # Ensure Firebase is initialized
         get_firebase_app()
@@ -73,3 +82,20 @@ def get_firestore_client():
         _firestore_client = firestore.client(database_id=database_id)
     
     return _firestore_client
+
+
+def get_async_firestore_client() -> AsyncClient:
+    """Get async Firestore client for the configured database.
+    
+    Request handlers should use this client so Firestore round trips do not
+    block the event loop.
+    """
+    global _async_firestore_client
+    
+    if _async_firestore_client is None:
+        get_firebase_app()
+        settings = get_settings()
+        database_id = settings.firebase_database_id or 'amorae'
+        _async_firestore_client = firestore_async.client(database_id=database_id)
+    
+    return _async_firestore_client
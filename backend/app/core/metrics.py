@@ -0,0 +1,271 @@
+import math
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from .tracing import Span
+
+# Latency buckets in seconds, from a cache hit to a long generation
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+    
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._render_samples())
+        return lines
+    
+    def _render_samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonic count, per label combination."""
+    
+    kind = "counter"
+    
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self.values: Dict[_LabelValues, float] = {}
+    
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+    
+    def _render_samples(self) -> Iterable[str]:
+        for label_values, value in self.values.items():
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    """Value that goes up and down, per label combination."""
+    
+    kind = "gauge"
+    
+    def dec(self, *label_values: str, amount: float = 1) -> None:
+        self.inc(*label_values, amount=-amount)
+    
+    def set(self, value: float, *label_values: str) -> None:
+        self.values[label_values] = value
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values over fixed buckets.
+    
+    Observing a value is a bisect and three additions; counts are only
+    made cumulative when rendered.
+    """
+    
+    kind = "histogram"
+    
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket..., count above the last bucket], sum
+        self.series: Dict[_LabelValues, Tuple[List[int], List[float]]] = {}
+    
+    def observe(self, value: float, *label_values: str) -> None:
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = ([0] * (len(self.buckets) + 1), [0.0])
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1][0] += value
+    
+    def _render_samples(self) -> Iterable[str]:
+        for label_values, (counts, total) in self.series.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                labels = _format_labels(self.labels, label_values, le)
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labels, label_values)
+            yield f"{self.name}_sum{labels} {_format_value(total[0])}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class MetricsRegistry:
+    """
+    Metrics exposed on `/metrics`.
+    
+    Metrics are plain dicts updated from the event loop thread, so
+    recording needs no locks. Collectors are called at scrape time to
+    turn component `stats()` into metrics.
+    """
+    
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+        self.collectors: List[Callable[[], Iterable[_Metric]]] = []
+    
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics[metric.name] = metric
+        return metric
+    
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+    
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labels))
+    
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+    
+    def add_collector(self, collector: Callable[[], Iterable[_Metric]]) -> None:
+        self.collectors.append(collector)
+    
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            for metric in collector():
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def stats_metrics(
+    prefix: str,
+    stats: Mapping,
+    gauges: Iterable[str] = (),
+    labels: Optional[Mapping[str, str]] = None,
+) -> List[_Metric]:
+    """
+    Metrics for a component's `stats()` dict.
+    
+    Numeric values become `<prefix>_<key>_total` counters, or
+    `<prefix>_<key>` gauges for the keys in `gauges`.
+    """
+    gauges = set(gauges)
+    label_names = tuple(labels or ())
+    label_values = tuple((labels or {}).values())
+    metrics: List[_Metric] = []
+    for key, value in stats.items():
+        if isinstance(value, bool):
+            value = int(value)
+        if not isinstance(value, (int, float)):
+            continue
+        if key in gauges:
+            metric = Gauge(f"{prefix}_{key}", f"{prefix} {key}", label_names)
+        else:
+            metric = Counter(f"{prefix}_{key}_total", f"{prefix} {key}", label_names)
+        metric.values[label_values] = value
+        metrics.append(metric)
+    return metrics
+
+
+# Default registry and the metrics recorded by the app
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "amorae_http_requests_total",
+    "HTTP requests by route and status",
+    ("method", "route", "status"),
+)
+HTTP_DURATION = REGISTRY.histogram(
+    "amorae_http_request_duration_seconds",
+    "HTTP request duration, including streamed bodies",
+    ("method", "route"),
+)
+FIRESTORE_DURATION = REGISTRY.histogram(
+    "amorae_firestore_operation_duration_seconds",
+    "Firestore operation latency by collection",
+    ("operation", "collection"),
+)
+FIRESTORE_ERRORS = REGISTRY.counter(
+    "amorae_firestore_errors_total",
+    "Failed Firestore operations by collection",
+    ("operation", "collection"),
+)
+LLM_TOKENS = REGISTRY.counter(
+    "amorae_llm_tokens_total",
+    "Tokens reported by the LLM API, by model and direction (in, out)",
+    ("model", "direction"),
+)
+LLM_FIRST_TOKEN = REGISTRY.histogram(
+    "amorae_llm_time_to_first_token_seconds",
+    "Time from sending a streamed request to its first token",
+    ("model",),
+)
+LLM_DURATION = REGISTRY.histogram(
+    "amorae_llm_generation_duration_seconds",
+    "Chat generation duration",
+    ("model",),
+)
+LLM_QUEUE_WAIT = REGISTRY.histogram(
+    "amorae_llm_queue_wait_seconds",
+    "Time LLM requests waited for a concurrency slot",
+)
+ACTIVE_STREAMS = REGISTRY.gauge(
+    "amorae_sse_active_streams",
+    "SSE responses currently being sent",
+)
+
+
+class MetricsSpanExporter:
+    """Records request, Firestore and LLM metrics from finished spans."""
+    
+    def export(self, span: Span) -> None:
+        attributes = span.attributes
+        name = span.name
+        seconds = span.duration_ms / 1000
+        if name == "http.request":
+            method = attributes.get("http.method", "")
+            # Unmatched paths are not used as labels, to bound cardinality
+            route = attributes.get("http.route", "unmatched")
+            HTTP_REQUESTS.inc(method, route, str(attributes.get("http.status_code", 500)))
+            HTTP_DURATION.observe(seconds, method, route)
+        elif name.startswith("firestore."):
+            operation = name[len("firestore."):]
+            collection = attributes.get("collection", "")
+            FIRESTORE_DURATION.observe(seconds, operation, collection)
+            if span.error is not None:
+                FIRESTORE_ERRORS.inc(operation, collection)
+        elif name in ("llm.generate", "llm.generate_stream"):
+            model = attributes.get("llm.model", "unknown")
+            LLM_TOKENS.inc(model, "in", amount=attributes.get("llm.prompt_tokens", 0))
+            LLM_TOKENS.inc(model, "out", amount=attributes.get("llm.completion_tokens", 0))
+            LLM_DURATION.observe(seconds, model)
+            first_token_ms = attributes.get("llm.time_to_first_token_ms")
+            if first_token_ms is not None:
+                LLM_FIRST_TOKEN.observe(first_token_ms / 1000, model)
+    
+    async def close(self) -> None:
+        pass
@@ -0,0 +1,266 @@
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from fastapi import Depends, HTTPException
+
+from .auth import AuthenticatedUser, get_current_user, get_request_id
+from .config import get_settings
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+# Upper bound on users tracked by the in-memory backend (LRU)
+_MAX_TRACKED_KEYS = 100000
+
+_DAY_SECONDS = 24 * 60 * 60
+
+_TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(retry_after)
+"""
+
+_SLIDING_WINDOW_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+if redis.call('ZSCORE', KEYS[1], ARGV[3]) then
+    return '0'
+end
+if redis.call('ZCARD', KEYS[1]) < limit then
+    redis.call('ZADD', KEYS[1], now, ARGV[3])
+    redis.call('EXPIRE', KEYS[1], math.ceil(window))
+    return '0'
+end
+local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+return tostring(tonumber(oldest[2]) + window - now)
+"""
+
+
+class InMemoryRateLimiter:
+    """Rate limit state in this process; limits apply per worker."""
+    
+    def __init__(self):
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        # key -> event id -> time, oldest first
+        self._windows: "OrderedDict[str, OrderedDict[str, float]]" = OrderedDict()
+    
+    async def take_token(self, key: str, capacity: int, per_seconds: float) -> float:
+        rate = capacity / per_seconds
+        now = time.monotonic()
+        tokens, last = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - last) * rate)
+        retry_after = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry_after = (1 - tokens) / rate
+        self._remember(self._buckets, key, (tokens, now))
+        return retry_after
+    
+    async def record_in_window(
+        self, key: str, limit: int, window_seconds: float, event_id: str
+    ) -> float:
+        now = time.time()
+        events = self._windows.get(key) or OrderedDict()
+        while events and next(iter(events.values())) <= now - window_seconds:
+            events.popitem(last=False)
+        retry_after = 0.0
+        # An event already in the window is not counted again
+        if event_id not in events:
+            if len(events) < limit:
+                events[event_id] = now
+            else:
+                retry_after = next(iter(events.values())) + window_seconds - now
+        self._remember(self._windows, key, events)
+        return retry_after
+    
+    @staticmethod
+    def _remember(entries: OrderedDict, key: str, value) -> None:
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > _MAX_TRACKED_KEYS:
+            entries.popitem(last=False)
+
+
+class RedisRateLimiter:
+    """Rate limit state in Redis, shared by all workers and instances."""
+    
+    def __init__(self):
+        self._token_bucket = None
+        self._sliding_window = None
+    
+    async def take_token(self, key: str, capacity: int, per_seconds: float) -> float:
+        redis = get_redis()
+        if self._token_bucket is None:
+            self._token_bucket = redis.register_script(_TOKEN_BUCKET_SCRIPT)
+        retry_after = await self._token_bucket(
+            keys=[f"ratelimit:bucket:{key}"],
+            args=[capacity, capacity / per_seconds],
+            client=redis,
+        )
+        return float(retry_after)
+    
+    async def record_in_window(
+        self, key: str, limit: int, window_seconds: float, event_id: str
+    ) -> float:
+        redis = get_redis()
+        if self._sliding_window is None:
+            self._sliding_window = redis.register_script(_SLIDING_WINDOW_SCRIPT)
+        retry_after = await self._sliding_window(
+            keys=[f"ratelimit:window:{key}"],
+            args=[limit, window_seconds, event_id],
+            client=redis,
+        )
+        return float(retry_after)
+
+
+class RateLimiter:
+    """
+    Per-user request rate and daily message quota.
+    
+    Requests are limited with a token bucket that refills
+    `requests_per_minute` tokens per minute, so short bursts are allowed
+    but sustained load is capped. Messages are counted over a sliding
+    24-hour window. A limit of 0 disables it. If the backend is
+    unavailable the request is let through rather than failed.
+    """
+    
+    def __init__(self, backend, requests_per_minute: int, messages_per_day: int):
+        self.backend = backend
+        self.requests_per_minute = requests_per_minute
+        self.messages_per_day = messages_per_day
+        self._stats = {
+            "allowed": 0,
+            "limited_requests": 0,
+            "limited_messages": 0,
+            "backend_errors": 0,
+        }
+    
+    async def check_request(self, uid: str) -> float:
+        """Spend one request token; returns seconds to wait if none are left."""
+        if self.requests_per_minute <= 0:
+            return 0.0
+        retry_after = await self._call(
+            self.backend.take_token, f"requests:{uid}", self.requests_per_minute, 60
+        )
+        self._count(retry_after, "limited_requests")
+        return retry_after
+    
+    async def check_message(self, uid: str, request_id: str) -> float:
+        """
+        Count one message against the daily quota; returns seconds to wait if exhausted.
+        
+        Messages are counted by request id, so retries of a request are free.
+        """
+        if self.messages_per_day <= 0:
+            return 0.0
+        retry_after = await self._call(
+            self.backend.record_in_window,
+            f"messages:{uid}",
+            self.messages_per_day,
+            _DAY_SECONDS,
+            request_id,
+        )
+        self._count(retry_after, "limited_messages")
+        return retry_after
+    
+    def stats(self) -> Dict:
+        """Allowed and limited counters."""
+        return dict(self._stats)
+    
+    async def _call(self, method, *args) -> float:
+        try:
+            return await method(*args)
+        except Exception as e:
+            self._stats["backend_errors"] += 1
+            logger.warning("⚠️ Rate limiter unavailable, allowing request: %s", e)
+            return 0.0
+    
+    def _count(self, retry_after: float, limited_stat: str) -> None:
+        if retry_after > 0:
+            self._stats[limited_stat] += 1
+        else:
+            self._stats["allowed"] += 1
+
+
+def _too_many_requests(detail: str, retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+async def enforce_rate_limit(
+    user: AuthenticatedUser = Depends(get_current_user),
+) -> AuthenticatedUser:
+    """
+    Dependency that limits requests per user per minute.
+    
+    Raises:
+        HTTPException: 429 with Retry-After if the user is over the limit
+    """
+    retry_after = await get_rate_limiter().check_request(user.uid)
+    if retry_after > 0:
+        raise _too_many_requests("Rate limit exceeded", retry_after)
+    return user
+
+
+async def enforce_message_quota(
+    user: AuthenticatedUser = Depends(enforce_rate_limit),
+    request_id: str = Depends(get_request_id),
+) -> AuthenticatedUser:
+    """
+    Dependency that enforces the daily message quota (and the request rate).
+    
+    A retry with the same X-Request-Id is not counted again.
+    
+    Raises:
+        HTTPException: 429 with Retry-After if the user is over either limit
+    """
+    retry_after = await get_rate_limiter().check_message(user.uid, request_id)
+    if retry_after > 0:
+        raise _too_many_requests("Daily message limit reached", retry_after)
+    return user
+
+
+# Singleton
+_rate_limiter: Optional[RateLimiter] = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Get rate limiter singleton."""
+    global _rate_limiter
+    if _rate_limiter is None:
+        settings = get_settings()
+        if settings.rate_limit_backend == "redis":
+            backend = RedisRateLimiter()
+        else:
+            backend = InMemoryRateLimiter()
+        _rate_limiter = RateLimiter(
+            backend,
+            requests_per_minute=settings.rate_limit_requests_per_minute,
+            messages_per_day=settings.rate_limit_messages_per_day,
+        )
+    return _rate_limiter
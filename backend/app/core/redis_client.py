@@ -0,0 +1,27 @@
+from typing import Optional
+
+from redis.asyncio import Redis
+
+from .config import get_settings
+
+_redis_client: Optional[Redis] = None
+
+
+def get_redis() -> Redis:
+    """Get shared async Redis client for the configured `redis_url`."""
+    global _redis_client
+    
+    if _redis_client is None:
+        settings = get_settings()
+        _redis_client = Redis.from_url(settings.redis_url, decode_responses=True)
+    
+    return _redis_client
+
+
+async def close_redis() -> None:
+    """Close the shared Redis client if it was created."""
+    global _redis_client
+    
+    if _redis_client is not None:
+        await _redis_client.aclose()
+        _redis_client = None
@@ -0,0 +1,140 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from firebase_admin import auth
+from firebase_admin._token_gen import ID_TOKEN_CERT_URI
+
+from .config import get_settings
+from .firebase import get_firebase_app, verify_firebase_token
+
+logger = logging.getLogger(__name__)
+
+
+# Cached claims are dropped this long before the token's `exp`
+_EXPIRY_MARGIN_SECONDS = 5
+
+
+class TokenVerifier:
+    """
+    Cached Firebase ID token verification.
+    
+    Decoded claims are cached by token hash until shortly before the
+    token's `exp`, in a bounded LRU map, so repeat requests with the same
+    token skip RSA verification entirely. Cold verifications run in a
+    worker thread, and concurrent requests with the same cold token share
+    one verification. A background task keeps the SDK's cached Google
+    signing certificates fresh so requests rarely pay for a fetch.
+    """
+    
+    def __init__(self, max_entries: int = 10000, cert_refresh_seconds: int = 300):
+        self.max_entries = max_entries
+        self.cert_refresh_seconds = cert_refresh_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._warm_task: Optional[asyncio.Task] = None
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "failures": 0,
+            "evictions": 0,
+            "cert_refreshes": 0,
+        }
+    
+    async def verify(self, token: str) -> dict:
+        """
+        Verify a token and return its decoded claims.
+        
+        Raises:
+            ValueError: If token is invalid
+        """
+        key = hashlib.sha256(token.encode()).hexdigest()
+        
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, claims = entry
+            if expires_at > time.time():
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return claims
+            del self._entries[key]
+        
+        pending = self._pending.get(key)
+        if pending is None:
+            self._stats["misses"] += 1
+            pending = asyncio.ensure_future(verify_firebase_token(token))
+            self._pending[key] = pending
+            pending.add_done_callback(lambda future: self._finish(key, future))
+        else:
+            self._stats["coalesced"] += 1
+        return await asyncio.shield(pending)
+    
+    def _finish(self, key: str, future: asyncio.Future) -> None:
+        self._pending.pop(key, None)
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            self._stats["failures"] += 1
+            return
+        
+        claims = future.result()
+        expires_at = claims.get("exp", 0) - _EXPIRY_MARGIN_SECONDS
+        if expires_at <= time.time():
+            return
+        self._entries[key] = (expires_at, claims)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+    
+    def stats(self) -> Dict:
+        """Hit/miss counters and current size."""
+        return {**self._stats, "size": len(self._entries)}
+    
+    def start(self) -> None:
+        """Start refreshing signing certificates in the background."""
+        if self._warm_task is None:
+            self._warm_task = asyncio.ensure_future(self._keep_certs_warm())
+    
+    async def stop(self) -> None:
+        task, self._warm_task = self._warm_task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+    
+    async def _keep_certs_warm(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self._fetch_certs)
+                self._stats["cert_refreshes"] += 1
+            except Exception as e:
+                logger.warning("⚠️ Failed to refresh Firebase signing certificates: %s", e)
+            await asyncio.sleep(self.cert_refresh_seconds)
+    
+    @staticmethod
+    def _fetch_certs() -> None:
+        # Goes through the SDK's HTTP-cached transport, so this only hits
+        # the network once the cached certificates have expired
+        client = auth._get_client(get_firebase_app())
+        request = client._token_verifier.request
+        request(ID_TOKEN_CERT_URI, method="GET")
+
+
+# Singleton
+_token_verifier: Optional[TokenVerifier] = None
+
+
+def get_token_verifier() -> TokenVerifier:
+    """Get token verifier singleton."""
+    global _token_verifier
+    if _token_verifier is None:
+        settings = get_settings()
+        _token_verifier = TokenVerifier(
+            max_entries=settings.auth_token_cache_max_entries,
+            cert_refresh_seconds=settings.auth_cert_refresh_seconds,
+        )
+    return _token_verifier
@@ -0,0 +1,387 @@
+import asyncio
+import functools
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterator, List, Optional, TypeVar
+
+import httpx
+
+from .config import get_settings
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    """One timed operation of a trace, with its attributes."""
+    
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "start_ns",
+        "end_ns",
+        "attributes",
+        "error",
+    )
+    
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str],
+        attributes: Dict[str, Any],
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.error: Optional[str] = None
+    
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+    
+    @property
+    def duration_ms(self) -> float:
+        end_ns = self.end_ns or time.time_ns()
+        return (end_ns - self.start_ns) / 1e6
+    
+    def end(self, error: Optional[BaseException] = None) -> None:
+        """Finish the span and hand it to the exporters."""
+        if self.end_ns:
+            return
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        get_tracer().export(self)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentId": self.parent_id,
+            "durationMs": round(self.duration_ms, 2),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def start_span(name: str, parent: Optional[Span] = None, **attributes: Any) -> Span:
+    """
+    Start a span without making it current; call `end()` when done.
+    
+    Used for operations that cross `yield`s, where the current span would
+    leak into the consumer of a generator.
+    """
+    parent = parent or _current_span.get()
+    if parent is None:
+        return Span(name, os.urandom(16).hex(), None, attributes)
+    return Span(name, parent.trace_id, parent.span_id, attributes)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """Time the block as a child of the current span."""
+    current = start_span(name, **attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.end(error=e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def traced(
+    name: str,
+    **attributes: Any,
+) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    """Decorator that runs a coroutine function in a span."""
+    def decorator(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs) -> T:
+            with span(name, **attributes):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Span]:
+    """The remote parent from a W3C `traceparent` header, if it is valid."""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    remote = Span("remote", parts[1], None, {})
+    remote.span_id = parts[2]
+    return remote
+
+
+# Exporters
+
+
+class LogSpanExporter:
+    """Writes finished spans to the `app.traces` logger at DEBUG level."""
+    
+    def __init__(self):
+        self.logger = logging.getLogger("app.traces")
+    
+    def export(self, span: Span) -> None:
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(
+                "span %s %.1fms", span.name, span.duration_ms, extra={"span": span.to_dict()}
+            )
+    
+    async def close(self) -> None:
+        pass
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OTLPSpanExporter:
+    """
+    Sends spans to an OpenTelemetry collector over OTLP/HTTP (JSON).
+    
+    Spans are queued in memory (dropping the oldest past `max_queue`) and
+    posted in batches by a background task, so recording a span never
+    waits on the network.
+    """
+    
+    def __init__(
+        self,
+        endpoint: str,
+        service_name: str,
+        batch_size: int = 512,
+        flush_seconds: float = 5,
+        max_queue: int = 10000,
+    ):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.dropped = 0
+        self._queue: Deque[Span] = deque(maxlen=max_queue)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    def export(self, span: Span) -> None:
+        if len(self._queue) == self._queue.maxlen:
+            self.dropped += 1
+        self._queue.append(span)
+        if self._task is None:
+            self._client = httpx.AsyncClient(timeout=10)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+    
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            await self.flush()
+    
+    async def flush(self) -> None:
+        while self._queue:
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            try:
+                response = await self._client.post(self.endpoint, json=self._payload(batch))
+                response.raise_for_status()
+            except Exception as e:
+                logger.warning("⚠️ Failed to export %d spans: %s", len(batch), e)
+                return
+    
+    def _payload(self, spans: List[Span]) -> Dict[str, Any]:
+        return {"resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": self.service_name}},
+            ]},
+            "scopeSpans": [{
+                "scope": {"name": "amorae"},
+                "spans": [
+                    {
+                        "traceId": s.trace_id,
+                        "spanId": s.span_id,
+                        "parentSpanId": s.parent_id or "",
+                        "name": s.name,
+                        "kind": 2 if s.name == "http.request" else 1,  # server, internal
+                        "startTimeUnixNano": str(s.start_ns),
+                        "endTimeUnixNano": str(s.end_ns),
+                        "attributes": [
+                            {"key": key, "value": _otlp_value(value)}
+                            for key, value in s.attributes.items()
+                            if value is not None
+                        ],
+                        "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+                    }
+                    for s in spans
+                ],
+            }],
+        }]}
+    
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            await self.flush()
+            await self._client.aclose()
+            self._task = None
+
+
+class Tracer:
+    """Hands finished spans to the configured exporters."""
+    
+    def __init__(self, exporters: Optional[List] = None):
+        self.exporters = list(exporters or [])
+    
+    def add_exporter(self, exporter) -> None:
+        self.exporters.append(exporter)
+    
+    def export(self, span: Span) -> None:
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception as e:
+                logger.warning("⚠️ Span exporter %s failed: %s", type(exporter).__name__, e)
+    
+    async def close(self) -> None:
+        for exporter in self.exporters:
+            await exporter.close()
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware that runs each HTTP request in a root span.
+    
+    Continues the caller's trace when a `traceparent` header is sent.
+    Streamed responses are timed until their last byte.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        headers = dict(scope.get("headers") or [])
+        parent = parse_traceparent(headers.get(b"traceparent", b"").decode("latin-1"))
+        request_span = start_span(
+            "http.request",
+            parent=parent,
+            **{"http.method": scope["method"], "http.target": scope["path"]},
+        )
+        
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                request_span.set("http.status_code", message["status"])
+            await send(message)
+        
+        token = _current_span.set(request_span)
+        try:
+            await self.app(scope, receive, send_with_status)
+        except BaseException as e:
+            request_span.end(error=e)
+            raise
+        finally:
+            _current_span.reset(token)
+            route = scope.get("route")
+            if route is not None:
+                request_span.set("http.route", route.path)
+            request_span.end()
+
+
+# Logging
+
+
+class JSONLogFormatter(logging.Formatter):
+    """One JSON object per record, with the current trace and span ids."""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        current = _current_span.get()
+        if current is not None:
+            entry["traceId"] = current.trace_id
+            entry["spanId"] = current.span_id
+        span_data = getattr(record, "span", None)
+        if span_data is not None:
+            entry["span"] = span_data
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def configure_logging(level: str = "INFO", format: str = "text") -> None:
+    """
+    Send the `app` loggers to stdout at `level`.
+    
+    Records below the level are dropped before their message is
+    formatted, so DEBUG detail costs nothing in production.
+    """
+    handler = logging.StreamHandler(sys.stdout)
+    if format == "json":
+        handler.setFormatter(JSONLogFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(message)s"))
+    
+    app_logger = logging.getLogger("app")
+    app_logger.handlers = [handler]
+    app_logger.setLevel(level.upper())
+    app_logger.propagate = False
+
+
+# Singleton
+_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Tracer:
+    """Get tracer singleton."""
+    global _tracer
+    if _tracer is None:
+        settings = get_settings()
+        exporters = []
+        if settings.tracing_exporter == "log":
+            exporters.append(LogSpanExporter())
+        elif settings.tracing_exporter == "otlp":
+            exporters.append(OTLPSpanExporter(
+                settings.tracing_otlp_endpoint,
+                settings.tracing_service_name,
+            ))
+        if settings.metrics_enabled:
+            # Request, Firestore and LLM metrics are recorded from spans
+            from .metrics import MetricsSpanExporter
+            exporters.append(MetricsSpanExporter())
+        _tracer = Tracer(exporters)
+    return _tracer
@@ -1,10 +1,28 @@
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import asyncio
+import logging
 
 from .core.config import get_settings
 from .core.firebase import init_firebase
-from .api import chat, memory, privacy
+from .core.redis_client import close_redis
+from .core.token_verifier import get_token_verifier
+from .core.tracing import TracingMiddleware, configure_logging, get_tracer
+from .api import chat, memory, metrics, privacy
+from .services.account_deletion import get_deletion_service
+from .services.data_export import get_export_service
+from .services.fact_index import get_fact_retriever
+from .services.health import get_health_checker
+from .services.job_queue import get_job_queue
+from .services.llm_service import get_llm_service
+from .services.memory_service import get_memory_service
+from .services.stream_checkpoint import sweep_interrupted_streams
+from .services.token_budget import warm_tokenizer
+
+
+logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
@@ -12,14 +30,45 @@ async def lifespan(app: FastAPI):
     """Application lifespan handler."""
     # Startup
     init_firebase()
+    get_token_verifier().start()
+    get_health_checker().start()
+    await asyncio.to_thread(warm_tokenizer, get_settings().openai_model)
+    get_memory_service()  # registers its job handlers
+    get_export_service().start()
+    get_deletion_service()
+    get_job_queue().start()
+    sweep = asyncio.ensure_future(sweep_interrupted_streams())
+    sweep.add_done_callback(_report_sweep_failure)
+    resume = asyncio.ensure_future(get_deletion_service().resume_interrupted_deletions())
+    resume.add_done_callback(_report_resume_failure)
     yield
     # Shutdown
-    pass
+    await get_token_verifier().stop()
+    await get_health_checker().stop()
+    await get_export_service().stop()
+    await get_job_queue().stop()
+    fact_retriever = get_fact_retriever()
+    if fact_retriever is not None:
+        await fact_retriever.close()
+    await get_llm_service().close()
+    await close_redis()
+    await get_tracer().close()
+
+
+def _report_sweep_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("⚠️ Failed to sweep interrupted streams: %s", task.exception())
+
+
+def _report_resume_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("⚠️ Failed to resume interrupted account deletions: %s", task.exception())
 
 
 def create_app() -> FastAPI:
     """Create and configure the FastAPI application."""
     settings = get_settings()
+    configure_logging(settings.log_level, settings.log_format)
     
     app = FastAPI(
         title="Amorae API",
@@ -37,16 +86,37 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
     
+    # Request spans; outermost, so they cover CORS handling too
+    app.add_middleware(TracingMiddleware)
+    
     # Health check
     @app.get("/health")
     async def health_check():
         return {"status": "healthy", "version": "1.0.0"}
     
+    # Liveness: the process is up and serving requests
+    @app.get("/live")
+    async def liveness_check():
+        return {"status": "alive"}
+    
+    # Readiness: dependencies are reachable and the event loop keeps up
+    @app.get("/ready")
+    async def readiness_check():
+        readiness = await get_health_checker().readiness()
+        ready = readiness.pop("ready")
+        return JSONResponse(
+            {"status": "ready" if ready else "not_ready", **readiness},
+            status_code=200 if ready else 503,
+        )
+    
     # Include routers
     app.include_router(chat.router)
     app.include_router(memory.router)
     app.include_router(privacy.router)
     
+    if settings.metrics_enabled:
+        app.include_router(metrics.router)
+    
     return app
 
 
@@ -0,0 +1,6 @@
+from .firestore_repository import FirestoreRepository, get_repository
+
+__all__ = [
+    "FirestoreRepository",
+    "get_repository",
+]
@@ -0,0 +1,341 @@
+from typing import AsyncIterator, Dict, List, Optional
+
+from google.cloud import firestore
+from google.cloud.firestore import (
+    AsyncClient,
+    AsyncCollectionReference,
+    AsyncDocumentReference,
+    AsyncTransaction,
+    AsyncWriteBatch,
+    DocumentSnapshot,
+    async_transactional,
+)
+
+from ..core.firebase import get_async_firestore_client
+from ..core.tracing import span, traced
+from ..models.schemas import Fact
+
+# Firestore limit on writes in one batch
+MAX_BATCH_WRITES = 500
+
+
+class FirestoreRepository:
+    """
+    Async data access layer over Firestore.
+    
+    All reads and writes go through the async client, so a slow round trip
+    only suspends the calling request instead of the whole event loop.
+    """
+    
+    def __init__(self, db: Optional[AsyncClient] = None):
+        self.db = db or get_async_firestore_client()
+    
+    # References
+    
+    def batch(self) -> AsyncWriteBatch:
+        return self.db.batch()
+    
+    def thread_ref(self, thread_id: str) -> AsyncDocumentReference:
+        return self.db.collection("threads").document(thread_id)
+    
+    def messages_ref(self, thread_id: str) -> AsyncCollectionReference:
+        return self.thread_ref(thread_id).collection("messages")
+    
+    def user_ref(self, uid: str) -> AsyncDocumentReference:
+        return self.db.collection("users").document(uid)
+    
+    def facts_ref(self, uid: str) -> AsyncCollectionReference:
+        return self.user_ref(uid).collection("facts")
+    
+    def deletion_ref(self, uid: str) -> AsyncDocumentReference:
+        return self.db.collection("deletions").document(uid)
+    
+    # Health
+    
+    @traced("firestore.ping", collection="health")
+    async def ping(self) -> None:
+        """One cheap round trip, to check the database is reachable."""
+        await self.db.collection("health").document("ping").get()
+    
+    # Threads
+    
+    @traced("firestore.get_thread", collection="threads")
+    async def get_thread(self, thread_id: str) -> Optional[Dict]:
+        """Get thread data, or None if the thread does not exist."""
+        thread_doc = await self.thread_ref(thread_id).get()
+        if not thread_doc.exists:
+            return None
+        return thread_doc.to_dict()
+    
+    @traced("firestore.update_thread", collection="threads")
+    async def update_thread(self, thread_id: str, data: Dict) -> None:
+        await self.thread_ref(thread_id).update(data)
+    
+    @traced("firestore.compare_and_set_summary", collection="threads")
+    async def compare_and_set_summary(
+        self,
+        thread_id: str,
+        expected_to_seq: int,
+        summary: Dict,
+    ) -> bool:
+        """
+        Atomically replace the thread summary if it still ends at `expected_to_seq`.
+        
+        Returns False when another writer advanced the summary first.
+        """
+        thread_ref = self.thread_ref(thread_id)
+        
+        @async_transactional
+        async def apply(transaction: AsyncTransaction) -> bool:
+            snapshot = await thread_ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return False
+            current = (snapshot.to_dict() or {}).get("summary") or {}
+            if current.get("toSeq", 0) != expected_to_seq:
+                return False
+            transaction.update(thread_ref, {"summary": summary})
+            return True
+        
+        return await apply(self.db.transaction())
+    
+    @traced("firestore.delete_thread", collection="threads")
+    async def delete_thread(self, thread_id: str) -> None:
+        await self.thread_ref(thread_id).delete()
+    
+    async def stream_user_threads(
+        self,
+        uid: str,
+        page_size: int = 0,
+    ) -> AsyncIterator[DocumentSnapshot]:
+        """Stream all threads owned by a user, in pages of `page_size` if given."""
+        query = self.db.collection("threads").where("userId", "==", uid)
+        if page_size:
+            query = query.order_by("__name__")
+        async for thread_doc in self._stream(query, page_size):
+            yield thread_doc
+    
+    # Messages
+    
+    @traced("firestore.get_recent_messages", collection="messages")
+    async def get_recent_messages(self, thread_id: str, limit: int) -> List[Dict]:
+        """Get the last `limit` messages of a thread, oldest first."""
+        query = (
+            self.messages_ref(thread_id)
+            .order_by("seq", direction=firestore.Query.DESCENDING)
+            .limit(limit)
+        )
+        messages = [doc.to_dict() async for doc in query.stream()]
+        messages.reverse()
+        return messages
+    
+    @traced("firestore.get_messages_in_range", collection="messages")
+    async def get_messages_in_range(
+        self,
+        thread_id: str,
+        from_seq: int,
+        to_seq: int,
+    ) -> List[Dict]:
+        """Get messages with `from_seq <= seq <= to_seq`, ordered by seq."""
+        query = (
+            self.messages_ref(thread_id)
+            .where("seq", ">=", from_seq)
+            .where("seq", "<=", to_seq)
+            .order_by("seq")
+        )
+        return [doc.to_dict() async for doc in query.stream()]
+    
+    async def stream_messages(
+        self,
+        thread_id: str,
+        page_size: int = 0,
+    ) -> AsyncIterator[DocumentSnapshot]:
+        """Stream all messages of a thread ordered by seq, in pages of `page_size` if given."""
+        query = self.messages_ref(thread_id).order_by("seq")
+        async for msg_doc in self._stream(query, page_size):
+            yield msg_doc
+    
+    async def stream_messages_with_status(self, status: str) -> AsyncIterator[DocumentSnapshot]:
+        """
+        Stream messages of all threads whose `streamState.status` is `status`.
+        
+        Needs the collection group index on `streamState.status` declared in
+        firestore.indexes.json.
+        """
+        query = self.db.collection_group("messages").where("streamState.status", "==", status)
+        async for msg_doc in query.stream():
+            yield msg_doc
+    
+    @traced("firestore.get_message", collection="messages")
+    async def get_message(self, thread_id: str, message_id: str) -> Optional[Dict]:
+        msg_doc = await self.messages_ref(thread_id).document(message_id).get()
+        return msg_doc.to_dict() if msg_doc.exists else None
+    
+    @traced("firestore.set_message", collection="messages")
+    async def set_message(self, thread_id: str, message_id: str, data: Dict) -> None:
+        await self.messages_ref(thread_id).document(message_id).set(data)
+    
+    @traced("firestore.update_message", collection="messages")
+    async def update_message(self, thread_id: str, message_id: str, data: Dict) -> None:
+        await self.messages_ref(thread_id).document(message_id).update(data)
+    
+    # Users
+    
+    @traced("firestore.get_user", collection="users")
+    async def get_user(self, uid: str) -> Dict:
+        """Get user data, or an empty dict if the user has no document."""
+        user_doc = await self.user_ref(uid).get()
+        return user_doc.to_dict() if user_doc.exists else {}
+    
+    @traced("firestore.delete_user", collection="users")
+    async def delete_user(self, uid: str) -> None:
+        await self.user_ref(uid).delete()
+    
+    # Facts
+    
+    @staticmethod
+    def _to_fact(fact_doc: DocumentSnapshot) -> Fact:
+        # Curated fact documents also store their own id
+        return Fact(**{**fact_doc.to_dict(), "id": fact_doc.id})
+    
+    @traced("firestore.get_active_facts", collection="facts")
+    async def get_active_facts(self, uid: str) -> List[Fact]:
+        query = self.facts_ref(uid).where("status", "==", "active")
+        return [self._to_fact(doc) async for doc in query.stream()]
+    
+    @traced("firestore.get_all_facts", collection="facts")
+    async def get_all_facts(self, uid: str) -> List[Fact]:
+        return [self._to_fact(doc) async for doc in self.facts_ref(uid).stream()]
+    
+    @traced("firestore.get_active_facts_by_importance", collection="facts")
+    async def get_active_facts_by_importance(self, uid: str) -> List[Dict]:
+        query = (
+            self.facts_ref(uid)
+            .where("status", "==", "active")
+            .order_by("importance", direction=firestore.Query.DESCENDING)
+        )
+        return [{"id": doc.id, **doc.to_dict()} async for doc in query.stream()]
+    
+    @traced("firestore.get_fact", collection="facts")
+    async def get_fact(self, uid: str, fact_id: str) -> Optional[Dict]:
+        fact_doc = await self.facts_ref(uid).document(fact_id).get()
+        if not fact_doc.exists:
+            return None
+        return fact_doc.to_dict()
+    
+    @traced("firestore.set_fact", collection="facts")
+    async def set_fact(self, uid: str, fact_id: str, data: Dict) -> None:
+        await self.facts_ref(uid).document(fact_id).set(data)
+    
+    @traced("firestore.update_fact", collection="facts")
+    async def update_fact(self, uid: str, fact_id: str, data: Dict) -> None:
+        await self.facts_ref(uid).document(fact_id).update(data)
+    
+    @traced("firestore.write_facts", collection="facts")
+    async def write_facts(
+        self,
+        uid: str,
+        creates: Dict[str, Dict],
+        updates: Dict[str, Dict],
+    ) -> None:
+        """Create and update facts in as few batched commits as possible."""
+        facts_ref = self.facts_ref(uid)
+        writes = [("set", fact_id, data) for fact_id, data in creates.items()]
+        writes += [("update", fact_id, data) for fact_id, data in updates.items()]
+        
+        for start in range(0, len(writes), MAX_BATCH_WRITES):
+            batch = self.batch()
+            for op, fact_id, data in writes[start:start + MAX_BATCH_WRITES]:
+                if op == "set":
+                    batch.set(facts_ref.document(fact_id), data)
+                else:
+                    batch.update(facts_ref.document(fact_id), data)
+            await batch.commit()
+    
+    async def stream_facts(self, uid: str, page_size: int = 0) -> AsyncIterator[DocumentSnapshot]:
+        query = self.facts_ref(uid)
+        if page_size:
+            query = query.order_by("__name__")
+        async for fact_doc in self._stream(query, page_size):
+            yield fact_doc
+    
+    # Account deletions
+    
+    @traced("firestore.get_deletion", collection="deletions")
+    async def get_deletion(self, uid: str) -> Optional[Dict]:
+        """Get the progress record of a user's account deletion, if any."""
+        deletion_doc = await self.deletion_ref(uid).get()
+        return deletion_doc.to_dict() if deletion_doc.exists else None
+    
+    @traced("firestore.set_deletion", collection="deletions")
+    async def set_deletion(self, uid: str, data: Dict) -> None:
+        await self.deletion_ref(uid).set(data, merge=True)
+    
+    async def stream_deletions_with_status(
+        self,
+        statuses: List[str],
+    ) -> AsyncIterator[DocumentSnapshot]:
+        query = self.db.collection("deletions").where("status", "in", statuses)
+        async for deletion_doc in query.stream():
+            yield deletion_doc
+    
+    async def delete_in_batches(
+        self,
+        collection: AsyncCollectionReference,
+        batch_size: int = MAX_BATCH_WRITES,
+    ) -> AsyncIterator[int]:
+        """
+        Delete every document in `collection`, one batched commit per page.
+        
+        Yields the number of documents deleted by each commit. Deleted
+        documents drop out of the collection, so each page is simply its
+        first `batch_size` documents and an interrupted run can start over.
+        """
+        while True:
+            with span("firestore.delete_batch", collection=collection.id):
+                docs = [doc async for doc in collection.limit(batch_size).stream()]
+                if not docs:
+                    return
+                batch = self.batch()
+                for doc in docs:
+                    batch.delete(doc.reference)
+                await batch.commit()
+            yield len(docs)
+    
+    # Paging
+    
+    @staticmethod
+    async def _stream(query, page_size: int) -> AsyncIterator[DocumentSnapshot]:
+        """
+        Stream an ordered query, one page of `page_size` documents at a time.
+        
+        Each page is its own short query resumed from the previous page's
+        last document, so memory stays bounded and no single query runs
+        long enough to time out. A `page_size` of 0 streams in one query.
+        """
+        if not page_size:
+            async for doc in query.stream():
+                yield doc
+            return
+        
+        last = None
+        while True:
+            page = query if last is None else query.start_after(last)
+            with span("firestore.query_page", page_size=page_size):
+                docs = [doc async for doc in page.limit(page_size).stream()]
+            for doc in docs:
+                yield doc
+            if len(docs) < page_size:
+                return
+            last = docs[-1]
+
+
+# Singleton
+_repository: Optional[FirestoreRepository] = None
+
+
+def get_repository() -> FirestoreRepository:
+    """Get Firestore repository singleton."""
+    global _repository
+    if _repository is None:
+        _repository = FirestoreRepository()
+    return _repository
@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+from ..core.auth import AuthenticatedUser
+from ..core.config import get_settings
+from ..repositories.firestore_repository import (
+    MAX_BATCH_WRITES,
+    FirestoreRepository,
+    get_repository,
+)
+from .context_cache import get_context_cache
+from .data_export import get_export_service
+from .fact_index import get_fact_retriever
+from .job_queue import Job, get_job_queue
+
+logger = logging.getLogger(__name__)
+
+
+DELETE_JOB = "privacy_delete"
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def _keep_queued(queued: Dict, new: Dict) -> Dict:
+    """A deletion already queued for the user covers any new request."""
+    return queued
+
+
+class DeletionProgress:
+    """
+    Progress record of one account deletion, kept in `deletions/{uid}`.
+    
+    Counts carry over from an interrupted run, so a resumed deletion
+    reports the totals of all its attempts.
+    """
+    
+    def __init__(self, repo: FirestoreRepository, uid: str, record: Optional[Dict]):
+        self.repo = repo
+        self.uid = uid
+        resumed = record is not None and record.get("status") != "completed"
+        self.deleted: Dict[str, int] = {"threads": 0, "messages": 0, "facts": 0}
+        if resumed:
+            self.deleted.update(record.get("deleted") or {})
+        self.started_at = record.get("startedAt") if resumed else None
+        self.started_at = self.started_at or _now_ms()
+    
+    def add(self, kind: str, count: int) -> None:
+        self.deleted[kind] += count
+    
+    async def save(self, **fields) -> None:
+        await self.repo.set_deletion(self.uid, {
+            **fields,
+            "deleted": dict(self.deleted),
+            "startedAt": self.started_at,
+            "updatedAt": _now_ms(),
+        })
+
+
+class DeletionService:
+    """
+    Deletes all of a user's data as a resumable background job.
+    
+    Messages and facts are deleted in batched commits of up to 500
+    documents, and up to `concurrency` threads are deleted at once. The
+    deletion only removes what still exists, so it can be retried from any
+    point; progress is recorded after every commit, and deletions whose
+    record stopped updating for `stale_after_seconds` (their worker died)
+    are queued again by `resume_interrupted_deletions`.
+    """
+    
+    def __init__(
+        self,
+        concurrency: int = 8,
+        stale_after_seconds: float = 300,
+        timeout_seconds: float = 3600,
+    ):
+        self.repo = get_repository()
+        self.context_cache = get_context_cache()
+        self.fact_retriever = get_fact_retriever()
+        self.exports = get_export_service()
+        self.concurrency = concurrency
+        self.stale_after_seconds = stale_after_seconds
+        self.jobs = get_job_queue()
+        self.jobs.register(
+            DELETE_JOB,
+            self._run_deletion_job,
+            merge=_keep_queued,
+            timeout_seconds=timeout_seconds,
+        )
+    
+    async def enqueue_deletion(self, user: AuthenticatedUser) -> Job:
+        """Queue deletion of all of the user's data, unless it is already under way."""
+        record = await self.repo.get_deletion(user.uid)
+        if (
+            record is not None
+            and record.get("status") in ("queued", "running")
+            and not self._stale(record)
+        ):
+            job = await self.jobs.get(record.get("jobId", ""))
+            if job is not None and job.status in ("queued", "running"):
+                return job
+        return await self._enqueue(user.uid)
+    
+    async def _enqueue(self, uid: str) -> Job:
+        job = await self.jobs.submit(DELETE_JOB, {"uid": uid}, uid=uid, key=f"{DELETE_JOB}:{uid}")
+        await self.repo.set_deletion(uid, {
+            "jobId": job.id,
+            "status": "queued",
+            "updatedAt": _now_ms(),
+        })
+        return job
+    
+    async def get_job(self, user: AuthenticatedUser, job_id: str) -> Optional[Job]:
+        """Get one of the user's deletion jobs."""
+        job = await self.jobs.get(job_id)
+        if job is None or job.uid != user.uid or job.kind != DELETE_JOB:
+            return None
+        return job
+    
+    async def get_progress(self, user: AuthenticatedUser) -> Optional[Dict]:
+        """The progress record of the user's latest deletion."""
+        return await self.repo.get_deletion(user.uid)
+    
+    async def resume_interrupted_deletions(self) -> int:
+        """Queue again the deletions left unfinished by a worker that died."""
+        resumed = 0
+        
+        async for deletion_doc in self.repo.stream_deletions_with_status(["queued", "running"]):
+            if not self._stale(deletion_doc.to_dict()):
+                continue
+            await self._enqueue(deletion_doc.id)
+            resumed += 1
+        
+        if resumed:
+            logger.info("🧹 Resumed %d interrupted account deletions", resumed)
+        return resumed
+    
+    def _stale(self, record: Dict) -> bool:
+        return (record.get("updatedAt") or 0) < _now_ms() - self.stale_after_seconds * 1000
+    
+    async def _run_deletion_job(self, payload: Dict) -> dict:
+        uid = payload["uid"]
+        progress = DeletionProgress(self.repo, uid, await self.repo.get_deletion(uid))
+        await progress.save(status="running", error=None, completedAt=None)
+        
+        try:
+            await self._delete_threads(uid, progress)
+            
+            async for count in self.repo.delete_in_batches(self.repo.facts_ref(uid)):
+                progress.add("facts", count)
+                await progress.save()
+            
+            await self.repo.delete_user(uid)
+            await self.exports.delete_user_exports(uid)
+            await self.context_cache.invalidate(uid)
+            if self.fact_retriever is not None:
+                await self.fact_retriever.remove_user(uid)
+        except Exception as e:
+            await progress.save(status="failed", error=str(e) or type(e).__name__)
+            raise
+        
+        await progress.save(status="completed", completedAt=_now_ms())
+        logger.info("🗑️ Deleted data of user %s: %s", uid, progress.deleted)
+        return dict(progress.deleted)
+    
+    async def _delete_threads(self, uid: str, progress: DeletionProgress) -> None:
+        slots = asyncio.Semaphore(self.concurrency)
+        try:
+            async with asyncio.TaskGroup() as group:
+                threads = self.repo.stream_user_threads(uid, page_size=MAX_BATCH_WRITES)
+                async for thread_doc in threads:
+                    await slots.acquire()
+                    task = group.create_task(self._delete_thread(thread_doc.id, progress))
+                    task.add_done_callback(lambda _: slots.release())
+        except ExceptionGroup as e:
+            raise e.exceptions[0]
+    
+    async def _delete_thread(self, thread_id: str, progress: DeletionProgress) -> None:
+        async for count in self.repo.delete_in_batches(self.repo.messages_ref(thread_id)):
+            progress.add("messages", count)
+            await progress.save()
+        await self.repo.delete_thread(thread_id)
+        progress.add("threads", 1)
+
+
+# Singleton
+_deletion_service: Optional[DeletionService] = None
+
+
+def get_deletion_service() -> DeletionService:
+    """Get deletion service singleton."""
+    global _deletion_service
+    if _deletion_service is None:
+        settings = get_settings()
+        _deletion_service = DeletionService(
+            concurrency=settings.privacy_delete_concurrency,
+            stale_after_seconds=settings.privacy_delete_stale_after_seconds,
+            timeout_seconds=settings.privacy_delete_timeout_seconds,
+        )
+    return _deletion_service
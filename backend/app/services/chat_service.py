@@ -1,11 +1,19 @@
-from typing import AsyncGenerator, Optional
+from dataclasses import dataclass, field
+from typing import AsyncGenerator, AsyncIterator, Dict, List, Optional, Tuple
 from google.cloud import firestore
+from sse_starlette.sse import ServerSentEvent
+import asyncio
+import json
+import logging
 import uuid
 import time
 
-from ..core.firebase import get_firestore_client
 from ..core.auth import AuthenticatedUser
+from ..core.config import get_settings
+from ..core.metrics import ACTIVE_STREAMS
+from ..core.tracing import span, traced
 from ..models.schemas import (
+    CurateMemoryRequest,
     SendMessageRequest,
     SendMessageResponse,
     SSEMetaEvent,
@@ -16,71 +24,221 @@ from ..models.schemas import (
     Fact,
     ThreadSummary,
 )
-from .llm_service import get_llm_service
+from ..repositories.firestore_repository import get_repository
+from .context_cache import get_context_cache
+from .fact_index import get_fact_retriever
+from .generation_registry import (
+    DeltaCoalescer,
+    GenerationRegistry,
+    GenerationStream,
+    IdempotencyConflictError,
+    StreamEvent,
+    get_generation_registry,
+)
+from .llm_service import GenerationUsage, get_llm_service
+from .memory_service import get_memory_service
+from .stream_checkpoint import ReplyCheckpointer
+from .summary_service import get_summary_service
+from .token_budget import count_tokens
+from .write_pipeline import TurnWrites, get_write_pipeline
+
+
+logger = logging.getLogger(__name__)
+
+
+# Preformatted delta payload, identical to json.dumps of the event dict
+_DELTA_DATA = '{"cursor": %d, "text": %s}'
+
+
+@dataclass
+class ChatContext:
+    """Everything needed to build the LLM request for one chat turn."""
+    thread_data: Dict
+    user_data: Dict
+    preferences: UserPreferences
+    facts: List[Fact]
+    summary: Optional[ThreadSummary]
+    recent_messages: List[Dict]
+    timings: Dict[str, float] = field(default_factory=dict)
+    thread_updates: Dict = field(default_factory=dict)
+    # Assistant message already stored for this request id, if any
+    existing_reply: Optional[Dict] = None
+    # Seq of that reply when a previous attempt of the request already
+    # stored its messages, even if it failed and is generated again
+    existing_seq: Optional[int] = None
+    # Whether that attempt already added its messages to messageCount
+    existing_counted: bool = False
+    
+    @property
+    def user_name(self) -> str:
+        return self.user_data.get("displayName", "Friend")
+    
+    @property
+    def user_gender(self) -> Optional[str]:
+        return self.user_data.get("gender")
+    
+    @property
+    def user_age(self) -> Optional[int]:
+        return self.user_data.get("age")
+    
+    @property
+    def user_bio(self) -> Optional[str]:
+        return self.user_data.get("bio")
+    
+    @property
+    def custom_persona_name(self) -> Optional[str]:
+        return self.thread_data.get("customPersonaName")
+    
+    @property
+    def companion_profile(self) -> Optional[Dict]:
+        return self.thread_data.get("customCompanion")
 
 
 class ChatService:
     """Service for handling chat operations."""
     
     def __init__(self):
-        self.db = get_firestore_client()
+        self.repo = get_repository()
         self.llm = get_llm_service()
+        self.writes = get_write_pipeline()
+        self.context_cache = get_context_cache()
+        self.summaries = get_summary_service()
+        self.memory = get_memory_service()
+        self.fact_retriever = get_fact_retriever()
+        self.generations = get_generation_registry()
+        settings = get_settings()
+        # Candidate history; the LLM service trims it to the token budget
+        self.history_fetch_limit = settings.context_history_fetch_limit
+        self.auto_curate_every = settings.memory_auto_curate_every_messages
+        self.checkpoint_chars = settings.stream_checkpoint_chars
+        self.checkpoint_seconds = settings.stream_checkpoint_seconds
+        self.coalesce_ms = settings.stream_coalesce_ms
+        self.coalesce_chars = settings.stream_coalesce_chars
+        self.heartbeat_seconds = settings.stream_heartbeat_seconds
     
-    async def send_message(
+    @traced("chat.assemble_context")
+    async def _assemble_context(
         self,
         user: AuthenticatedUser,
-        request: SendMessageRequest,
-        request_id: str,
-    ) -> SendMessageResponse:
+        thread_id: str,
+        query: str = "",
+        reply_id: Optional[str] = None,
+        user_msg_id: Optional[str] = None,
+    ) -> ChatContext:
         """
-        Process user message and return complete AI response (non-streaming).
-        Simple approach: save messages, generate response, return it.
+        Load thread, user profile, facts and recent messages concurrently.
+        
+        The user, facts and history reads only depend on the thread id and
+        uid, so they are started speculatively alongside the thread read and
+        discarded if the ownership check fails. Profile and facts come from
+        the per-user context cache when warm. Once the facts arrive, users
+        with more than `top_k` active facts get a fact search for `query`
+        (the user's message) and only the facts relevant to it are kept;
+        everyone else skips the embedding call. If `reply_id` and
+        `user_msg_id` are given, the messages a previous attempt of the same
+        request stored are looked up too, so a retry keeps their seqs.
+        
+        Raises:
+            ValueError: If the thread does not exist
+            PermissionError: If the thread belongs to another user
         """
-        thread_id = request.thread_id
-        generation_id = str(uuid.uuid4())
+        timings: Dict[str, float] = {}
+        started = time.perf_counter()
         
-        # Verify thread ownership
-        thread_ref = self.db.collection("threads").document(thread_id)
-        thread_doc = thread_ref.get()
+        async def timed(name: str, coro):
+            start = time.perf_counter()
+            try:
+                return await coro
+            finally:
+                timings[name] = round((time.perf_counter() - start) * 1000, 1)
         
-        if not thread_doc.exists:
+        async def load_user_context():
+            return await asyncio.gather(
+                timed("user", self.repo.get_user(user.uid)),
+                timed("facts", self.repo.get_active_facts(user.uid)),
+            )
+        
+        user_context = asyncio.ensure_future(
+            timed("user_context", self.context_cache.get(user.uid, load_user_context))
+        )
+        
+        async def search_facts():
+            if self.fact_retriever is None or not query:
+                return None
+            _, facts = await user_context
+            return await timed("fact_search", self.fact_retriever.search(user.uid, query, facts))
+        
+        async def get_message(message_id: Optional[str]):
+            if message_id is None:
+                return None
+            return await self.repo.get_message(thread_id, message_id)
+        
+        async def get_existing_turn():
+            return await timed("reply", asyncio.gather(
+                get_message(reply_id), get_message(user_msg_id)
+            ))
+        
+        thread_task = asyncio.ensure_future(timed("thread", self.repo.get_thread(thread_id)))
+        reads = asyncio.gather(
+            user_context,
+            timed("messages", self.repo.get_recent_messages(
+                thread_id, limit=self.history_fetch_limit
+            )),
+            search_facts(),
+            get_existing_turn(),
+        )
+        
+        try:
+            thread_data = await thread_task
+        except BaseException:
+            self._discard(reads)
+            raise
+        
+        # Verify thread ownership
+        if thread_data is None:
+            self._discard(reads)
             raise ValueError("Thread not found")
         
-        thread_data = thread_doc.to_dict()
         if thread_data.get("userId") != user.uid:
+            self._discard(reads)
             raise PermissionError("Not authorized to access this thread")
         
-        # Get user preferences
-        user_ref = self.db.collection("users").document(user.uid)
-        user_doc = user_ref.get()
-        user_data = user_doc.to_dict() if user_doc.exists else {}
+        (user_data, facts), recent_messages, fact_matches, (reply, user_msg) = await reads
         
+        # A retry reuses the seqs of the messages its first attempt stored
+        existing_seq = None
+        if reply is not None and reply.get("seq") is not None:
+            existing_seq = reply["seq"]
+        elif user_msg is not None and user_msg.get("seq") is not None:
+            existing_seq = user_msg["seq"] + 1
+        
+        # A cancelled or failed reply is generated again
+        existing_reply = reply
+        status = (reply.get("streamState") or {}).get("status") if reply is not None else None
+        if status in ("cancelled", "failed"):
+            existing_reply = None
+        
+        if self.fact_retriever is not None:
+            self.fact_retriever.schedule_backfill(user.uid, facts)
+            facts = self.fact_retriever.select(facts, fact_matches)
+        
+        # Get user preferences
         preferences = UserPreferences(**(user_data.get("prefs", {})))
-        user_name = user_data.get("displayName", "Friend")
-        user_gender = user_data.get("gender")
-        user_age = user_data.get("age")
-        user_bio = user_data.get("bio")
         
         # Override persona with thread's persona if it exists
         # This ensures each thread maintains its own persona
+        thread_updates = {}
         thread_persona = thread_data.get("persona")
-        thread_custom_name = thread_data.get("customPersonaName")
-        companion_profile = thread_data.get("customCompanion")
-        
-        print(f"🎭 Thread persona: {thread_persona}")
-        print(f"📛 Thread customPersonaName: {thread_custom_name}")
-        
         if thread_persona:
+            logger.debug("🎭 Using thread persona: %s", thread_persona)
             preferences.selected_persona = thread_persona
         else:
-            print(f"⚠️ No persona in thread, using user default: {preferences.selected_persona}")
-            # Update thread with current persona for future messages
-            thread_ref.update({"persona": preferences.selected_persona})
-        
-        # Get user facts
-        facts_ref = self.db.collection("users").document(user.uid).collection("facts")
-        facts_docs = facts_ref.where("status", "==", "active").stream()
-        facts = [Fact(id=doc.id, **doc.to_dict()) for doc in facts_docs]
+            logger.debug(
+                "⚠️ No persona in thread, using user default: %s", preferences.selected_persona
+            )
+            # Update thread with current persona for future messages,
+            # committed together with the turn's writes
+            thread_updates["persona"] = preferences.selected_persona
         
         # Get thread summary if exists
         summary = None
@@ -91,92 +249,235 @@ class ChatService:
                 from_seq=summary_state.get("fromSeq", 0),
                 to_seq=summary_state.get("toSeq", 0),
             )
+            # Messages folded into the summary are not repeated as history
+            recent_messages = [
+                m for m in recent_messages if m.get("seq", 0) > summary.to_seq
+            ]
+        
+        timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+        logger.debug("⏱️ Context assembled for thread %s: %s", thread_id, timings)
         
-        # Get recent messages (last 20)
-        messages_ref = (
-            thread_ref.collection("messages")
-            .order_by("seq", direction=firestore.Query.DESCENDING)
-            .limit(20)
+        return ChatContext(
+            thread_data=thread_data,
+            user_data=user_data,
+            preferences=preferences,
+            facts=facts,
+            summary=summary,
+            recent_messages=recent_messages,
+            timings=timings,
+            thread_updates=thread_updates,
+            existing_reply=existing_reply,
+            existing_seq=existing_seq,
+            # The count is bumped in the same batch as the reply is created
+            existing_counted=reply is not None,
         )
-        messages_docs = list(messages_ref.stream())
-        messages_docs.reverse()  # Oldest first
-        
-        # Convert to LLM format
-        messages = []
-        for doc in messages_docs:
-            msg_data = doc.to_dict()
-            print(f"📨 Firestore message: role={msg_data.get('role')}, has_attachments={bool(msg_data.get('attachments'))}")
-            if msg_data.get('attachments'):
-                print(f"   Attachments: {msg_data.get('attachments')}")
-            messages.append({
+    
+    @staticmethod
+    def _message_count_update(context: ChatContext, reply_seq: int) -> Dict:
+        """Thread update counting the turn's messages, unless a previous attempt did."""
+        if context.existing_counted:
+            return {}
+        return {"messageCount": reply_seq}
+    
+    async def _after_turn(
+        self,
+        user: AuthenticatedUser,
+        thread_id: str,
+        thread_data: Dict,
+        message_count: int,
+    ) -> None:
+        """Schedule background maintenance once a turn is persisted."""
+        self.summaries.maybe_schedule(thread_id, message_count, thread_data.get("summary"))
+        
+        # Each turn adds two messages; curate whenever a multiple of N is crossed
+        every = self.auto_curate_every
+        if every <= 0 or message_count // every == (message_count - 2) // every:
+            return
+        try:
+            await self.memory.enqueue_curation(user, CurateMemoryRequest(
+                threadId=thread_id,
+                fromSeq=(message_count // every - 1) * every + 1,
+                toSeq=message_count,
+            ), verify_owner=False)
+        except Exception as e:
+            logger.warning("⚠️ Failed to queue memory curation for thread %s: %s", thread_id, e)
+    
+    @staticmethod
+    def _discard(future: asyncio.Future) -> None:
+        """Cancel speculative reads whose results are no longer needed."""
+        future.cancel()
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+    
+    @staticmethod
+    def _llm_messages(
+        context: ChatContext,
+        request: SendMessageRequest,
+        user_msg_id: str,
+        user_tokens: int,
+    ) -> List[Dict]:
+        """Recent history plus the current user message, as the LLM service takes them."""
+        messages = [
+            {
+                "id": msg_data.get("id"),
                 "role": msg_data.get("role", "user"),
                 "content": msg_data.get("content", ""),
                 "attachments": msg_data.get("attachments", []),
-            })
-        
-        # Add current user message
-        user_message = {
+                "tokenCount": msg_data.get("tokenCount"),
+            }
+            for msg_data in context.recent_messages
+        ]
+        messages.append({
+            "id": user_msg_id,
             "role": "user",
             "content": request.content,
             "attachments": [a.model_dump(by_alias=True) for a in (request.attachments or [])],
-        }
-        print(f"📤 Current user message attachments: {user_message['attachments']}")
-        messages.append(user_message)
+            "tokenCount": user_tokens,
+        })
+        return messages
+    
+    @staticmethod
+    def _turn_message_ids(uid: str, request_id: str) -> Tuple[str, str]:
+        """
+        User and assistant message ids for a request.
+        
+        Derived from (uid, request id) so a retried request writes the same
+        documents instead of duplicating the turn.
+        """
+        base = f"{uid}/{request_id}"
+        return (
+            str(uuid.uuid5(uuid.NAMESPACE_URL, f"{base}/user")),
+            str(uuid.uuid5(uuid.NAMESPACE_URL, f"{base}/assistant")),
+        )
+    
+    @staticmethod
+    def _request_fingerprint(kind: str, request: SendMessageRequest) -> str:
+        return GenerationRegistry.fingerprint(kind, request.thread_id, request.content)
+    
+    async def send_message(
+        self,
+        user: AuthenticatedUser,
+        request: SendMessageRequest,
+        request_id: str,
+    ) -> SendMessageResponse:
+        """
+        Process user message and return complete AI response (non-streaming).
+        
+        Retries with the same X-Request-Id return the first attempt's
+        response instead of generating again.
+        
+        Raises:
+            IdempotencyConflictError: If the request id was used for a different
+                request, or its first attempt is still streaming elsewhere
+        """
+        return await self.generations.run(
+            user.uid,
+            request_id,
+            self._request_fingerprint("send", request),
+            lambda: self._send_message(user, request, request_id),
+        )
+    
+    @traced("chat.send_turn")
+    async def _send_message(
+        self,
+        user: AuthenticatedUser,
+        request: SendMessageRequest,
+        request_id: str,
+    ) -> SendMessageResponse:
+        """Save messages, generate the complete response and return it."""
+        thread_id = request.thread_id
+        generation_id = str(uuid.uuid4())
+        user_msg_id, assistant_msg_id = self._turn_message_ids(user.uid, request_id)
+        
+        context = await self._assemble_context(
+            user,
+            thread_id,
+            request.content,
+            reply_id=assistant_msg_id,
+            user_msg_id=user_msg_id,
+        )
+        thread_data = context.thread_data
         
-        # Get next sequence number
-        next_seq = thread_data.get("messageCount", 0) + 1
+        # A previous attempt of this request already produced the reply
+        reply = context.existing_reply
+        if reply is not None:
+            if (reply.get("streamState") or {}).get("status", "completed") != "completed":
+                raise IdempotencyConflictError("This request is still being processed")
+            return SendMessageResponse(
+                assistantMessageId=assistant_msg_id,
+                content=reply.get("content", ""),
+                generationId=(reply.get("aiMeta") or {}).get("generationId", generation_id),
+            )
+        
+        user_tokens = count_tokens(request.content, self.llm.model)
+        messages = self._llm_messages(context, request, user_msg_id, user_tokens)
+        
+        # Get next sequence number; a retry keeps the seqs of its first attempt
+        if context.existing_seq is not None:
+            next_seq = context.existing_seq - 1
+        else:
+            next_seq = thread_data.get("messageCount", 0) + 1
         
-        # Save user message to Firestore
-        user_msg_id = str(uuid.uuid4())
-        user_msg_ref = thread_ref.collection("messages").document(user_msg_id)
-        user_msg_ref.set({
+        # Save user message to Firestore while the response is generated
+        user_msg_durable = self.writes.submit(TurnWrites(thread_id).set_message(user_msg_id, {
             "id": user_msg_id,
             "role": "user",
             "content": request.content,
             "attachments": [a.model_dump(by_alias=True) for a in (request.attachments or [])],
             "seq": next_seq,
+            "tokenCount": user_tokens,
             "createdAt": firestore.SERVER_TIMESTAMP,
-        })
+        }))
         
         # Generate complete AI response
-        custom_name = thread_data.get("customPersonaName")
-        print(f"🤖 Calling llm.generate with custom_persona_name: {custom_name}")
+        custom_name = context.custom_persona_name
+        logger.debug("🤖 Calling llm.generate with custom_persona_name: %s", custom_name)
         
+        usage = GenerationUsage()
         full_response = await self.llm.generate(
             messages=messages,
-            user_name=user_name,
-            user_gender=user_gender,
-            preferences=preferences,
-            facts=facts,
-            summary=summary,
+            user_name=context.user_name,
+            user_gender=context.user_gender,
+            preferences=context.preferences,
+            facts=context.facts,
+            summary=context.summary,
             custom_persona_name=custom_name,
-            user_age=user_age,
-            user_bio=user_bio,
-            companion_profile=companion_profile,
+            user_age=context.user_age,
+            user_bio=context.user_bio,
+            companion_profile=context.companion_profile,
+            usage=usage,
+            thread_id=thread_id,
         )
         
-        # Create assistant message
-        assistant_msg_id = str(uuid.uuid4())
-        assistant_msg_ref = thread_ref.collection("messages").document(assistant_msg_id)
-        assistant_msg_ref.set({
+        # Create assistant message and update thread in one batch, after
+        # the user message so the thread never shows a reply without it
+        turn = TurnWrites(thread_id).set_message(assistant_msg_id, {
             "id": assistant_msg_id,
             "role": "assistant",
             "content": full_response,
             "seq": next_seq + 1,
+            "tokenCount": usage.completion_tokens or count_tokens(full_response, self.llm.model),
             "createdAt": firestore.SERVER_TIMESTAMP,
             "aiMeta": {
                 "generationId": generation_id,
-                "tokensUsed": len(full_response) // 4,  # Rough estimate
-                "finishReason": "stop",
+                "model": usage.model,
+                "tokensUsed": usage.total_tokens,
+                "promptTokens": usage.prompt_tokens,
+                "completionTokens": usage.completion_tokens,
+                "latencyMs": usage.latency_ms,
+                "finishReason": usage.finish_reason,
             },
         })
-        
-        # Update thread
-        thread_ref.update({
-            "messageCount": next_seq + 1,
+        turn.update_thread({
+            **context.thread_updates,
+            **self._message_count_update(context, next_seq + 1),
             "lastMessageAt": firestore.SERVER_TIMESTAMP,
             "state.lastActivityAt": int(time.time() * 1000),
         })
+        with span("chat.persist_reply"):
+            await user_msg_durable
+            await self.writes.submit(turn)
+        
+        await self._after_turn(user, thread_id, thread_data, next_seq + 1)
         
         return SendMessageResponse(
             assistantMessageId=assistant_msg_id,
@@ -184,124 +485,158 @@ class ChatService:
             generationId=generation_id,
         )
     
-    async def send_message_stream(
+    def send_message_stream(
         self,
         user: AuthenticatedUser,
         request: SendMessageRequest,
         request_id: str,
-    ) -> AsyncGenerator[str, None]:
+    ) -> AsyncGenerator[ServerSentEvent, None]:
         """
         Process user message and stream AI response.
         
-        Yields SSE-formatted events.
+        Yields SSE events. The generation runs as its own task
+        that buffers its events; a retry with the same X-Request-Id
+        reattaches to that buffer (replaying it from the start) instead of
+        generating again, and `resume_stream` continues it by generation id.
+        
+        Raises:
+            IdempotencyConflictError: If the request id was used for a different request
+        """
+        stream = self.generations.stream(
+            user.uid,
+            request_id,
+            self._request_fingerprint("send_stream", request),
+            str(uuid.uuid4()),
+            lambda stream: self._produce_stream(stream, user, request, request_id),
+        )
+        return self._format_stream(stream.subscribe(0, self.heartbeat_seconds))
+    
+    def resume_stream(
+        self,
+        user: AuthenticatedUser,
+        generation_id: str,
+        cursor: int = 0,
+    ) -> AsyncGenerator[ServerSentEvent, None]:
         """
+        Continue a streamed generation after a reconnect.
+        
+        Replays the text after `cursor` (the cursor of the last delta the
+        client received), then follows the generation live.
+        
+        Raises:
+            ValueError: If the generation is unknown, finished too long ago,
+                or belongs to another user
+        """
+        stream = self.generations.find_stream(user.uid, generation_id)
+        if stream is None:
+            raise ValueError("Generation not found")
+        return self._format_stream(stream.subscribe(cursor, self.heartbeat_seconds))
+    
+    async def _format_stream(
+        self,
+        events: AsyncIterator[StreamEvent],
+    ) -> AsyncGenerator[ServerSentEvent, None]:
+        ACTIVE_STREAMS.inc()
+        try:
+            async for event, data in events:
+                yield self._format_sse(event, data)
+        finally:
+            ACTIVE_STREAMS.dec()
+    
+    async def _produce_stream(
+        self,
+        stream: GenerationStream,
+        user: AuthenticatedUser,
+        request: SendMessageRequest,
+        request_id: str,
+    ) -> None:
+        """Run a streamed generation, buffering its SSE events in `stream`."""
+        deltas = DeltaCoalescer(stream, self.coalesce_ms, self.coalesce_chars)
+        failed = False
+        with span("chat.stream_turn", generation_id=stream.generation_id) as turn_span:
+            try:
+                async for event, data in self._stream_events(
+                    user, request, request_id, stream.generation_id
+                ):
+                    if event == "delta":
+                        deltas.add(data["text"])
+                        continue
+                    deltas.flush()
+                    stream.append(event, data)
+                    failed = event == "error"
+            finally:
+                deltas.flush()
+            turn_span.set("chat.failed", failed)
+        stream.finish(failed=failed)
+    
+    async def _stream_events(
+        self,
+        user: AuthenticatedUser,
+        request: SendMessageRequest,
+        request_id: str,
+        generation_id: str,
+    ) -> AsyncGenerator[StreamEvent, None]:
+        """Generate the turn, yielding `(event, data)` pairs."""
         thread_id = request.thread_id
-        generation_id = str(uuid.uuid4())
+        user_msg_id, assistant_msg_id = self._turn_message_ids(user.uid, request_id)
+        reply: Optional[ReplyCheckpointer] = None
+        reply_finished = False
         
         try:
-            # Verify thread ownership
-            thread_ref = self.db.collection("threads").document(thread_id)
-            thread_doc = thread_ref.get()
-            
-            if not thread_doc.exists:
-                yield self._format_sse("error", SSEErrorEvent(
-                    code="THREAD_NOT_FOUND",
-                    message="Thread not found",
+            try:
+                context = await self._assemble_context(
+                    user,
+                    thread_id,
+                    request.content,
+                    reply_id=assistant_msg_id,
+                    user_msg_id=user_msg_id,
+                )
+            except PermissionError as e:
+                yield ("error", SSEErrorEvent(
+                    code="UNAUTHORIZED",
+                    message=str(e),
                 ).model_dump())
                 return
-            
-            thread_data = thread_doc.to_dict()
-            if thread_data.get("userId") != user.uid:
-                yield self._format_sse("error", SSEErrorEvent(
-                    code="UNAUTHORIZED",
-                    message="Not authorized to access this thread",
+            except ValueError as e:
+                yield ("error", SSEErrorEvent(
+                    code="THREAD_NOT_FOUND",
+                    message=str(e),
                 ).model_dump())
                 return
             
-            # Get user preferences
-            user_ref = self.db.collection("users").document(user.uid)
-            user_doc = user_ref.get()
-            user_data = user_doc.to_dict() if user_doc.exists else {}
+            thread_data = context.thread_data
             
-            preferences = UserPreferences(**(user_data.get("prefs", {})))
-            user_name = user_data.get("displayName", "Friend")
-            user_gender = user_data.get("gender")
-            user_age = user_data.get("age")
-            user_bio = user_data.get("bio")
-            
-            # Override persona with thread's persona if it exists
-            # This ensures each thread maintains its own persona
-            thread_persona = thread_data.get("persona")
-            companion_profile = thread_data.get("customCompanion")
-            if thread_persona:
-                print(f"🎭 Using thread persona: {thread_persona}")
-                preferences.selected_persona = thread_persona
-            else:
-                print(f"⚠️ No persona in thread, using user default: {preferences.selected_persona}")
-                # Update thread with current persona for future messages
-                thread_ref.update({"persona": preferences.selected_persona})
-            
-            # Get user facts
-            facts_ref = self.db.collection("users").document(user.uid).collection("facts")
-            facts_docs = facts_ref.where("status", "==", "active").stream()
-            facts = [Fact(id=doc.id, **doc.to_dict()) for doc in facts_docs]
-            
-            # Get thread summary if exists
-            summary = None
-            summary_state = thread_data.get("summary", {})
-            if summary_state.get("text"):
-                summary = ThreadSummary(
-                    text=summary_state["text"],
-                    from_seq=summary_state.get("fromSeq", 0),
-                    to_seq=summary_state.get("toSeq", 0),
-                )
-            
-            # Get recent messages (last 20)
-            messages_ref = (
-                thread_ref.collection("messages")
-                .order_by("seq", direction=firestore.Query.DESCENDING)
-                .limit(20)
-            )
-            messages_docs = list(messages_ref.stream())
-            messages_docs.reverse()  # Oldest first
-            
-            # Convert to LLM format
-            messages = []
-            for doc in messages_docs:
-                msg_data = doc.to_dict()
-                messages.append({
-                    "role": msg_data.get("role", "user"),
-                    "content": msg_data.get("content", ""),
-                    "attachments": msg_data.get("attachments", []),
-                })
+            # A previous attempt of this request already produced the reply
+            if context.existing_reply is not None:
+                for replayed in self._replay_reply(
+                    thread_id, assistant_msg_id, request_id, context.existing_reply
+                ):
+                    yield replayed
+                return
             
-            # Add current user message
-            user_message = {
-                "role": "user",
-                "content": request.content,
-                "attachments": [a.model_dump(by_alias=True) for a in (request.attachments or [])],
-            }
-            messages.append(user_message)
+            user_tokens = count_tokens(request.content, self.llm.model)
+            messages = self._llm_messages(context, request, user_msg_id, user_tokens)
             
-            # Get next sequence number
-            next_seq = thread_data.get("messageCount", 0) + 1
+            # Get next sequence number; a retry keeps the seqs of its first attempt
+            if context.existing_seq is not None:
+                next_seq = context.existing_seq - 1
+            else:
+                next_seq = thread_data.get("messageCount", 0) + 1
             
-            # Save user message to Firestore
-            user_msg_id = str(uuid.uuid4())
-            user_msg_ref = thread_ref.collection("messages").document(user_msg_id)
-            user_msg_ref.set({
+            # Persist user message, assistant placeholder and thread counters
+            # as one batch that commits while the LLM request is in flight
+            turn = TurnWrites(thread_id)
+            turn.set_message(user_msg_id, {
                 "id": user_msg_id,
                 "role": "user",
                 "content": request.content,
                 "attachments": [a.model_dump(by_alias=True) for a in (request.attachments or [])],
                 "seq": next_seq,
+                "tokenCount": user_tokens,
                 "createdAt": firestore.SERVER_TIMESTAMP,
             })
             
-            # Create assistant message placeholder
-            assistant_msg_id = str(uuid.uuid4())
-            assistant_msg_ref = thread_ref.collection("messages").document(assistant_msg_id)
-            assistant_msg_ref.set({
+            turn.set_message(assistant_msg_id, {
                 "id": assistant_msg_id,
                 "role": "assistant",
                 "content": "",
@@ -310,18 +645,20 @@ class ChatService:
                 "streamState": {
                     "status": "streaming",
                     "generationId": generation_id,
+                    "updatedAt": int(time.time() * 1000),
                 },
             })
             
-            # Update thread
-            thread_ref.update({
-                "messageCount": next_seq + 1,
+            turn.update_thread({
+                **context.thread_updates,
+                **self._message_count_update(context, next_seq + 1),
                 "lastMessageAt": firestore.SERVER_TIMESTAMP,
                 "state.lastActivityAt": int(time.time() * 1000),
             })
+            turn_durable = self.writes.submit(turn)
             
             # Emit meta event
-            yield self._format_sse("meta", SSEMetaEvent(
+            yield ("meta", SSEMetaEvent(
                 threadId=thread_id,
                 assistantMessageId=assistant_msg_id,
                 generationId=generation_id,
@@ -329,66 +666,175 @@ class ChatService:
             ).model_dump(by_alias=True))
             
             # Emit thinking stage
-            yield self._format_sse("stage", {"name": "thinking", "status": "started"})
+            yield ("stage", {"name": "thinking", "status": "started"})
             
-            # Stream LLM response
-            full_response = ""
-            cursor = 0
+            # Stream LLM response, checkpointing partial content
+            reply = ReplyCheckpointer(
+                self.repo,
+                thread_id,
+                assistant_msg_id,
+                turn_durable,
+                every_chars=self.checkpoint_chars,
+                every_seconds=self.checkpoint_seconds,
+            )
+            usage = GenerationUsage()
             
-            async for chunk in self.llm.generate_stream(
-                messages=messages,
-                user_name=user_name,
-                user_gender=user_gender,
-                preferences=preferences,
-                facts=facts,
-                summary=summary,
-                custom_persona_name=thread_data.get("customPersonaName"),
-                user_age=user_age,
-                user_bio=user_bio,
-                companion_profile=companion_profile,
-            ):
-                full_response += chunk
-                cursor += len(chunk)
+            try:
+                async for chunk in self.llm.generate_stream(
+                    messages=messages,
+                    user_name=context.user_name,
+                    user_gender=context.user_gender,
+                    preferences=context.preferences,
+                    facts=context.facts,
+                    summary=context.summary,
+                    custom_persona_name=context.custom_persona_name,
+                    user_age=context.user_age,
+                    user_bio=context.user_bio,
+                    companion_profile=context.companion_profile,
+                    usage=usage,
+                    thread_id=thread_id,
+                ):
+                    reply.append(chunk)
+                    
+                    yield ("delta", {"cursor": reply.length, "text": chunk})
+            except asyncio.CancelledError:
+                # No client is listening anymore; keep what was generated
+                await self._end_reply(
+                    thread_id, assistant_msg_id, generation_id, reply, "cancelled"
+                )
+                raise
+            
+            full_response = reply.text()
+            cursor = reply.length
+            
+            with span("chat.persist_reply"):
+                # The placeholder must be durable, and no checkpoint in flight,
+                # before it can be finalized
+                await turn_durable
+                await reply.flush()
                 
-                yield self._format_sse("delta", SSEDeltaEvent(
-                    cursor=cursor,
-                    text=chunk,
-                ).model_dump())
+                # Update assistant message with final content
+                await self.repo.update_message(thread_id, assistant_msg_id, {
+                    "content": full_response,
+                    "tokenCount": (
+                        usage.completion_tokens or count_tokens(full_response, self.llm.model)
+                    ),
+                    "streamState": {
+                        "status": "completed",
+                        "generationId": generation_id,
+                        "cursor": cursor,
+                        "completedAt": int(time.time() * 1000),
+                    },
+                    "aiMeta": {
+                        "generationId": generation_id,
+                        "model": usage.model,
+                        "tokensUsed": usage.total_tokens,
+                        "promptTokens": usage.prompt_tokens,
+                        "completionTokens": usage.completion_tokens,
+                        "latencyMs": usage.latency_ms,
+                        "firstTokenMs": usage.first_token_ms,
+                        "finishReason": usage.finish_reason,
+                    },
+                })
+                reply_finished = True
             
-            # Update assistant message with final content
-            assistant_msg_ref.update({
-                "content": full_response,
-                "streamState": {
-                    "status": "completed",
-                    "generationId": generation_id,
-                    "cursor": cursor,
-                    "completedAt": int(time.time() * 1000),
-                },
-                "aiMeta": {
-                    "generationId": generation_id,
-                    "tokensUsed": cursor // 4,  # Rough estimate
-                    "latencyMs": 0,  # TODO: Track actual latency
-                    "finishReason": "stop",
-                },
-            })
+            await self._after_turn(user, thread_id, thread_data, next_seq + 1)
             
             # Emit final event
-            yield self._format_sse("final", SSEFinalEvent(
+            yield ("final", SSEFinalEvent(
                 cursor=cursor,
-                finishReason="stop",
+                finishReason=usage.finish_reason,
             ).model_dump(by_alias=True))
-            
+        
         except Exception as e:
-            yield self._format_sse("error", SSEErrorEvent(
+            # Let a retry of the request generate the reply again
+            if reply is not None and not reply_finished:
+                await self._end_reply(thread_id, assistant_msg_id, generation_id, reply, "failed")
+            yield ("error", SSEErrorEvent(
                 code="INTERNAL_ERROR",
                 message=str(e),
             ).model_dump())
     
-    def _format_sse(self, event: str, data: dict) -> str:
-        """Format data as SSE event."""
-        import json
-        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
-
+    async def _end_reply(
+        self,
+        thread_id: str,
+        assistant_msg_id: str,
+        generation_id: str,
+        reply: ReplyCheckpointer,
+        status: str,
+    ) -> None:
+        """Mark an unfinished reply as `cancelled` or `failed`, keeping its partial content."""
+        partial_content = reply.text()
+        try:
+            await reply.durable
+            await reply.flush()
+            await self.repo.update_message(thread_id, assistant_msg_id, {
+                "content": partial_content,
+                "streamState": {
+                    "status": status,
+                    "generationId": generation_id,
+                    "cursor": len(partial_content),
+                    f"{status}At": int(time.time() * 1000),
+                },
+            })
+        except Exception as e:
+            logger.warning("⚠️ Failed to mark message %s %s: %s", assistant_msg_id, status, e)
+    
+    def _replay_reply(
+        self,
+        thread_id: str,
+        assistant_msg_id: str,
+        request_id: str,
+        reply: Dict,
+    ) -> List[StreamEvent]:
+        """Events for a reply stored by an earlier attempt of the request."""
+        stream_state = reply.get("streamState") or {}
+        content = reply.get("content", "")
+        generation_id = (
+            stream_state.get("generationId")
+            or (reply.get("aiMeta") or {}).get("generationId", "")
+        )
+        events = [("meta", SSEMetaEvent(
+            threadId=thread_id,
+            assistantMessageId=assistant_msg_id,
+            generationId=generation_id,
+            requestId=request_id,
+        ).model_dump(by_alias=True))]
+        if content:
+            events.append(("delta", SSEDeltaEvent(cursor=len(content), text=content).model_dump()))
+        if stream_state.get("status", "completed") == "completed":
+            events.append(("final", SSEFinalEvent(
+                cursor=len(content),
+                finishReason=(reply.get("aiMeta") or {}).get("finishReason", "stop"),
+            ).model_dump(by_alias=True)))
+        else:
+            events.append(("error", SSEErrorEvent(
+                code="REQUEST_IN_PROGRESS",
+                message="This request is still being processed",
+            ).model_dump()))
+        return events
+    
+    @staticmethod
+    def _format_sse(event: str, data: dict) -> ServerSentEvent:
+        """
+        Format data as SSE event.
+        
+        Delta and final events carry their cursor as the event id, so a
+        reconnecting EventSource sends it back as Last-Event-ID.
+        """
+        if event == "delta":
+            # Hot path: one frame per coalesced delta
+            return ServerSentEvent(
+                _DELTA_DATA % (data["cursor"], json.dumps(data["text"])),
+                event=event,
+                id=str(data["cursor"]),
+            )
+        cursor = data.get("cursor") if event == "final" else None
+        return ServerSentEvent(
+            json.dumps(data),
+            event=event,
+            id=str(cursor) if cursor is not None else None,
+        )
 
 # Singleton
 _chat_service: Optional[ChatService] = None
@@ -0,0 +1,181 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from ..core.config import get_settings
+from ..core.redis_client import get_redis
+from ..models.schemas import Fact
+
+logger = logging.getLogger(__name__)
+
+
+# Only the profile fields used to build prompts are cached, which keeps
+# entries small and JSON-serializable for the Redis tier.
+_PROFILE_FIELDS = ("displayName", "gender", "age", "bio", "prefs")
+
+UserContextLoader = Callable[[], Awaitable[Tuple[Dict, List[Fact]]]]
+
+
+class UserContextCache:
+    """
+    Per-user cache of profile, preferences and active facts.
+    
+    Two tiers: an in-process TTL + LRU map and an optional Redis tier shared
+    by all workers. Concurrent misses for the same uid share one load, and a
+    load that races with `invalidate` is not written back.
+    
+    The Flutter app writes profile and fact edits straight to Firestore,
+    where the backend cannot invalidate them, so an entry is served for at
+    most `ttl_seconds` after it was loaded, whichever tier it comes from.
+    """
+    
+    def __init__(
+        self,
+        ttl_seconds: int = 60,
+        max_entries: int = 10000,
+        redis_enabled: bool = False,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.redis_enabled = redis_enabled
+        self._entries: "OrderedDict[str, Tuple[float, Dict, List[Fact]]]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Future] = {}
+        # Invalidations of uids with a load in flight, dropped when it ends
+        self._versions: Dict[str, int] = {}
+        self._stats = {
+            "hits": 0,
+            "redis_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "evictions": 0,
+            "invalidations": 0,
+        }
+    
+    async def get(self, uid: str, loader: UserContextLoader) -> Tuple[Dict, List[Fact]]:
+        """Get `(profile, active_facts)` for a user, loading on a miss."""
+        entry = self._entries.get(uid)
+        if entry is not None:
+            expires_at, profile, facts = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(uid)
+                self._stats["hits"] += 1
+                return profile, facts
+            del self._entries[uid]
+        
+        # Concurrent misses share one load, which runs as its own task so a
+        # cancelled caller does not abort it for the others
+        pending = self._loading.get(uid)
+        if pending is None:
+            pending = asyncio.ensure_future(self._load(uid, loader))
+            self._loading[uid] = pending
+            pending.add_done_callback(lambda task: self._finish_load(uid, task))
+        else:
+            self._stats["coalesced"] += 1
+        return await asyncio.shield(pending)
+    
+    def _finish_load(self, uid: str, task: asyncio.Future) -> None:
+        if self._loading.get(uid) is task:
+            del self._loading[uid]
+            self._versions.pop(uid, None)
+        if not task.cancelled():
+            # Mark a failure as retrieved even if every caller went away
+            task.exception()
+    
+    async def invalidate(self, uid: str) -> None:
+        """Drop a user's cached context from both tiers."""
+        if uid in self._loading:
+            self._versions[uid] = self._versions.get(uid, 0) + 1
+        self._entries.pop(uid, None)
+        self._stats["invalidations"] += 1
+        
+        if self.redis_enabled:
+            try:
+                await get_redis().delete(self._redis_key(uid))
+            except Exception as e:
+                logger.warning("⚠️ Context cache Redis invalidate failed: %s", e)
+    
+    def stats(self) -> Dict:
+        """Hit/miss counters and current size."""
+        lookups = self._stats["hits"] + self._stats["redis_hits"] + self._stats["misses"]
+        hit_rate = (self._stats["hits"] + self._stats["redis_hits"]) / lookups if lookups else 0.0
+        return {
+            **self._stats,
+            "size": len(self._entries),
+            "hit_rate": round(hit_rate, 4),
+        }
+    
+    async def _load(self, uid: str, loader: UserContextLoader) -> Tuple[Dict, List[Fact]]:
+        version = self._versions.get(uid, 0)
+        
+        cached = await self._redis_get(uid) if self.redis_enabled else None
+        if cached is not None:
+            self._stats["redis_hits"] += 1
+            # Kept in process only for what is left of the Redis TTL
+            ttl_seconds, profile, facts = cached
+        else:
+            self._stats["misses"] += 1
+            user_data, facts = await loader()
+            profile = {k: user_data[k] for k in _PROFILE_FIELDS if k in user_data}
+            ttl_seconds = self.ttl_seconds
+            if self.redis_enabled and self._versions.get(uid, 0) == version:
+                await self._redis_set(uid, profile, facts)
+        
+        if self._versions.get(uid, 0) == version:
+            self._store(uid, profile, facts, ttl_seconds)
+        return profile, facts
+    
+    def _store(self, uid: str, profile: Dict, facts: List[Fact], ttl_seconds: float) -> None:
+        self._entries[uid] = (time.monotonic() + ttl_seconds, profile, facts)
+        self._entries.move_to_end(uid)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+    
+    @staticmethod
+    def _redis_key(uid: str) -> str:
+        return f"user_context:{uid}"
+    
+    async def _redis_get(self, uid: str) -> Optional[Tuple[float, Dict, List[Fact]]]:
+        """`(seconds_left, profile, facts)` of the Redis entry, if any."""
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            pipe.get(self._redis_key(uid))
+            pipe.pttl(self._redis_key(uid))
+            raw, ttl_ms = await pipe.execute()
+        except Exception as e:
+            logger.warning("⚠️ Context cache Redis read failed: %s", e)
+            return None
+        if raw is None or ttl_ms <= 0:
+            return None
+        data = json.loads(raw)
+        return ttl_ms / 1000, data["profile"], [Fact(**f) for f in data["facts"]]
+    
+    async def _redis_set(self, uid: str, profile: Dict, facts: List[Fact]) -> None:
+        payload = json.dumps({
+            "profile": profile,
+            "facts": [f.model_dump() for f in facts],
+        })
+        try:
+            await get_redis().set(self._redis_key(uid), payload, ex=self.ttl_seconds)
+        except Exception as e:
+            logger.warning("⚠️ Context cache Redis write failed: %s", e)
+
+
+# Singleton
+_context_cache: Optional[UserContextCache] = None
+
+
+def get_context_cache() -> UserContextCache:
+    """Get user context cache singleton."""
+    global _context_cache
+    if _context_cache is None:
+        settings = get_settings()
+        _context_cache = UserContextCache(
+            ttl_seconds=settings.user_context_cache_ttl_seconds,
+            max_entries=settings.user_context_cache_max_entries,
+            redis_enabled=settings.user_context_cache_redis_enabled,
+        )
+    return _context_cache
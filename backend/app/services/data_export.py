@@ -0,0 +1,376 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+import zlib
+from typing import AsyncIterator, Dict, List, Optional
+
+from ..core.auth import AuthenticatedUser
+from ..core.config import get_settings
+from ..repositories.firestore_repository import FirestoreRepository, get_repository
+from .job_queue import Job, get_job_queue
+
+logger = logging.getLogger(__name__)
+
+
+EXPORT_JOB = "privacy_export"
+
+EXPORT_FORMATS = ("json", "ndjson")
+
+# Encoded output is handed on in pieces of about this size
+_CHUNK_BYTES = 64 * 1024
+
+# How often expired export files are looked for
+_SWEEP_INTERVAL_SECONDS = 3600
+
+
+def _json_default(value):
+    # Firestore timestamps and anything else json doesn't know
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, default=_json_default, ensure_ascii=False)
+
+
+async def _json_pieces(repo: FirestoreRepository, uid: str, page_size: int) -> AsyncIterator[str]:
+    """The export as one JSON document: {"user", "threads": [{..., "messages"}], "facts"}."""
+    yield '{"user": ' + _dumps(await repo.get_user(uid)) + ', "threads": ['
+    
+    first_thread = True
+    async for thread_doc in repo.stream_user_threads(uid, page_size=page_size):
+        thread = thread_doc.to_dict()
+        thread.pop("messages", None)
+        # Open the thread object and leave it open for its messages
+        opening = _dumps(thread)[:-1]
+        yield ("" if first_thread else ", ") + opening + (", " if thread else "") + '"messages": ['
+        first_thread = False
+        
+        first_message = True
+        async for msg_doc in repo.stream_messages(thread_doc.id, page_size=page_size):
+            yield ("" if first_message else ", ") + _dumps(msg_doc.to_dict())
+            first_message = False
+        yield "]}"
+    
+    yield '], "facts": ['
+    first_fact = True
+    async for fact_doc in repo.stream_facts(uid, page_size=page_size):
+        yield ("" if first_fact else ", ") + _dumps(fact_doc.to_dict())
+        first_fact = False
+    yield "]}"
+
+
+async def _ndjson_pieces(repo: FirestoreRepository, uid: str, page_size: int) -> AsyncIterator[str]:
+    """The export as one JSON record per line, tagged with its `type`."""
+    yield _dumps({"type": "user", "id": uid, "data": await repo.get_user(uid)}) + "\n"
+    
+    async for thread_doc in repo.stream_user_threads(uid, page_size=page_size):
+        yield _dumps({"type": "thread", "id": thread_doc.id, "data": thread_doc.to_dict()}) + "\n"
+        async for msg_doc in repo.stream_messages(thread_doc.id, page_size=page_size):
+            yield _dumps({
+                "type": "message",
+                "id": msg_doc.id,
+                "threadId": thread_doc.id,
+                "data": msg_doc.to_dict(),
+            }) + "\n"
+    
+    async for fact_doc in repo.stream_facts(uid, page_size=page_size):
+        yield _dumps({"type": "fact", "id": fact_doc.id, "data": fact_doc.to_dict()}) + "\n"
+
+
+async def export_user_data(
+    repo: FirestoreRepository,
+    uid: str,
+    format: str = "json",
+    gzip: bool = False,
+    page_size: int = 500,
+) -> AsyncIterator[bytes]:
+    """
+    Stream a user's data as encoded (and optionally gzipped) bytes.
+    
+    Threads, messages and facts are read in pages of `page_size`
+    documents and encoded as they arrive, so memory use depends on the
+    page size, not on the size of the account.
+    """
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {format}")
+    pieces = _ndjson_pieces if format == "ndjson" else _json_pieces
+    compressor = zlib.compressobj(wbits=31) if gzip else None  # 31: gzip container
+    
+    buffer: List[str] = []
+    buffered = 0
+    async for piece in pieces(repo, uid, page_size):
+        buffer.append(piece)
+        buffered += len(piece)
+        if buffered < _CHUNK_BYTES:
+            continue
+        data = "".join(buffer).encode()
+        buffer.clear()
+        buffered = 0
+        if compressor is not None:
+            data = compressor.compress(data)
+        if data:
+            yield data
+    
+    data = "".join(buffer).encode()
+    if compressor is not None:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+def export_filename(format: str, gzip: bool) -> str:
+    return f"amorae-export.{format}" + (".gz" if gzip else "")
+
+
+def export_media_type(format: str, gzip: bool) -> str:
+    if gzip:
+        return "application/gzip"
+    return "application/x-ndjson" if format == "ndjson" else "application/json"
+
+
+class LocalExportStore:
+    """Export files in a local directory; only for single-host deployments."""
+    
+    def __init__(self, directory: str):
+        self.directory = directory
+    
+    async def write(self, name: str, chunks: AsyncIterator[bytes]) -> int:
+        path = os.path.join(self.directory, name)
+        await asyncio.to_thread(os.makedirs, os.path.dirname(path), exist_ok=True)
+        size = 0
+        file = await asyncio.to_thread(open, path, "wb")
+        try:
+            async for chunk in chunks:
+                await asyncio.to_thread(file.write, chunk)
+                size += len(chunk)
+        finally:
+            await asyncio.to_thread(file.close)
+        return size
+    
+    async def read(self, name: str) -> AsyncIterator[bytes]:
+        file = await asyncio.to_thread(open, os.path.join(self.directory, name), "rb")
+        try:
+            while chunk := await asyncio.to_thread(file.read, _CHUNK_BYTES):
+                yield chunk
+        finally:
+            await asyncio.to_thread(file.close)
+    
+    async def delete_prefix(self, prefix: str) -> None:
+        """Delete the directory `prefix` and everything in it."""
+        path = os.path.join(self.directory, prefix)
+        await asyncio.to_thread(shutil.rmtree, path, ignore_errors=True)
+    
+    async def delete_older_than(self, cutoff: float) -> int:
+        """Delete files last written before `cutoff` (a Unix time)."""
+        return await asyncio.to_thread(self._delete_older_than, cutoff)
+    
+    def _delete_older_than(self, cutoff: float) -> int:
+        deleted = 0
+        for root, _, files in os.walk(self.directory, topdown=False):
+            for name in files:
+                path = os.path.join(root, name)
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    deleted += 1
+            if root != self.directory and not os.listdir(root):
+                os.rmdir(root)
+        return deleted
+
+
+class GCSExportStore:
+    """Export objects in a Cloud Storage bucket."""
+    
+    def __init__(self, bucket: str):
+        # Only load the Cloud Storage client when it is used
+        from google.cloud import storage
+        self.bucket = storage.Client().bucket(bucket)
+    
+    async def write(self, name: str, chunks: AsyncIterator[bytes]) -> int:
+        blob = self.bucket.blob(name)
+        size = 0
+        file = await asyncio.to_thread(blob.open, "wb", chunk_size=4 * _CHUNK_BYTES)
+        try:
+            async for chunk in chunks:
+                await asyncio.to_thread(file.write, chunk)
+                size += len(chunk)
+        finally:
+            await asyncio.to_thread(file.close)
+        return size
+    
+    async def read(self, name: str) -> AsyncIterator[bytes]:
+        file = await asyncio.to_thread(self.bucket.blob(name).open, "rb")
+        try:
+            while chunk := await asyncio.to_thread(file.read, _CHUNK_BYTES):
+                yield chunk
+        finally:
+            await asyncio.to_thread(file.close)
+    
+    async def delete_prefix(self, prefix: str) -> None:
+        """Delete all objects whose name starts with `prefix/`."""
+        await asyncio.to_thread(self._delete_blobs, self.bucket.list_blobs(prefix=f"{prefix}/"))
+    
+    async def delete_older_than(self, cutoff: float) -> int:
+        """Delete objects last written before `cutoff` (a Unix time)."""
+        def expired():
+            return [blob for blob in self.bucket.list_blobs() if blob.updated.timestamp() < cutoff]
+        return await asyncio.to_thread(lambda: self._delete_blobs(expired()))
+    
+    @staticmethod
+    def _delete_blobs(blobs) -> int:
+        deleted = 0
+        for blob in blobs:
+            blob.delete()
+            deleted += 1
+        return deleted
+
+
+class ExportService:
+    """
+    GDPR data exports, streamed directly or written to a file for download.
+    
+    Large accounts can take longer to export than a client will hold a
+    connection open, so `enqueue_export` runs the same export as a
+    background job that writes it to the export store; the finished file
+    is then downloaded with `open_download`. Export files hold all of a
+    user's data, so they are deleted `retention_seconds` after they were
+    written.
+    """
+    
+    def __init__(
+        self,
+        store,
+        page_size: int = 500,
+        timeout_seconds: float = 3600,
+        retention_seconds: float = 86400,
+    ):
+        self.repo = get_repository()
+        self.store = store
+        self.page_size = page_size
+        self.retention_seconds = retention_seconds
+        self.jobs = get_job_queue()
+        self.jobs.register(EXPORT_JOB, self._run_export_job, timeout_seconds=timeout_seconds)
+        self._sweep_task: Optional[asyncio.Task] = None
+    
+    def start(self) -> None:
+        """Start deleting expired export files in the background."""
+        if self._sweep_task is None:
+            self._sweep_task = asyncio.ensure_future(self._sweep_expired_exports())
+    
+    async def stop(self) -> None:
+        task, self._sweep_task = self._sweep_task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+    
+    def stream(
+        self,
+        user: AuthenticatedUser,
+        format: str = "json",
+        gzip: bool = False,
+    ) -> AsyncIterator[bytes]:
+        """Stream the user's data export."""
+        return export_user_data(self.repo, user.uid, format, gzip, self.page_size)
+    
+    async def enqueue_export(
+        self,
+        user: AuthenticatedUser,
+        format: str = "json",
+        gzip: bool = False,
+    ) -> Job:
+        """Queue an export of the user's data to the export store."""
+        if format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format: {format}")
+        return await self.jobs.submit(
+            EXPORT_JOB,
+            {
+                "uid": user.uid,
+                "format": format,
+                "gzip": gzip,
+                "object": f"{user.uid}/{uuid.uuid4()}/{export_filename(format, gzip)}",
+            },
+            uid=user.uid,
+            key=f"{EXPORT_JOB}:{user.uid}",
+        )
+    
+    async def _run_export_job(self, payload: Dict) -> dict:
+        chunks = export_user_data(
+            self.repo,
+            payload["uid"],
+            payload["format"],
+            payload["gzip"],
+            self.page_size,
+        )
+        size = await self.store.write(payload["object"], chunks)
+        logger.info("📦 Exported data of user %s (%d bytes)", payload["uid"], size)
+        return {
+            "format": payload["format"],
+            "gzip": payload["gzip"],
+            "bytes": size,
+        }
+    
+    async def get_job(self, user: AuthenticatedUser, job_id: str) -> Optional[Job]:
+        """Get one of the user's export jobs."""
+        job = await self.jobs.get(job_id)
+        if job is None or job.uid != user.uid or job.kind != EXPORT_JOB:
+            return None
+        return job
+    
+    async def open_download(
+        self,
+        user: AuthenticatedUser,
+        job_id: str,
+    ) -> Optional[AsyncIterator[bytes]]:
+        """
+        Stream the file of a finished export job.
+        
+        Returns None if the job is not the user's or has not succeeded.
+        """
+        job = await self.get_job(user, job_id)
+        if job is None or job.status != "succeeded" or self._expired(job.updated_at):
+            return None
+        return self.store.read(job.payload["object"])
+    
+    async def delete_user_exports(self, uid: str) -> None:
+        """Delete all of a user's export files."""
+        await self.store.delete_prefix(uid)
+    
+    def _expired(self, written_at: float) -> bool:
+        return written_at < time.time() - self.retention_seconds
+    
+    async def _sweep_expired_exports(self) -> None:
+        while True:
+            try:
+                deleted = await self.store.delete_older_than(time.time() - self.retention_seconds)
+                if deleted:
+                    logger.info("🧹 Deleted %d expired export files", deleted)
+            except Exception as e:
+                logger.warning("⚠️ Failed to delete expired export files: %s", e)
+            await asyncio.sleep(_SWEEP_INTERVAL_SECONDS)
+
+
+# Singleton
+_export_service: Optional[ExportService] = None
+
+
+def get_export_service() -> ExportService:
+    """Get export service singleton."""
+    global _export_service
+    if _export_service is None:
+        settings = get_settings()
+        if settings.privacy_export_store == "gcs":
+            store = GCSExportStore(settings.privacy_export_bucket)
+        else:
+            store = LocalExportStore(settings.privacy_export_dir)
+        _export_service = ExportService(
+            store,
+            page_size=settings.privacy_export_page_size,
+            timeout_seconds=settings.privacy_export_timeout_seconds,
+            retention_seconds=settings.privacy_export_retention_seconds,
+        )
+    return _export_service
@@ -0,0 +1,144 @@
+"""Merging of newly extracted facts into a user's existing facts."""
+
+import re
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Tuple
+
+from ..models.schemas import Fact
+
+# Values at least this similar are treated as the same fact
+VALUE_SIMILARITY_THRESHOLD = 0.85
+
+# Facts under different keys must be near-identical to be merged
+CROSS_KEY_SIMILARITY_THRESHOLD = 0.92
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_key(key: str) -> str:
+    """`"Favorite Food"`, `"favorite-food"` and `"favorite_food"` all match."""
+    return _NON_WORD.sub("_", key.lower()).strip("_")
+
+
+def _normalize_value(value: str) -> str:
+    return " ".join(_NON_WORD.sub(" ", value.lower()).split())
+
+
+def value_similarity(a: str, b: str) -> float:
+    """Similarity ratio (0-1) of two fact values, ignoring case and punctuation."""
+    a, b = _normalize_value(a), _normalize_value(b)
+    if a == b:
+        return 1.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+@dataclass
+class FactMergePlan:
+    """Fact writes needed to merge an extraction into existing facts."""
+    creates: List[Dict] = field(default_factory=list)
+    updates: Dict[str, Dict] = field(default_factory=dict)
+    duplicates: int = 0
+
+
+@dataclass
+class _Candidate:
+    key: str
+    value: str
+    type: str
+    confidence: float
+    importance: float
+    fact_id: Optional[str] = None  # None until the fact is stored
+    data: Optional[Dict] = None  # pending create payload
+
+
+def plan_fact_merge(extracted: List[Dict], existing: List[Fact]) -> FactMergePlan:
+    """
+    Decide which extracted facts are new and which update existing ones.
+    
+    An extracted fact matches an existing active fact when the normalized
+    keys are equal, or when the type matches and the values are nearly
+    identical. A match with a similar value only raises confidence and
+    importance; a match on key with a different value replaces the value,
+    since it is newer information about the same thing. Duplicates within
+    the extraction itself are merged the same way.
+    """
+    plan = FactMergePlan()
+    candidates: List[_Candidate] = [
+        _Candidate(
+            key=normalize_key(f.key),
+            value=f.value,
+            type=f.type,
+            confidence=f.confidence,
+            importance=f.importance,
+            fact_id=f.id,
+        )
+        for f in existing
+        if f.status == "active"
+    ]
+    
+    for fact_data in extracted:
+        key, value = fact_data.get("key"), fact_data.get("value")
+        if not isinstance(key, str) or not isinstance(value, str) or not key or not value:
+            continue
+        norm_key = normalize_key(key)
+        confidence = float(fact_data.get("confidence", 0.8))
+        importance = float(fact_data.get("importance", 0.5))
+        
+        match, similarity = _best_match(candidates, norm_key, value, fact_data.get("type"))
+        if match is None:
+            candidate = _Candidate(
+                key=norm_key,
+                value=value,
+                type=fact_data.get("type"),
+                confidence=confidence,
+                importance=importance,
+                data=dict(fact_data),
+            )
+            candidates.append(candidate)
+            plan.creates.append(candidate.data)
+            continue
+        
+        changes: Dict = {}
+        if similarity < VALUE_SIMILARITY_THRESHOLD:
+            changes["value"] = value
+            changes["confidence"] = confidence
+        elif confidence > match.confidence:
+            changes["confidence"] = confidence
+        if importance > match.importance:
+            changes["importance"] = importance
+        
+        if not changes:
+            plan.duplicates += 1
+            continue
+        
+        match.value = changes.get("value", match.value)
+        match.confidence = changes.get("confidence", match.confidence)
+        match.importance = changes.get("importance", match.importance)
+        if match.data is not None:
+            match.data.update(changes)
+        else:
+            plan.updates.setdefault(match.fact_id, {}).update(changes)
+    
+    return plan
+
+
+def _best_match(
+    candidates: List[_Candidate],
+    norm_key: str,
+    value: str,
+    fact_type: Optional[str],
+) -> Tuple[Optional[_Candidate], float]:
+    best, best_rank, best_similarity = None, -1.0, 0.0
+    for candidate in candidates:
+        similarity = value_similarity(candidate.value, value)
+        if candidate.key == norm_key:
+            # A same-key match beats any cross-key match
+            rank = 1.0 + similarity
+        elif candidate.type == fact_type and similarity >= CROSS_KEY_SIMILARITY_THRESHOLD:
+            rank = similarity
+        else:
+            continue
+        if rank > best_rank:
+            best, best_rank, best_similarity = candidate, rank, similarity
+    return best, best_similarity
@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import math
+import operator
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ..core.config import get_settings
+from ..models.schemas import Fact
+from .llm_service import get_llm_service
+
+logger = logging.getLogger(__name__)
+
+
+# (fact_id, cosine similarity), best first
+FactMatches = List[Tuple[str, float]]
+
+# Facts embedded per embeddings request during backfill
+_EMBED_BATCH_SIZE = 100
+
+# Nearest neighbours fetched per returned fact, for re-ranking by importance
+_CANDIDATE_FACTOR = 4
+
+
+def _normalize(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+def fact_text(key: str, value: str) -> str:
+    """Text that is embedded for a fact."""
+    return f"{key}: {value}"
+
+
+class InMemoryFactIndex:
+    """Exact cosine search over per-user vectors in this process; for tests and local runs."""
+    
+    def __init__(self):
+        self._vectors: Dict[str, Dict[str, List[float]]] = {}
+    
+    async def upsert(self, uid: str, vectors: Dict[str, List[float]]) -> None:
+        user_vectors = self._vectors.setdefault(uid, {})
+        for fact_id, vector in vectors.items():
+            user_vectors[fact_id] = _normalize(vector)
+    
+    async def delete(self, uid: str, fact_ids: Iterable[str]) -> None:
+        user_vectors = self._vectors.get(uid, {})
+        for fact_id in fact_ids:
+            user_vectors.pop(fact_id, None)
+    
+    async def delete_user(self, uid: str) -> None:
+        self._vectors.pop(uid, None)
+    
+    async def missing(self, uid: str, fact_ids: Iterable[str]) -> List[str]:
+        user_vectors = self._vectors.get(uid, {})
+        return [fact_id for fact_id in fact_ids if fact_id not in user_vectors]
+    
+    async def search(self, uid: str, vector: List[float], limit: int) -> FactMatches:
+        query = _normalize(vector)
+        scored = [
+            (fact_id, sum(map(operator.mul, query, candidate)))
+            for fact_id, candidate in self._vectors.get(uid, {}).items()
+        ]
+        scored.sort(key=lambda match: match[1], reverse=True)
+        return scored[:limit]
+    
+    async def ping(self) -> None:
+        pass
+    
+    async def close(self) -> None:
+        pass
+
+
+class FactRetriever:
+    """
+    Picks the facts relevant to the current message for the system prompt.
+    
+    Facts are embedded when curated and searched by similarity to the
+    user's message; similarity is weighted by importance and confidence and
+    the top `top_k` facts are kept, so the facts section stays the same size
+    however many facts a user has. Users with at most `top_k` facts skip
+    retrieval entirely. Facts curated before the index existed are embedded
+    in the background the first time they are needed.
+    """
+    
+    def __init__(self, index, top_k: int = 12, importance_weight: float = 0.5):
+        self.index = index
+        self.llm = get_llm_service()
+        self.top_k = top_k
+        self.importance_weight = importance_weight
+        self._backfilled: set = set()
+        self._backfills: Dict[str, asyncio.Task] = {}
+    
+    async def search(self, uid: str, query: str, facts: List[Fact]) -> Optional[FactMatches]:
+        """
+        Facts most similar to `query`, or None if retrieval is unavailable.
+        
+        Users with at most `top_k` active `facts` keep them all, so no
+        embedding is requested for them.
+        """
+        if len(facts) <= self.top_k or not query.strip():
+            return None
+        try:
+            vector = (await self.llm.embed([query]))[0]
+            return await self.index.search(uid, vector, self.top_k * _CANDIDATE_FACTOR)
+        except Exception as e:
+            logger.warning("⚠️ Fact retrieval failed, using importance order: %s", e)
+            return None
+    
+    def select(self, facts: List[Fact], matches: Optional[FactMatches]) -> List[Fact]:
+        """Top `top_k` facts by weighted similarity."""
+        if len(facts) <= self.top_k or matches is None:
+            return facts
+        
+        similarity = dict(matches)
+        weight = self.importance_weight
+        scored = sorted(
+            (
+                (similarity[f.id] * (1 - weight + weight * f.importance * f.confidence), f)
+                for f in facts if f.id in similarity
+            ),
+            key=lambda s: s[0],
+            reverse=True,
+        )
+        selected = [f for _, f in scored[:self.top_k]]
+        
+        # Facts not embedded yet fill any remaining slots by importance
+        if len(selected) < self.top_k:
+            unindexed = sorted(
+                (f for f in facts if f.id not in similarity),
+                key=lambda f: f.importance * f.confidence,
+                reverse=True,
+            )
+            selected += unindexed[:self.top_k - len(selected)]
+        return selected
+    
+    async def index_facts(self, uid: str, texts: Dict[str, str]) -> None:
+        """Embed and store facts, keyed by fact id."""
+        ids = list(texts)
+        for start in range(0, len(ids), _EMBED_BATCH_SIZE):
+            chunk = ids[start:start + _EMBED_BATCH_SIZE]
+            vectors = await self.llm.embed([texts[fact_id] for fact_id in chunk])
+            await self.index.upsert(uid, dict(zip(chunk, vectors)))
+    
+    async def remove_facts(self, uid: str, fact_ids: Iterable[str]) -> None:
+        await self.index.delete(uid, fact_ids)
+    
+    async def remove_user(self, uid: str) -> None:
+        self._backfilled.discard(uid)
+        await self.index.delete_user(uid)
+    
+    def schedule_backfill(self, uid: str, facts: List[Fact]) -> None:
+        """Embed any of the user's facts missing from the index, once per process."""
+        if len(facts) <= self.top_k or uid in self._backfilled or uid in self._backfills:
+            return
+        task = asyncio.ensure_future(self._backfill(uid, facts))
+        self._backfills[uid] = task
+        task.add_done_callback(lambda t: self._finish_backfill(uid, t))
+    
+    async def _backfill(self, uid: str, facts: List[Fact]) -> None:
+        missing = set(await self.index.missing(uid, [f.id for f in facts]))
+        if missing:
+            await self.index_facts(uid, {
+                f.id: fact_text(f.key, f.value) for f in facts if f.id in missing
+            })
+            logger.info("🧭 Indexed %d facts for user %s", len(missing), uid)
+        self._backfilled.add(uid)
+    
+    def _finish_backfill(self, uid: str, task: asyncio.Task) -> None:
+        self._backfills.pop(uid, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("⚠️ Fact index backfill failed for user %s: %s", uid, task.exception())
+    
+    async def close(self) -> None:
+        await self.index.close()
+
+
+# Singleton
+_fact_retriever: Optional[FactRetriever] = None
+
+
+def get_fact_retriever() -> Optional[FactRetriever]:
+    """Get fact retriever singleton, or None when fact retrieval is disabled."""
+    global _fact_retriever
+    settings = get_settings()
+    if settings.fact_index_backend == "none":
+        return None
+    if _fact_retriever is None:
+        if settings.fact_index_backend == "pgvector":
+            # Only load the Postgres stack when it is used
+            from .pgvector_fact_index import PgVectorFactIndex
+            index = PgVectorFactIndex(settings.database_url, settings.openai_embedding_dimensions)
+        else:
+            index = InMemoryFactIndex()
+        _fact_retriever = FactRetriever(
+            index,
+            top_k=settings.fact_retrieval_top_k,
+            importance_weight=settings.fact_retrieval_importance_weight,
+        )
+    return _fact_retriever
@@ -0,0 +1,348 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from ..core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyConflictError(Exception):
+    """An X-Request-Id was reused for a different request."""
+
+
+# (event name, data) of one SSE event
+StreamEvent = Tuple[str, Dict]
+
+
+class GenerationStream:
+    """
+    Buffered SSE events of one streamed generation.
+    
+    The generation appends events as it produces them, independently of
+    any HTTP connection; any number of subscribers replay the buffer and
+    then follow live events until the generation finishes. Subscribers
+    that reconnect pass the `cursor` of the text they already have and
+    only receive the text after it. If no subscriber is connected for
+    `abandon_after` seconds, the generation task is cancelled.
+    """
+    
+    def __init__(self, generation_id: str, abandon_after: float = 5):
+        self.generation_id = generation_id
+        self.abandon_after = abandon_after
+        self.events: List[StreamEvent] = []
+        self.done = False
+        self.failed = False
+        self.abandoned = False
+        self.task: Optional[asyncio.Future] = None
+        self._changed = asyncio.Event()
+        self._subscribers = 0
+        self._abandon_timer: Optional[asyncio.TimerHandle] = None
+    
+    def append(self, event: str, data: Dict) -> None:
+        self.events.append((event, data))
+        self._notify()
+    
+    def finish(self, failed: bool = False) -> None:
+        self.done = True
+        self.failed = failed
+        self._cancel_abandon_timer()
+        self._notify()
+    
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+    
+    async def subscribe(
+        self,
+        cursor: int = 0,
+        heartbeat_seconds: float = 0,
+    ) -> AsyncIterator[StreamEvent]:
+        """
+        Yield buffered events, then live ones, skipping text before `cursor`.
+        
+        Non-text events (meta, stage, final, error) are always yielded;
+        a delta that straddles `cursor` is trimmed to the unseen part. If
+        no event arrives for `heartbeat_seconds` (0 disables), a heartbeat
+        event is yielded to keep the connection alive.
+        """
+        index = 0
+        self._attach()
+        try:
+            while True:
+                while index < len(self.events):
+                    event, data = self.events[index]
+                    index += 1
+                    if event == "delta":
+                        end = data["cursor"]
+                        if end <= cursor:
+                            continue
+                        unseen = end - cursor
+                        if unseen < len(data["text"]):
+                            data = {**data, "text": data["text"][-unseen:]}
+                    yield event, data
+                if self.done:
+                    return
+                if heartbeat_seconds <= 0:
+                    await self._changed.wait()
+                    continue
+                try:
+                    await asyncio.wait_for(self._changed.wait(), heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    yield "heartbeat", {"ts": int(time.time() * 1000)}
+        finally:
+            self._detach()
+    
+    def _attach(self) -> None:
+        self._subscribers += 1
+        self._cancel_abandon_timer()
+    
+    def _detach(self) -> None:
+        self._subscribers -= 1
+        if self._subscribers == 0 and not self.done:
+            loop = asyncio.get_running_loop()
+            self._abandon_timer = loop.call_later(self.abandon_after, self._abandon)
+    
+    def _abandon(self) -> None:
+        self._abandon_timer = None
+        if self._subscribers == 0 and not self.done and self.task is not None:
+            self.abandoned = True
+            self.task.cancel()
+    
+    def _cancel_abandon_timer(self) -> None:
+        if self._abandon_timer is not None:
+            self._abandon_timer.cancel()
+            self._abandon_timer = None
+
+
+class DeltaCoalescer:
+    """
+    Merges text deltas into fewer, larger delta events.
+    
+    Text is held until `max_chars` characters are pending or `window_ms`
+    has passed since the first pending character, then appended to the
+    stream as one delta. A window of 0 passes every delta through.
+    """
+    
+    def __init__(self, stream: GenerationStream, window_ms: int = 30, max_chars: int = 64):
+        self.stream = stream
+        self.window_ms = window_ms
+        self.max_chars = max_chars
+        self.cursor = 0
+        self._pending: List[str] = []
+        self._pending_chars = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+    
+    def add(self, text: str) -> None:
+        self._pending.append(text)
+        self._pending_chars += len(text)
+        self.cursor += len(text)
+        if self.window_ms <= 0 or self._pending_chars >= self.max_chars:
+            self.flush()
+        elif self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.window_ms / 1000, self.flush)
+    
+    def flush(self) -> None:
+        """Append pending text to the stream now."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        text = self._pending[0] if len(self._pending) == 1 else "".join(self._pending)
+        self._pending.clear()
+        self._pending_chars = 0
+        self.stream.append("delta", {"cursor": self.cursor, "text": text})
+
+
+class _Entry:
+    def __init__(self, fingerprint: str, task: asyncio.Future, stream: Optional[GenerationStream]):
+        self.fingerprint = fingerprint
+        self.task = task
+        self.stream = stream
+        self.created_at = time.monotonic()
+
+
+class GenerationRegistry:
+    """
+    In-flight and recently completed generations keyed by (uid, request id).
+    
+    A retried request with the same X-Request-Id shares the first request's
+    generation instead of starting another one: `/send` retries await the
+    same result, and `/send_stream` retries reattach to the same event
+    buffer. Generations run as their own tasks, so they are not cancelled
+    when the client that started them goes away, only once no client has
+    been connected to a stream for `abandon_after_seconds`. Failed and
+    cancelled generations are dropped so a retry runs again. Entries are
+    kept for `ttl_seconds`.
+    """
+    
+    def __init__(
+        self,
+        ttl_seconds: int = 900,
+        max_entries: int = 10000,
+        abandon_after_seconds: float = 5,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.abandon_after_seconds = abandon_after_seconds
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        # generation id -> (uid, request id) of streamed generations
+        self._generations: Dict[str, Tuple[str, str]] = {}
+        self._stats = {
+            "started": 0,
+            "reattached": 0,
+            "resumed": 0,
+            "conflicts": 0,
+            "cancelled": 0,
+        }
+    
+    def run(
+        self,
+        uid: str,
+        request_id: str,
+        fingerprint: str,
+        factory: Callable[[], Awaitable],
+    ) -> Awaitable:
+        """
+        Start `factory()` for this request, or join the existing run.
+        
+        Raises:
+            IdempotencyConflictError: If the request id was used for a different request
+        """
+        entry = self._lookup(uid, request_id, fingerprint)
+        if entry is None:
+            task = asyncio.ensure_future(factory())
+            entry = self._add(uid, request_id, fingerprint, task, None)
+            task.add_done_callback(lambda t: self._finish_run(uid, request_id, entry))
+        # Callers that go away do not cancel the shared generation
+        return asyncio.shield(entry.task)
+    
+    def stream(
+        self,
+        uid: str,
+        request_id: str,
+        fingerprint: str,
+        generation_id: str,
+        producer: Callable[[GenerationStream], Awaitable[None]],
+    ) -> GenerationStream:
+        """
+        Start `producer(stream)` for this request, or return the existing stream.
+        
+        Raises:
+            IdempotencyConflictError: If the request id was used for a different request
+        """
+        entry = self._lookup(uid, request_id, fingerprint)
+        if entry is None:
+            stream = GenerationStream(generation_id, self.abandon_after_seconds)
+            task = asyncio.ensure_future(producer(stream))
+            stream.task = task
+            entry = self._add(uid, request_id, fingerprint, task, stream)
+            self._generations[generation_id] = (uid, request_id)
+            task.add_done_callback(lambda t: self._finish_stream(uid, request_id, entry))
+        return entry.stream
+    
+    def find_stream(self, uid: str, generation_id: str) -> Optional[GenerationStream]:
+        """The user's buffered stream for `generation_id`, if it is still kept."""
+        self._purge()
+        key = self._generations.get(generation_id)
+        if key is None or key[0] != uid:
+            return None
+        self._stats["resumed"] += 1
+        return self._entries[key].stream
+    
+    def stats(self) -> Dict:
+        """Started/reattached/resumed/cancelled counters and current size."""
+        return {**self._stats, "size": len(self._entries)}
+    
+    @staticmethod
+    def fingerprint(*parts: str) -> str:
+        """Digest identifying the request body behind a request id."""
+        return hashlib.sha256("\x00".join(parts).encode()).hexdigest()
+    
+    def _lookup(self, uid: str, request_id: str, fingerprint: str) -> Optional[_Entry]:
+        self._purge()
+        entry = self._entries.get((uid, request_id))
+        if entry is None:
+            return None
+        if entry.fingerprint != fingerprint:
+            self._stats["conflicts"] += 1
+            raise IdempotencyConflictError("X-Request-Id was already used for a different request")
+        self._stats["reattached"] += 1
+        return entry
+    
+    def _add(
+        self,
+        uid: str,
+        request_id: str,
+        fingerprint: str,
+        task: asyncio.Future,
+        stream: Optional[GenerationStream],
+    ) -> _Entry:
+        entry = _Entry(fingerprint, task, stream)
+        self._entries[(uid, request_id)] = entry
+        self._stats["started"] += 1
+        return entry
+    
+    def _drop(self, uid: str, request_id: str, entry: _Entry) -> None:
+        if self._entries.get((uid, request_id)) is entry:
+            self._remove((uid, request_id))
+    
+    def _finish_run(self, uid: str, request_id: str, entry: _Entry) -> None:
+        if entry.task.cancelled() or entry.task.exception() is not None:
+            self._drop(uid, request_id, entry)
+    
+    def _finish_stream(self, uid: str, request_id: str, entry: _Entry) -> None:
+        task = entry.task
+        failed = task.cancelled() or task.exception() is not None
+        if task.cancelled():
+            self._stats["cancelled"] += 1
+            if entry.stream.abandoned:
+                logger.info(
+                    "🛑 Cancelled generation for request %s: no client connected", request_id
+                )
+        elif failed:
+            logger.error("❌ Generation for request %s failed: %s", request_id, task.exception())
+        if not entry.stream.done:
+            entry.stream.finish(failed=True)
+        if entry.stream.failed:
+            self._drop(uid, request_id, entry)
+    
+    def _purge(self) -> None:
+        # Entries are in creation order, so expired ones are at the front
+        cutoff = time.monotonic() - self.ttl_seconds
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            expired = entry.created_at < cutoff and entry.task.done()
+            if not expired and len(self._entries) <= self.max_entries:
+                break
+            if not entry.task.done():
+                # Over capacity with only running generations left
+                break
+            self._remove(key)
+    
+    def _remove(self, key: Tuple[str, str]) -> None:
+        entry = self._entries.pop(key)
+        if entry.stream is not None:
+            self._generations.pop(entry.stream.generation_id, None)
+
+
+# Singleton
+_generation_registry: Optional[GenerationRegistry] = None
+
+
+def get_generation_registry() -> GenerationRegistry:
+    """Get generation registry singleton."""
+    global _generation_registry
+    if _generation_registry is None:
+        settings = get_settings()
+        _generation_registry = GenerationRegistry(
+            ttl_seconds=settings.idempotency_ttl_seconds,
+            max_entries=settings.idempotency_max_entries,
+            abandon_after_seconds=settings.stream_abandon_grace_seconds,
+        )
+    return _generation_registry
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from ..core.config import get_settings
+from ..core.redis_client import get_redis
+from ..repositories.firestore_repository import get_repository
+from .fact_index import get_fact_retriever
+from .llm_service import get_llm_service
+
+logger = logging.getLogger(__name__)
+
+
+# (dependency name, group, probe); the instance is ready when every group
+# has at least one healthy dependency
+_Probe = Tuple[str, str, Callable[[], Awaitable[None]]]
+
+
+class HealthChecker:
+    """
+    Readiness of this instance: its dependencies and its event loop.
+    
+    Probe results are cached for `cache_seconds`, and concurrent readiness
+    checks share one round of probes, so a load balancer polling every
+    worker does not turn into load on the dependencies. Each probe is cut
+    off after `probe_timeout_seconds`. LLM providers fail over to each
+    other, so one reachable provider is enough.
+    
+    A background task measures how late the event loop wakes up from a
+    short sleep; while that lag is above `max_loop_lag_ms` the instance is
+    not ready, so traffic moves to workers that can serve it.
+    """
+    
+    def __init__(
+        self,
+        cache_seconds: float = 5,
+        probe_timeout_seconds: float = 2,
+        max_loop_lag_ms: float = 500,
+        lag_interval_seconds: float = 0.5,
+    ):
+        self.cache_seconds = cache_seconds
+        self.probe_timeout_seconds = probe_timeout_seconds
+        self.max_loop_lag_ms = max_loop_lag_ms
+        self.lag_interval_seconds = lag_interval_seconds
+        self.loop_lag_ms = 0.0
+        self._checks: Optional[Dict[str, Dict]] = None
+        self._checked_at = 0.0
+        self._pending: Optional[asyncio.Future] = None
+        self._lag_task: Optional[asyncio.Task] = None
+    
+    def start(self) -> None:
+        """Start measuring event loop lag in the background."""
+        if self._lag_task is None and self.max_loop_lag_ms > 0:
+            self._lag_task = asyncio.ensure_future(self._measure_loop_lag())
+    
+    async def stop(self) -> None:
+        task, self._lag_task = self._lag_task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+    
+    async def readiness(self) -> Dict:
+        """Per-dependency results, the event loop lag and whether the instance is ready."""
+        checks = await self._cached_checks()
+        
+        groups: Dict[str, bool] = {}
+        for check in checks.values():
+            groups[check["group"]] = groups.get(check["group"], False) or check["ok"]
+        loop_ok = self.max_loop_lag_ms <= 0 or self.loop_lag_ms <= self.max_loop_lag_ms
+        
+        return {
+            "ready": all(groups.values()) and loop_ok,
+            "checks": {
+                name: {key: value for key, value in check.items() if key != "group"}
+                for name, check in checks.items()
+            },
+            "eventLoop": {"ok": loop_ok, "lagMs": round(self.loop_lag_ms, 1)},
+        }
+    
+    async def _cached_checks(self) -> Dict[str, Dict]:
+        if self._checks is not None and time.monotonic() - self._checked_at < self.cache_seconds:
+            return self._checks
+        if self._pending is None:
+            self._pending = asyncio.ensure_future(self._run_checks())
+            self._pending.add_done_callback(self._finish_checks)
+        return await asyncio.shield(self._pending)
+    
+    def _finish_checks(self, future: asyncio.Future) -> None:
+        self._pending = None
+        if not future.cancelled() and future.exception() is None:
+            self._checks = future.result()
+            self._checked_at = time.monotonic()
+    
+    async def _run_checks(self) -> Dict[str, Dict]:
+        probes = self._probes()
+        results = await asyncio.gather(*(self._check(probe) for _, _, probe in probes))
+        checks = {}
+        for (name, group, _), result in zip(probes, results):
+            checks[name] = {"group": group, **result}
+            if not result["ok"]:
+                logger.warning("⚠️ Readiness probe %s failed: %s", name, result["error"])
+        return checks
+    
+    async def _check(self, probe: Callable[[], Awaitable[None]]) -> Dict:
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(probe(), self.probe_timeout_seconds)
+            error = None
+        except asyncio.TimeoutError:
+            error = f"timed out after {self.probe_timeout_seconds}s"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        latency_ms = round((time.perf_counter() - started) * 1000, 1)
+        result = {"ok": error is None, "latencyMs": latency_ms}
+        if error is not None:
+            result["error"] = error
+        return result
+    
+    def _probes(self) -> List[_Probe]:
+        """Probes for the dependencies this instance is configured to use."""
+        settings = get_settings()
+        probes: List[_Probe] = [("firestore", "firestore", lambda: get_repository().ping())]
+        
+        for provider in get_llm_service().router.providers:
+            probes.append((f"llm:{provider.name}", "llm", provider.client.models.list))
+        
+        if (
+            settings.rate_limit_backend == "redis"
+            or settings.job_queue_backend == "redis"
+            or settings.user_context_cache_redis_enabled
+        ):
+            probes.append(("redis", "redis", lambda: get_redis().ping()))
+        
+        if settings.fact_index_backend == "pgvector":
+            probes.append(("postgres", "postgres", lambda: get_fact_retriever().index.ping()))
+        return probes
+    
+    async def _measure_loop_lag(self) -> None:
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.lag_interval_seconds)
+            lag_ms = (time.monotonic() - started - self.lag_interval_seconds) * 1000
+            self.loop_lag_ms = max(lag_ms, 0.0)
+
+
+# Singleton
+_health_checker: Optional[HealthChecker] = None
+
+
+def get_health_checker() -> HealthChecker:
+    """Get health checker singleton."""
+    global _health_checker
+    if _health_checker is None:
+        settings = get_settings()
+        _health_checker = HealthChecker(
+            cache_seconds=settings.health_cache_seconds,
+            probe_timeout_seconds=settings.health_probe_timeout_seconds,
+            max_loop_lag_ms=settings.health_max_loop_lag_ms,
+        )
+    return _health_checker
@@ -0,0 +1,533 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from redis.exceptions import WatchError
+
+from ..core.config import get_settings
+from ..core.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+JobHandler = Callable[[Dict], Awaitable[Any]]
+
+# Merges a new payload into a queued one; returns None if they can't be merged
+JobMerger = Callable[[Dict, Dict], Optional[Dict]]
+
+# Pause before retrying a job whose key is busy, and slack on key leases
+_DEFER_DELAY_SECONDS = 0.5
+_LEASE_MARGIN_SECONDS = 30
+
+# Pause before using the backend again after it failed
+_BACKEND_RETRY_SECONDS = 1
+
+# How often running jobs are checked for an expired lease, and how many
+# times a job is run before a worker dying during it fails the job
+_REAP_INTERVAL_SECONDS = 5
+_MAX_ATTEMPTS = 3
+
+
+@dataclass
+class Job:
+    """A unit of background work and its outcome."""
+    kind: str
+    payload: Dict
+    uid: str
+    key: Optional[str] = None
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    status: str = "queued"  # queued, running, succeeded, failed
+    attempts: int = 0
+    result: Any = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    
+    def to_response(self) -> Dict:
+        """Public view of the job for the status endpoint."""
+        return {
+            "jobId": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "createdAt": int(self.created_at * 1000),
+            "updatedAt": int(self.updated_at * 1000),
+        }
+
+
+class InProcessJobBackend:
+    """Job storage and queue in this process; for tests and local runs."""
+    
+    def __init__(self, max_finished_jobs: int = 10000):
+        self.max_finished_jobs = max_finished_jobs
+        self._jobs: Dict[str, Job] = {}
+        self._finished: "OrderedDict[str, None]" = OrderedDict()
+        self._pending: Dict[str, str] = {}
+        self._leases: set = set()
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+    
+    async def put(self, job: Job) -> None:
+        self._jobs[job.id] = job
+        if job.key:
+            self._pending[job.key] = job.id
+        self._queue.put_nowait(job.id)
+    
+    async def requeue(self, job: Job) -> None:
+        job.status = "queued"
+        job.attempts -= 1
+        if job.key:
+            self._pending.setdefault(job.key, job.id)
+        self._queue.put_nowait(job.id)
+    
+    async def take(self, lease_seconds: Callable[[Job], float]) -> Job:
+        # Running jobs die with the process, so their leases are not tracked
+        while True:
+            job = self._jobs.get(await self._queue.get())
+            if job is None or job.status != "queued":
+                continue
+            if job.key and self._pending.get(job.key) == job.id:
+                del self._pending[job.key]
+            job.status = "running"
+            job.attempts += 1
+            job.updated_at = time.time()
+            return job
+    
+    async def coalesce(self, key: str, payload: Dict, merge: JobMerger) -> Optional[Job]:
+        job = self._jobs.get(self._pending.get(key, ""))
+        if job is None or job.status != "queued":
+            return None
+        merged = merge(job.payload, payload)
+        if merged is None:
+            return None
+        job.payload = merged
+        job.updated_at = time.time()
+        return job
+    
+    async def acquire(self, key: str, ttl_seconds: float) -> bool:
+        if key in self._leases:
+            return False
+        self._leases.add(key)
+        return True
+    
+    async def release(self, key: str) -> None:
+        self._leases.discard(key)
+    
+    async def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+    
+    async def save(self, job: Job) -> None:
+        self._jobs[job.id] = job
+        if job.status in ("succeeded", "failed"):
+            self._finished[job.id] = None
+            while len(self._finished) > self.max_finished_jobs:
+                old_id, _ = self._finished.popitem(last=False)
+                self._jobs.pop(old_id, None)
+    
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+
+class RedisJobBackend:
+    """
+    Job storage and queue in Redis, shared by all instances.
+    
+    Jobs are JSON documents under `job:{id}`; queued ids live in one list.
+    Claiming a job and merging into a queued job both run as optimistic
+    WATCH transactions on the job document, so a merge can never land on a
+    job a worker has already picked up.
+    
+    A claimed job is leased until its timeout plus a margin, tracked in a
+    sorted set. If the instance running it dies, workers find the expired
+    lease and queue the job again, up to `_MAX_ATTEMPTS` runs.
+    """
+    
+    _QUEUE_KEY = "jobs:queue"
+    _RUNNING_KEY = "jobs:running"
+    
+    def __init__(self, result_ttl_seconds: int = 86400):
+        self.result_ttl_seconds = result_ttl_seconds
+        self._next_reap = 0.0
+    
+    @staticmethod
+    def _job_key(job_id: str) -> str:
+        return f"job:{job_id}"
+    
+    @staticmethod
+    def _pending_key(key: str) -> str:
+        return f"jobs:pending:{key}"
+    
+    @staticmethod
+    def _lease_key(key: str) -> str:
+        return f"jobs:lease:{key}"
+    
+    @staticmethod
+    def _dump(job: Job) -> str:
+        return json.dumps(asdict(job))
+    
+    @staticmethod
+    def _load(raw: Optional[str]) -> Optional[Job]:
+        return Job(**json.loads(raw)) if raw else None
+    
+    async def put(self, job: Job) -> None:
+        pipe = get_redis().pipeline(transaction=True)
+        pipe.set(self._job_key(job.id), self._dump(job), ex=self.result_ttl_seconds)
+        if job.key:
+            pipe.set(self._pending_key(job.key), job.id, ex=self.result_ttl_seconds)
+        pipe.rpush(self._QUEUE_KEY, job.id)
+        await pipe.execute()
+    
+    async def requeue(self, job: Job) -> None:
+        # A deferred job did not run, so its claim is not an attempt
+        job.status = "queued"
+        job.attempts -= 1
+        pipe = get_redis().pipeline(transaction=True)
+        self._queue_again(pipe, job)
+        await pipe.execute()
+    
+    def _queue_again(self, pipe, job: Job) -> None:
+        pipe.set(self._job_key(job.id), self._dump(job), ex=self.result_ttl_seconds)
+        if job.key:
+            pipe.set(self._pending_key(job.key), job.id, ex=self.result_ttl_seconds, nx=True)
+        pipe.zrem(self._RUNNING_KEY, job.id)
+        pipe.rpush(self._QUEUE_KEY, job.id)
+    
+    async def take(self, lease_seconds: Callable[[Job], float]) -> Job:
+        redis = get_redis()
+        while True:
+            if time.time() >= self._next_reap:
+                self._next_reap = time.time() + _REAP_INTERVAL_SECONDS
+                await self.reap_expired()
+            popped = await redis.blpop([self._QUEUE_KEY], timeout=_REAP_INTERVAL_SECONDS)
+            if popped is None:
+                continue
+            job = await self._claim(popped[1], lease_seconds)
+            if job is not None:
+                return job
+    
+    async def reap_expired(self) -> int:
+        """Queue again, or fail, running jobs whose lease expired; returns how many."""
+        expired = await get_redis().zrangebyscore(self._RUNNING_KEY, 0, time.time())
+        reaped = 0
+        for job_id in expired:
+            if await self._reap(job_id):
+                reaped += 1
+        return reaped
+    
+    async def _reap(self, job_id: str) -> bool:
+        job_key = self._job_key(job_id)
+        async with get_redis().pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(job_key)
+                job = self._load(await pipe.get(job_key))
+                pipe.multi()
+                if job is None or job.status != "running":
+                    pipe.zrem(self._RUNNING_KEY, job_id)
+                    await pipe.execute()
+                    return False
+                if job.attempts >= _MAX_ATTEMPTS:
+                    logger.error(
+                        "❌ Job %s (%s) lost its worker %d times", job.id, job.kind, job.attempts
+                    )
+                    job.status = "failed"
+                    job.error = "Worker stopped while running the job"
+                    job.updated_at = time.time()
+                    pipe.set(job_key, self._dump(job), ex=self.result_ttl_seconds)
+                    pipe.zrem(self._RUNNING_KEY, job_id)
+                else:
+                    logger.warning(
+                        "⚠️ Job %s (%s) lost its worker, queueing it again", job.id, job.kind
+                    )
+                    job.status = "queued"
+                    job.updated_at = time.time()
+                    self._queue_again(pipe, job)
+                await pipe.execute()
+                return True
+            except WatchError:
+                # Finished or reaped by another instance meanwhile
+                return False
+    
+    async def _claim(
+        self,
+        job_id: str,
+        lease_seconds: Callable[[Job], float],
+    ) -> Optional[Job]:
+        job_key = self._job_key(job_id)
+        async with get_redis().pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(job_key)
+                job = self._load(await pipe.get(job_key))
+                if job is None or job.status != "queued":
+                    return None
+                pending_key = self._pending_key(job.key) if job.key else None
+                if pending_key:
+                    await pipe.watch(pending_key)
+                    owns_pending = await pipe.get(pending_key) == job.id
+                job.status = "running"
+                job.attempts += 1
+                job.updated_at = time.time()
+                pipe.multi()
+                pipe.set(job_key, self._dump(job), ex=self.result_ttl_seconds)
+                pipe.zadd(self._RUNNING_KEY, {job.id: job.updated_at + lease_seconds(job)})
+                if pending_key and owns_pending:
+                    pipe.delete(pending_key)
+                await pipe.execute()
+                return job
+            except WatchError:
+                # Only this worker claims a popped id, so the job was merged
+                # into concurrently; it is still queued, so try again
+                return await self._claim(job_id, lease_seconds)
+    
+    async def coalesce(self, key: str, payload: Dict, merge: JobMerger) -> Optional[Job]:
+        redis = get_redis()
+        job_id = await redis.get(self._pending_key(key))
+        if job_id is None:
+            return None
+        
+        job_key = self._job_key(job_id)
+        async with redis.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(job_key)
+                job = self._load(await pipe.get(job_key))
+                if job is None or job.status != "queued":
+                    return None
+                merged = merge(job.payload, payload)
+                if merged is None:
+                    return None
+                job.payload = merged
+                job.updated_at = time.time()
+                pipe.multi()
+                pipe.set(job_key, self._dump(job), ex=self.result_ttl_seconds)
+                await pipe.execute()
+                return job
+            except WatchError:
+                # Claimed or merged into concurrently; queue a new job instead
+                return None
+    
+    async def acquire(self, key: str, ttl_seconds: float) -> bool:
+        # The TTL frees the lease if the instance holding it dies
+        acquired = await get_redis().set(
+            self._lease_key(key), "1", ex=max(1, int(ttl_seconds)), nx=True
+        )
+        return bool(acquired)
+    
+    async def release(self, key: str) -> None:
+        await get_redis().delete(self._lease_key(key))
+    
+    async def get(self, job_id: str) -> Optional[Job]:
+        return self._load(await get_redis().get(self._job_key(job_id)))
+    
+    async def save(self, job: Job) -> None:
+        pipe = get_redis().pipeline(transaction=True)
+        pipe.set(self._job_key(job.id), self._dump(job), ex=self.result_ttl_seconds)
+        if job.status in ("succeeded", "failed"):
+            pipe.zrem(self._RUNNING_KEY, job.id)
+        await pipe.execute()
+    
+    def depth(self) -> Optional[int]:
+        # Would need a round trip; not tracked for the shared queue
+        return None
+
+
+class JobQueue:
+    """
+    Background jobs run on a bounded pool of worker tasks.
+    
+    Handlers are registered per job kind. Jobs sharing a `key` run one at
+    a time, and a job submitted with a key is merged into a still-queued
+    job with the same key when the kind's merger accepts it, so bursts of
+    overlapping requests do the work once.
+    """
+    
+    def __init__(self, backend, workers: int = 4, job_timeout_seconds: float = 120):
+        self.backend = backend
+        self.workers = workers
+        self.job_timeout_seconds = job_timeout_seconds
+        self._handlers: Dict[str, JobHandler] = {}
+        self._mergers: Dict[str, JobMerger] = {}
+        self._timeouts: Dict[str, float] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._stats = {
+            "submitted": 0,
+            "coalesced": 0,
+            "deferred": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "running": 0,
+        }
+    
+    def register(
+        self,
+        kind: str,
+        handler: JobHandler,
+        merge: Optional[JobMerger] = None,
+        timeout_seconds: Optional[float] = None,
+    ) -> None:
+        """Register the handler (and optional merger and timeout) for a job kind."""
+        self._handlers[kind] = handler
+        if merge is not None:
+            self._mergers[kind] = merge
+        if timeout_seconds is not None:
+            self._timeouts[kind] = timeout_seconds
+    
+    async def submit(
+        self,
+        kind: str,
+        payload: Dict,
+        uid: str,
+        key: Optional[str] = None,
+    ) -> Job:
+        """Queue a job, or merge it into a queued job with the same key."""
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        self.start()
+        
+        merge = self._mergers.get(kind)
+        if key and merge is not None:
+            job = await self.backend.coalesce(key, payload, merge)
+            if job is not None:
+                self._stats["coalesced"] += 1
+                return job
+        
+        job = Job(kind=kind, payload=payload, uid=uid, key=key)
+        await self.backend.put(job)
+        self._stats["submitted"] += 1
+        return job
+    
+    async def get(self, job_id: str) -> Optional[Job]:
+        """Look up a job by id."""
+        return await self.backend.get(job_id)
+    
+    def start(self) -> None:
+        """Start the worker pool if it is not running yet."""
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.ensure_future(self._worker()) for _ in range(self.workers)
+        ]
+    
+    async def stop(self) -> None:
+        """Stop the worker pool; running jobs are cancelled."""
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    def stats(self) -> Dict:
+        """Job counters and queue depth."""
+        return {
+            **self._stats,
+            "workers": len(self._tasks),
+            "depth": self.backend.depth(),
+        }
+    
+    async def _worker(self) -> None:
+        while True:
+            try:
+                job = await self.backend.take(self._lease_seconds)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("⚠️ Job queue unavailable: %s", e)
+                await asyncio.sleep(_BACKEND_RETRY_SECONDS)
+                continue
+            
+            if job.key and not await self._acquire(job):
+                continue
+            
+            self._stats["running"] += 1
+            try:
+                job.result = await asyncio.wait_for(
+                    self._handlers[job.kind](job.payload),
+                    timeout=self._timeout(job.kind),
+                )
+                job.status = "succeeded"
+            except asyncio.CancelledError:
+                job.status = "failed"
+                job.error = "Cancelled"
+                await asyncio.shield(self._save(job))
+                raise
+            except Exception as e:
+                logger.error("❌ Job %s (%s) failed: %s", job.id, job.kind, e)
+                job.status = "failed"
+                job.error = str(e) or type(e).__name__
+            finally:
+                self._stats["running"] -= 1
+                if job.key:
+                    await asyncio.shield(self._release(job.key))
+            
+            self._stats[job.status] += 1
+            await self._save(job)
+    
+    async def _acquire(self, job: Job) -> bool:
+        """
+        Take the job's key lease, or put the job back behind the running one.
+        
+        Backend errors are logged rather than raised, so they never end the
+        worker; a job that cannot be put back is recorded as failed.
+        """
+        try:
+            if await self.backend.acquire(job.key, self._lease_seconds(job)):
+                return True
+            self._stats["deferred"] += 1
+            delay = _DEFER_DELAY_SECONDS
+        except Exception as e:
+            logger.warning("⚠️ Failed to lease key of job %s: %s", job.id, e)
+            delay = _BACKEND_RETRY_SECONDS
+        
+        try:
+            await self.backend.requeue(job)
+        except Exception as e:
+            logger.error("❌ Failed to requeue job %s (%s): %s", job.id, job.kind, e)
+            job.status = "failed"
+            job.error = f"Could not be requeued: {e}"
+            self._stats["failed"] += 1
+            await self._save(job)
+        await asyncio.sleep(delay)
+        return False
+    
+    async def _release(self, key: str) -> None:
+        # An unreleased lease expires on its own after the job's timeout
+        try:
+            await self.backend.release(key)
+        except Exception as e:
+            logger.warning("⚠️ Failed to release job key %s: %s", key, e)
+    
+    def _timeout(self, kind: str) -> float:
+        return self._timeouts.get(kind, self.job_timeout_seconds)
+    
+    def _lease_seconds(self, job: Job) -> float:
+        return self._timeout(job.kind) + _LEASE_MARGIN_SECONDS
+    
+    async def _save(self, job: Job) -> None:
+        job.updated_at = time.time()
+        try:
+            await self.backend.save(job)
+        except Exception as e:
+            logger.warning("⚠️ Failed to save job %s: %s", job.id, e)
+
+
+# Singleton
+_job_queue: Optional[JobQueue] = None
+
+
+def get_job_queue() -> JobQueue:
+    """Get job queue singleton."""
+    global _job_queue
+    if _job_queue is None:
+        settings = get_settings()
+        if settings.job_queue_backend == "redis":
+            backend = RedisJobBackend(result_ttl_seconds=settings.job_result_ttl_seconds)
+        else:
+            backend = InProcessJobBackend()
+        _job_queue = JobQueue(
+            backend,
+            workers=settings.job_queue_workers,
+            job_timeout_seconds=settings.job_timeout_seconds,
+        )
+    return _job_queue
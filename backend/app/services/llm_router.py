@@ -0,0 +1,335 @@
+import asyncio
+import logging
+import time
+from contextlib import AsyncExitStack
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+import openai
+
+from ..core.config import Settings
+from .llm_transport import LLMTransport
+
+logger = logging.getLogger(__name__)
+
+
+# Weight of the newest sample in the rolling latency and error averages
+_EWMA_ALPHA = 0.2
+
+# Errors in a row after which a provider is skipped for a cooldown
+_FAILURES_TO_COOL_DOWN = 3
+
+# Client error statuses that can still succeed on another provider
+_TRANSIENT_CLIENT_STATUS = {408, 409, 429}
+
+
+def _is_provider_failure(error: BaseException) -> bool:
+    """
+    Whether an error is the provider's fault rather than the request's.
+    
+    A bad request (invalid parameters, too many tokens, bad credentials)
+    would fail on every provider, so it is neither failed over nor counted
+    against the provider.
+    """
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in _TRANSIENT_CLIENT_STATUS or error.status_code >= 500
+    return isinstance(error, (openai.APIError, httpx.TransportError, TimeoutError))
+
+
+@dataclass
+class ProviderStats:
+    """Rolling latency and error rate of one provider."""
+    latency: Optional[float] = None  # seconds to first token (streams) or response
+    error_rate: float = 0.0
+    requests: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    cooldown_until: float = 0.0
+    
+    def record_success(self, latency: float) -> None:
+        self.requests += 1
+        self.consecutive_failures = 0
+        self.error_rate *= 1 - _EWMA_ALPHA
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += _EWMA_ALPHA * (latency - self.latency)
+    
+    def record_failure(self, cooldown_seconds: float) -> None:
+        self.requests += 1
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.error_rate += _EWMA_ALPHA * (1 - self.error_rate)
+        if self.consecutive_failures >= _FAILURES_TO_COOL_DOWN:
+            self.cooldown_until = time.monotonic() + cooldown_seconds
+    
+    @property
+    def cooling_down(self) -> bool:
+        return self.cooldown_until > time.monotonic()
+    
+    @property
+    def score(self) -> float:
+        """Expected latency penalized by error rate; lower is better."""
+        return (self.latency or 0.0) * (1 + 4 * self.error_rate)
+
+
+@dataclass
+class LLMProvider:
+    """One OpenAI-compatible chat backend."""
+    name: str
+    client: openai.AsyncOpenAI
+    transport: LLMTransport
+    model: str
+    vision_model: str
+    stats: ProviderStats = field(default_factory=ProviderStats)
+    
+    def chat_model(self, has_images: bool) -> str:
+        return self.vision_model if has_images else self.model
+
+
+@dataclass
+class _OpenStream:
+    provider: LLMProvider
+    stack: AsyncExitStack
+    chunks: AsyncIterator[Any]
+    first_chunk: Any  # None if the stream was empty
+
+
+class AllProvidersFailedError(Exception):
+    """Every provider failed the request."""
+
+
+class LLMRouter:
+    """
+    Routes chat requests across OpenAI-compatible providers.
+    
+    Each request goes to the provider with the best rolling latency and
+    error rate; providers that have not served a request yet are tried in
+    configured order after the measured ones, and providers that failed
+    several times in a row are skipped for `cooldown_seconds`. A request
+    that fails before producing a response (or, for streams, before the
+    first chunk) with a connection error, timeout, 429 or 5xx fails over to
+    the next provider; other client errors are raised straight away. With
+    `hedge_after_seconds` set, a stream whose first chunk is slower than
+    that is raced against the next provider and the loser is cancelled.
+    """
+    
+    def __init__(
+        self,
+        providers: List[LLMProvider],
+        hedge_after_seconds: float = 0,
+        cooldown_seconds: float = 30,
+    ):
+        self.providers = providers
+        self.hedge_after_seconds = hedge_after_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self._stats = {
+            "failovers": 0,
+            "hedged": 0,
+            "hedge_wins": 0,
+        }
+    
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "LLMRouter":
+        providers = []
+        for config in [
+            {
+                "name": "openai",
+                "api_key": settings.openai_api_key,
+                "model": settings.openai_model,
+                "vision_model": settings.openai_vision_model,
+            },
+            *settings.llm_fallback_providers,
+        ]:
+            transport = LLMTransport.from_settings(settings)
+            model = config.get("model", settings.openai_model)
+            providers.append(LLMProvider(
+                name=config.get("name", config.get("base_url", "openai")),
+                client=transport.openai_client(config.get("api_key", ""), config.get("base_url")),
+                transport=transport,
+                model=model,
+                vision_model=config.get("vision_model", model),
+            ))
+        return cls(
+            providers,
+            hedge_after_seconds=settings.llm_hedge_after_ms / 1000,
+            cooldown_seconds=settings.llm_provider_cooldown_seconds,
+        )
+    
+    @property
+    def primary(self) -> LLMProvider:
+        return self.providers[0]
+    
+    def ranked(self) -> List[LLMProvider]:
+        """Providers in the order they should be tried."""
+        return sorted(
+            self.providers,
+            key=lambda p: (
+                p.stats.cooling_down,
+                p.stats.latency is None,
+                p.stats.score,
+                self.providers.index(p),
+            ),
+        )
+    
+    async def complete(
+        self,
+        request: Callable[[LLMProvider], Awaitable[Any]],
+    ) -> Tuple[Any, LLMProvider]:
+        """Run `request(provider)` on the best provider, failing over on errors."""
+        errors: List[Exception] = []
+        for attempt, provider in enumerate(self.ranked()):
+            if attempt:
+                self._stats["failovers"] += 1
+            started = time.monotonic()
+            try:
+                response = await provider.transport.call(lambda: request(provider))
+            except Exception as e:
+                if not _is_provider_failure(e):
+                    raise
+                self._record_failure(provider, e)
+                errors.append(e)
+                continue
+            provider.stats.record_success(time.monotonic() - started)
+            return response, provider
+        raise self._all_failed(errors)
+    
+    async def stream(
+        self,
+        request: Callable[[LLMProvider], Awaitable[Any]],
+    ) -> AsyncIterator[Tuple[LLMProvider, Any]]:
+        """
+        Stream `request(provider)` from the best provider.
+        
+        Yields `(provider, chunk)`. Failover and hedging only happen before
+        the first chunk; after that the stream is committed to its provider.
+        """
+        opened = await self._open_first(request)
+        try:
+            if opened.first_chunk is not None:
+                yield opened.provider, opened.first_chunk
+            async for chunk in opened.chunks:
+                yield opened.provider, chunk
+        except Exception as e:
+            if _is_provider_failure(e):
+                self._record_failure(opened.provider, e)
+            raise
+        finally:
+            await opened.stack.aclose()
+    
+    async def _open_first(self, request: Callable[[LLMProvider], Awaitable[Any]]) -> _OpenStream:
+        candidates = self.ranked()
+        launched: List[LLMProvider] = []
+        pending: Dict[asyncio.Task, LLMProvider] = {}
+        errors: List[Exception] = []
+        
+        def launch() -> None:
+            provider = candidates[len(launched)]
+            launched.append(provider)
+            pending[asyncio.ensure_future(self._open(provider, request))] = provider
+        
+        launch()
+        try:
+            while pending:
+                can_hedge = (
+                    self.hedge_after_seconds > 0
+                    and len(pending) == 1
+                    and len(launched) < len(candidates)
+                )
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=self.hedge_after_seconds if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    self._stats["hedged"] += 1
+                    launch()
+                    continue
+                
+                winner: Optional[_OpenStream] = None
+                for task in done:
+                    provider = pending.pop(task)
+                    if task.exception() is not None:
+                        if not _is_provider_failure(task.exception()):
+                            raise task.exception()
+                        self._record_failure(provider, task.exception())
+                        errors.append(task.exception())
+                    elif winner is None:
+                        winner = task.result()
+                    else:
+                        await task.result().stack.aclose()
+                if winner is not None:
+                    if winner.provider is not launched[0] and not errors:
+                        self._stats["hedge_wins"] += 1
+                    return winner
+                if not pending and len(launched) < len(candidates):
+                    self._stats["failovers"] += 1
+                    launch()
+            raise self._all_failed(errors)
+        finally:
+            await self._discard(pending)
+    
+    async def _open(
+        self,
+        provider: LLMProvider,
+        request: Callable[[LLMProvider], Awaitable[Any]],
+    ) -> _OpenStream:
+        """Start a stream and wait for its first chunk."""
+        started = time.monotonic()
+        stack = AsyncExitStack()
+        try:
+            stream = await stack.enter_async_context(
+                provider.transport.hold(lambda: request(provider))
+            )
+            stack.push_async_callback(stream.close)
+            chunks = stream.__aiter__()
+            try:
+                first_chunk = await chunks.__anext__()
+            except StopAsyncIteration:
+                first_chunk = None
+        except BaseException:
+            await stack.aclose()
+            raise
+        provider.stats.record_success(time.monotonic() - started)
+        return _OpenStream(provider, stack, chunks, first_chunk)
+    
+    @staticmethod
+    async def _discard(pending: Dict[asyncio.Task, LLMProvider]) -> None:
+        # Cancel the losing attempts and close any that opened anyway
+        for task in pending:
+            task.cancel()
+        for result in await asyncio.gather(*pending, return_exceptions=True):
+            if isinstance(result, _OpenStream):
+                await result.stack.aclose()
+    
+    def _record_failure(self, provider: LLMProvider, error: BaseException) -> None:
+        provider.stats.record_failure(self.cooldown_seconds)
+        logger.warning("⚠️ LLM provider %s failed: %s", provider.name, error)
+    
+    @staticmethod
+    def _all_failed(errors: List[Exception]) -> Exception:
+        if len(errors) == 1:
+            return errors[0]
+        return AllProvidersFailedError("; ".join(str(e) for e in errors))
+    
+    def stats(self) -> Dict:
+        """Router counters and per-provider latency, error rate and transport stats."""
+        return {
+            **self._stats,
+            "providers": {
+                p.name: {
+                    "latency_seconds": p.stats.latency,
+                    "error_rate": p.stats.error_rate,
+                    "requests": p.stats.requests,
+                    "failures": p.stats.failures,
+                    "cooling_down": p.stats.cooling_down,
+                    **p.transport.stats(),
+                }
+                for p in self.providers
+            },
+        }
+    
+    async def close(self) -> None:
+        for provider in self.providers:
+            await provider.transport.close()
@@ -1,10 +1,46 @@
+from dataclasses import dataclass
 from typing import AsyncGenerator, List, Optional, Dict
-from openai import AsyncOpenAI
 import json
+import logging
+import time
 
 from ..core.config import get_settings
+from ..core.tracing import span, start_span
 from ..models.schemas import UserPreferences, Fact, ThreadSummary
+from .llm_router import LLMRouter
 from .persona_prompts import build_full_system_prompt
+from .request_builder import ChatRequest, GenerationPolicy, RequestBuilder
+from .token_budget import ContextBudget
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class GenerationUsage:
+    """Token usage, finish reason and timing of one generation."""
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+    finish_reason: str = "stop"
+    model: Optional[str] = None
+    latency_ms: int = 0  # request start to last token
+    first_token_ms: Optional[int] = None  # request start to first token (streams)
+    
+    def record(self, usage, model: str) -> None:
+        self.model = model
+        if usage is not None:
+            self.prompt_tokens = usage.prompt_tokens
+            self.completion_tokens = usage.completion_tokens
+            self.total_tokens = usage.total_tokens
+
+
+def _record_generation(generation_span, provider: str, model: str, usage) -> None:
+    generation_span.set("llm.provider", provider)
+    generation_span.set("llm.model", model)
+    if usage is not None:
+        generation_span.set("llm.prompt_tokens", usage.prompt_tokens)
+        generation_span.set("llm.completion_tokens", usage.completion_tokens)
 
 
 class LLMService:
@@ -12,9 +48,39 @@ class LLMService:
     
     def __init__(self):
         settings = get_settings()
-        self.client = AsyncOpenAI(api_key=settings.openai_api_key)
+        self.router = LLMRouter.from_settings(settings)
+        # Embeddings always use the primary provider, so vectors stay comparable
+        self.transport = self.router.primary.transport
+        self.client = self.router.primary.client
         self.model = settings.openai_model
-        self.vision_model = settings.openai_vision_model
+        self.embedding_model = settings.openai_embedding_model
+        self.embedding_dimensions = settings.openai_embedding_dimensions
+        self.budget = ContextBudget(
+            total_tokens=settings.context_token_budget,
+            max_output_tokens=settings.llm_max_output_tokens,
+            facts_tokens=settings.context_facts_token_budget,
+            model=settings.openai_model,
+        )
+        default_policy = GenerationPolicy(
+            temperature=0.9,
+            max_tokens=settings.llm_max_output_tokens,
+        )
+        self.requests = RequestBuilder(
+            self.budget,
+            default_policy,
+            persona_policies={
+                # The budget reserves llm_max_output_tokens, so policies may only lower it
+                persona: GenerationPolicy(
+                    temperature=float(policy.get("temperature", default_policy.temperature)),
+                    max_tokens=min(
+                        int(policy.get("max_tokens", default_policy.max_tokens)),
+                        settings.llm_max_output_tokens,
+                    ),
+                )
+                for persona, policy in settings.llm_persona_policies.items()
+            },
+            max_cached_threads=settings.llm_history_cache_threads,
+        )
     
     def _build_system_prompt(
         self,
@@ -30,8 +96,11 @@ class LLMService:
     ) -> str:
         """Build the system prompt based on persona and user preferences."""
         
-        # Convert facts to dict format
-        facts_list = [{"key": f.key, "value": f.value, "status": f.status} for f in facts]
+        # Keep the most important facts that fit the facts budget
+        facts_list = [
+            {"key": f.key, "value": f.value, "status": f.status}
+            for f in self.budget.select_facts(facts)
+        ]
         
         # Convert summary to dict if exists
         summary_dict = None
@@ -48,7 +117,11 @@ class LLMService:
         # Use thread's custom name if provided, otherwise use user's preference
         persona_custom_name = custom_persona_name or preferences.custom_persona_name
         
-        print(f"📝 Building system prompt - persona: {preferences.selected_persona}, custom_name: {persona_custom_name}")
+        logger.debug(
+            "📝 Building system prompt - persona: %s, custom_name: %s",
+            preferences.selected_persona,
+            persona_custom_name,
+        )
         
         # Use new persona system
         return build_full_system_prompt(
@@ -64,6 +137,32 @@ class LLMService:
             companion_profile=companion_profile,
         )
     
+    def _build_request(
+        self,
+        messages: List[Dict],
+        user_name: str,
+        user_gender: Optional[str],
+        preferences: UserPreferences,
+        facts: List[Fact],
+        summary: Optional[ThreadSummary],
+        custom_persona_name: Optional[str],
+        user_age: Optional[int],
+        user_bio: Optional[str],
+        companion_profile: Optional[Dict],
+        thread_id: Optional[str],
+    ) -> ChatRequest:
+        """System prompt, budgeted history and sampling parameters for a turn."""
+        with span("llm.build_prompt", persona=preferences.selected_persona) as build_span:
+            system_prompt = self._build_system_prompt(
+                user_name, user_gender, preferences, facts, summary,
+                custom_persona_name, user_age, user_bio, companion_profile,
+            )
+            request = self.requests.build(
+                system_prompt, messages, preferences.selected_persona, thread_id
+            )
+            build_span.set("llm.messages", len(request.messages))
+        return request
+    
     async def generate(
         self,
         messages: List[Dict],
@@ -76,58 +175,43 @@ class LLMService:
         user_age: Optional[int] = None,
         user_bio: Optional[str] = None,
         companion_profile: Optional[Dict] = None,
+        usage: Optional[GenerationUsage] = None,
+        thread_id: Optional[str] = None,
     ) -> str:
         """
         Generate complete (non-streaming) response from LLM.
         Returns the full response text at once.
-        """
-        system_prompt = self._build_system_prompt(user_name, user_gender, preferences, facts, summary, custom_persona_name, user_age, user_bio, companion_profile)
-        
-        # Prepare messages for API
-        api_messages = [{"role": "system", "content": system_prompt}]
         
-        for msg in messages:
-            role = "assistant" if msg.get("role") == "assistant" else "user"
-            content = msg.get("content", "")
-            
-            # Handle images
-            attachments = msg.get("attachments", [])
-            if attachments:
-                print(f"🖼️ Processing {len(attachments)} attachments: {attachments}")
-                content_parts = []
-                if content:
-                    content_parts.append({"type": "text", "text": content})
-                for att in attachments:
-                    if att.get("kind") == "image" and att.get("downloadUrl"):
-                        print(f"✅ Adding image URL: {att['downloadUrl']}")
-                        content_parts.append({
-                            "type": "image_url",
-                            "image_url": {"url": att["downloadUrl"]},
-                        })
-                    else:
-                        print(f"❌ Skipping: kind={att.get('kind')}, hasUrl={bool(att.get('downloadUrl'))}")
-                print(f"📤 Content parts: {len(content_parts)} items")
-                api_messages.append({"role": role, "content": content_parts})
-            else:
-                api_messages.append({"role": role, "content": content})
-        
-        # Determine which model to use
-        has_images = any(
-            any(a.get("kind") == "image" for a in m.get("attachments", []))
-            for m in messages
+        If `usage` is given it is filled from the API usage fields.
+        """
+        request = self._build_request(
+            messages, user_name, user_gender, preferences, facts, summary,
+            custom_persona_name, user_age, user_bio, companion_profile, thread_id,
         )
-        model = self.vision_model if has_images else self.model
         
-        print(f"🤖 Using model: {model} (has_images={has_images})")
+        # Get complete response from the best available provider
+        started = time.perf_counter()
+        with span("llm.generate") as generate_span:
+            response, provider = await self.router.complete(
+                lambda p: p.client.chat.completions.create(
+                    model=p.chat_model(request.has_images),
+                    messages=request.messages,
+                    temperature=request.temperature,
+                    max_tokens=request.max_tokens,
+                )
+            )
+            model = provider.chat_model(request.has_images)
+            _record_generation(generate_span, provider.name, model, response.usage)
         
-        # Get complete response
-        response = await self.client.chat.completions.create(
-            model=model,
-            messages=api_messages,
-            temperature=0.9,
-            max_tokens=1024,
+        logger.debug(
+            "🤖 Used %s model: %s (has_images=%s)", provider.name, model, request.has_images
         )
         
+        if usage is not None:
+            usage.record(response.usage, model)
+            usage.finish_reason = response.choices[0].finish_reason or "stop"
+            usage.latency_ms = int((time.perf_counter() - started) * 1000)
+        
         return response.choices[0].message.content or ""
     
     async def generate_stream(
@@ -142,63 +226,60 @@ class LLMService:
         user_age: Optional[int] = None,
         user_bio: Optional[str] = None,
         companion_profile: Optional[Dict] = None,
+        usage: Optional[GenerationUsage] = None,
+        thread_id: Optional[str] = None,
     ) -> AsyncGenerator[str, None]:
         """
         Generate streaming response from LLM.
         
-        Yields text chunks as they are generated.
+        Yields text chunks as they are generated. If `usage` is given it is
+        filled from the usage chunk at the end of the stream.
         """
-        system_prompt = self._build_system_prompt(user_name, user_gender, preferences, facts, summary, custom_persona_name, user_age, user_bio, companion_profile)
-        
-        # Prepare messages for API
-        api_messages = [{"role": "system", "content": system_prompt}]
-        
-        for msg in messages:
-            role = "assistant" if msg.get("role") == "assistant" else "user"
-            content = msg.get("content", "")
-            
-            # Handle images
-            attachments = msg.get("attachments", [])
-            if attachments:
-                print(f"🖼️ [STREAM] Processing {len(attachments)} attachments: {attachments}")
-                content_parts = []
-                if content:
-                    content_parts.append({"type": "text", "text": content})
-                for att in attachments:
-                    if att.get("kind") == "image" and att.get("downloadUrl"):
-                        print(f"✅ [STREAM] Adding image URL: {att['downloadUrl']}")
-                        content_parts.append({
-                            "type": "image_url",
-                            "image_url": {"url": att["downloadUrl"]},
-                        })
-                    else:
-                        print(f"❌ [STREAM] Skipping: kind={att.get('kind')}, hasUrl={bool(att.get('downloadUrl'))}")
-                print(f"📤 [STREAM] Content parts: {len(content_parts)} items")
-                api_messages.append({"role": role, "content": content_parts})
-            else:
-                api_messages.append({"role": role, "content": content})
-        
-        # Determine which model to use
-        has_images = any(
-            any(a.get("kind") == "image" for a in m.get("attachments", []))
-            for m in messages
+        request = self._build_request(
+            messages, user_name, user_gender, preferences, facts, summary,
+            custom_persona_name, user_age, user_bio, companion_profile, thread_id,
         )
-        model = self.vision_model if has_images else self.model
-        
-        print(f"🤖 [STREAM] Using model: {model} (has_images={has_images})")
         
-        # Stream response
-        stream = await self.client.chat.completions.create(
-            model=model,
-            messages=api_messages,
+        # Stream from the best available provider; the router closes the
+        # upstream response if we stop reading early
+        chunks = self.router.stream(lambda p: p.client.chat.completions.create(
+            model=p.chat_model(request.has_images),
+            messages=request.messages,
             stream=True,
-            temperature=0.9,
-            max_tokens=1024,
-        )
+            stream_options={"include_usage": True},
+            temperature=request.temperature,
+            max_tokens=request.max_tokens,
+        ))
         
-        async for chunk in stream:
-            if chunk.choices and chunk.choices[0].delta.content:
-                yield chunk.choices[0].delta.content
+        # Not made current: it stays open across yields to the caller
+        stream_span = start_span("llm.generate_stream")
+        started = time.perf_counter()
+        first_token_ms = None
+        try:
+            async for provider, chunk in chunks:
+                if chunk.usage is not None:
+                    model = provider.chat_model(request.has_images)
+                    _record_generation(stream_span, provider.name, model, chunk.usage)
+                    if usage is not None:
+                        usage.record(chunk.usage, model)
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.finish_reason and usage is not None:
+                    usage.finish_reason = choice.finish_reason
+                if choice.delta.content:
+                    if first_token_ms is None:
+                        first_token_ms = int((time.perf_counter() - started) * 1000)
+                        stream_span.set("llm.time_to_first_token_ms", first_token_ms)
+                    yield choice.delta.content
+        except BaseException as e:
+            stream_span.end(error=e)
+            raise
+        finally:
+            stream_span.end()
+            if usage is not None:
+                usage.first_token_ms = first_token_ms
+                usage.latency_ms = int((time.perf_counter() - started) * 1000)
     
     async def extract_facts(
         self,
@@ -242,16 +323,16 @@ Return a JSON array of facts. Each fact should have:
 
 Only include genuinely new information. Return empty array if nothing new.
 Return ONLY the JSON array, no other text."""
-
-        response = await self.client.chat.completions.create(
-            model=self.model,
+        
+        response, _ = await self.router.complete(lambda p: p.client.chat.completions.create(
+            model=p.model,
             messages=[
                 {"role": "system", "content": "You are a fact extraction assistant. You analyze conversations and extract important facts about the user."},
                 {"role": "user", "content": prompt},
             ],
             temperature=0.3,
             max_tokens=1024,
-        )
+        ))
         
         try:
             content = response.choices[0].message.content.strip()
@@ -264,6 +345,69 @@ Return ONLY the JSON array, no other text."""
             return facts if isinstance(facts, list) else []
         except (json.JSONDecodeError, IndexError):
             return []
+    
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts for similarity search, in input order."""
+        response = await self.transport.call(lambda: self.client.embeddings.create(
+            model=self.embedding_model,
+            input=texts,
+            dimensions=self.embedding_dimensions,
+        ))
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+    
+    async def summarize_conversation(
+        self,
+        existing_summary: Optional[str],
+        messages: List[Dict],
+        max_tokens: int = 512,
+    ) -> str:
+        """
+        Fold a range of new messages into an existing rolling summary.
+        
+        Only the new messages are sent, together with the previous summary,
+        so the cost stays proportional to the range being folded.
+        """
+        messages_text = "\n".join([
+            f"{m.get('role', 'user')}: {m.get('content', '')}" for m in messages
+        ])
+        
+        prompt = f"""Update the running summary of a conversation between a user and their AI
+companion.
+
+CURRENT SUMMARY:
+{existing_summary or "(none yet)"}
+
+NEW MESSAGES:
+{messages_text}
+
+Write the updated summary. Keep everything from the current summary that still matters
+and add what is new:
+- Topics discussed and decisions made
+- Events in the user's life and how they feel about them
+- Plans, promises and open questions to follow up on
+
+Write in third person, as compact prose. Return ONLY the summary text."""
+        
+        response, _ = await self.router.complete(lambda p: p.client.chat.completions.create(
+            model=p.model,
+            messages=[
+                {
+                    "role": "system",
+                    "content": (
+                        "You are a summarization assistant. "
+                        "You maintain concise running summaries of conversations."
+                    ),
+                },
+                {"role": "user", "content": prompt},
+            ],
+            temperature=0.3,
+            max_tokens=max_tokens,
+        ))
+        
+        return (response.choices[0].message.content or "").strip()
+    
+    async def close(self) -> None:
+        await self.router.close()
 
 
 # Singleton instance
@@ -0,0 +1,228 @@
+import asyncio
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+import httpx
+import openai
+
+from ..core.config import Settings
+from ..core.metrics import LLM_QUEUE_WAIT
+
+T = TypeVar("T")
+
+# Status codes worth retrying: rate limited, or a transient provider error
+_RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit that backs off when the provider rate limits us.
+    
+    Callers over the limit wait in FIFO order. Each rate-limited response
+    halves the limit (down to `min_limit`); each other response raises it
+    by `1 / limit`, so it climbs back by about one slot per round of
+    requests (AIMD).
+    """
+    
+    def __init__(self, max_limit: int = 64, min_limit: int = 4):
+        self.max_limit = max_limit
+        self.min_limit = min(min_limit, max_limit)
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.max_queue_depth = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+    
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+    
+    async def acquire(self) -> None:
+        if not self._waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just before the cancel; pass it on
+                self.in_flight -= 1
+                self._wake()
+            else:
+                self._waiters.remove(waiter)
+            raise
+    
+    def release(self, throttled: bool = False) -> None:
+        if throttled:
+            self.limit = max(self.min_limit, self.limit / 2)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self.in_flight -= 1
+        self._wake()
+    
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if waiter.cancelled():
+                continue
+            self.in_flight += 1
+            waiter.set_result(None)
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in _RETRYABLE_STATUS
+
+
+def _is_rate_limit(error: Exception) -> bool:
+    return isinstance(error, openai.APIStatusError) and error.status_code == 429
+
+
+def _retry_after(error: Exception) -> float:
+    response = getattr(error, "response", None)
+    if response is None:
+        return 0.0
+    try:
+        return float(response.headers.get("retry-after", 0))
+    except ValueError:
+        return 0.0
+
+
+class LLMTransport:
+    """
+    HTTP transport and admission control for an OpenAI-compatible API.
+    
+    Owns a pooled `httpx` client (keep-alive, HTTP/2, explicit timeouts)
+    shared by the `AsyncOpenAI` client built on it. Every request takes a
+    slot from an `AdaptiveLimiter`, so a traffic spike queues here instead
+    of turning into provider 429s, and requests that fail with a rate
+    limit, a 5xx or a connection error are retried with full-jitter
+    exponential backoff (honouring Retry-After).
+    The SDK's own retries are disabled so this is the only retry loop.
+    """
+    
+    def __init__(
+        self,
+        http_client: httpx.AsyncClient,
+        limiter: AdaptiveLimiter,
+        max_retries: int = 3,
+        retry_base_seconds: float = 0.5,
+        retry_max_seconds: float = 8.0,
+    ):
+        self.http_client = http_client
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self._stats = {
+            "requests": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "failures": 0,
+            "queue_wait_seconds": 0.0,
+        }
+    
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "LLMTransport":
+        http_client = httpx.AsyncClient(
+            http2=settings.openai_http2,
+            limits=httpx.Limits(
+                max_connections=settings.openai_max_connections,
+                max_keepalive_connections=settings.openai_max_keepalive_connections,
+                keepalive_expiry=settings.openai_keepalive_expiry_seconds,
+            ),
+            timeout=httpx.Timeout(
+                connect=settings.openai_connect_timeout_seconds,
+                read=settings.openai_read_timeout_seconds,
+                write=settings.openai_write_timeout_seconds,
+                pool=settings.openai_pool_timeout_seconds,
+            ),
+        )
+        return cls(
+            http_client,
+            AdaptiveLimiter(
+                max_limit=settings.openai_max_concurrency,
+                min_limit=settings.openai_min_concurrency,
+            ),
+            max_retries=settings.openai_max_retries,
+            retry_base_seconds=settings.openai_retry_base_seconds,
+            retry_max_seconds=settings.openai_retry_max_seconds,
+        )
+    
+    def openai_client(self, api_key: str, base_url: Optional[str] = None) -> openai.AsyncOpenAI:
+        """An `AsyncOpenAI` client that sends its requests through this transport."""
+        return openai.AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=self.http_client,
+            max_retries=0,
+        )
+    
+    async def call(self, request: Callable[[], Awaitable[T]]) -> T:
+        """Run `request()` in a limiter slot, retrying transient failures."""
+        async with self.hold(request) as response:
+            return response
+    
+    @asynccontextmanager
+    async def hold(self, request: Callable[[], Awaitable[T]]) -> AsyncIterator[T]:
+        """
+        Like `call`, but keeps the slot until the block exits.
+        
+        Used for streamed responses, which occupy the provider until they
+        are fully read. Only starting the request is retried; a stream that
+        fails midway is not.
+        """
+        attempt = 0
+        while True:
+            queued_at = time.monotonic()
+            await self.limiter.acquire()
+            queue_wait = time.monotonic() - queued_at
+            self._stats["queue_wait_seconds"] += queue_wait
+            LLM_QUEUE_WAIT.observe(queue_wait)
+            self._stats["requests"] += 1
+            try:
+                response = await request()
+            except asyncio.CancelledError:
+                self.limiter.release()
+                raise
+            except Exception as e:
+                throttled = _is_rate_limit(e)
+                self.limiter.release(throttled=throttled)
+                if throttled:
+                    self._stats["rate_limited"] += 1
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    self._stats["failures"] += 1
+                    raise
+                attempt += 1
+                self._stats["retries"] += 1
+                await asyncio.sleep(self._backoff(attempt, e))
+                continue
+            
+            try:
+                yield response
+            finally:
+                self.limiter.release()
+            return
+    
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        ceiling = min(self.retry_max_seconds, self.retry_base_seconds * 2 ** (attempt - 1))
+        return max(min(_retry_after(error), self.retry_max_seconds), random.uniform(0, ceiling))
+    
+    def stats(self) -> Dict:
+        """Request/retry counters and limiter state."""
+        return {
+            **self._stats,
+            "concurrency_limit": int(self.limiter.limit),
+            "in_flight": self.limiter.in_flight,
+            "queue_depth": self.limiter.queue_depth,
+            "max_queue_depth": self.limiter.max_queue_depth,
+        }
+    
+    async def close(self) -> None:
+        await self.http_client.aclose()
@@ -1,20 +1,96 @@
-from typing import Optional
+from typing import Dict, Optional
 from google.cloud import firestore
+import logging
 import uuid
 import time
 
-from ..core.firebase import get_firestore_client
 from ..core.auth import AuthenticatedUser
-from ..models.schemas import CurateMemoryRequest, Fact
+from ..models.schemas import CurateMemoryRequest
+from ..repositories.firestore_repository import get_repository
+from .context_cache import get_context_cache
+from .fact_dedup import plan_fact_merge
+from .fact_index import fact_text, get_fact_retriever
+from .job_queue import Job, get_job_queue
 from .llm_service import get_llm_service
 
 
+logger = logging.getLogger(__name__)
+
+
+CURATE_JOB = "curate_memory"
+
+
+def _merge_seq_ranges(queued: Dict, new: Dict) -> Optional[Dict]:
+    """Merge two curation payloads whose seq ranges overlap or touch."""
+    if new["fromSeq"] > queued["toSeq"] + 1 or queued["fromSeq"] > new["toSeq"] + 1:
+        return None
+    return {
+        **queued,
+        "fromSeq": min(queued["fromSeq"], new["fromSeq"]),
+        "toSeq": max(queued["toSeq"], new["toSeq"]),
+    }
+
+
 class MemoryService:
     """Service for managing user memory (facts)."""
     
     def __init__(self):
-        self.db = get_firestore_client()
+        self.repo = get_repository()
         self.llm = get_llm_service()
+        self.context_cache = get_context_cache()
+        self.fact_retriever = get_fact_retriever()
+        self.jobs = get_job_queue()
+        self.jobs.register(CURATE_JOB, self._run_curation_job, merge=_merge_seq_ranges)
+    
+    async def enqueue_curation(
+        self,
+        user: AuthenticatedUser,
+        request: CurateMemoryRequest,
+        verify_owner: bool = True,
+    ) -> Job:
+        """
+        Queue memory curation for a conversation range.
+        
+        Overlapping ranges queued for the same thread are merged into one job.
+        """
+        if request.from_seq > request.to_seq:
+            raise ValueError("fromSeq must not be greater than toSeq")
+        
+        if verify_owner:
+            thread_data = await self.repo.get_thread(request.thread_id)
+            if thread_data is None:
+                raise ValueError("Thread not found")
+            if thread_data.get("userId") != user.uid:
+                raise ValueError("Not authorized")
+        
+        return await self.jobs.submit(
+            CURATE_JOB,
+            {
+                "uid": user.uid,
+                "threadId": request.thread_id,
+                "fromSeq": request.from_seq,
+                "toSeq": request.to_seq,
+            },
+            uid=user.uid,
+            key=f"{CURATE_JOB}:{request.thread_id}",
+        )
+    
+    async def get_job(self, user: AuthenticatedUser, job_id: str) -> Optional[Job]:
+        """Get one of the user's jobs."""
+        job = await self.jobs.get(job_id)
+        if job is None or job.uid != user.uid:
+            return None
+        return job
+    
+    async def _run_curation_job(self, payload: Dict) -> dict:
+        return await self.curate_memory(
+            AuthenticatedUser(payload["uid"]),
+            CurateMemoryRequest(
+                threadId=payload["threadId"],
+                fromSeq=payload["fromSeq"],
+                toSeq=payload["toSeq"],
+            ),
+        )
     
     async def curate_memory(
         self,
@@ -29,49 +105,42 @@ class MemoryService:
         thread_id = request.thread_id
         
         # Verify thread ownership
-        thread_ref = self.db.collection("threads").document(thread_id)
-        thread_doc = thread_ref.get()
+        thread_data = await self.repo.get_thread(thread_id)
         
-        if not thread_doc.exists:
+        if thread_data is None:
             raise ValueError("Thread not found")
         
-        thread_data = thread_doc.to_dict()
         if thread_data.get("userId") != user.uid:
             raise ValueError("Not authorized")
         
         # Get messages in range
-        messages_ref = (
-            thread_ref.collection("messages")
-            .where("seq", ">=", request.from_seq)
-            .where("seq", "<=", request.to_seq)
-            .order_by("seq")
+        messages_data = await self.repo.get_messages_in_range(
+            thread_id, request.from_seq, request.to_seq
         )
-        messages_docs = list(messages_ref.stream())
         
         messages = []
-        for doc in messages_docs:
-            msg_data = doc.to_dict()
+        for msg_data in messages_data:
             messages.append({
                 "role": msg_data.get("role", "user"),
                 "content": msg_data.get("content", ""),
             })
         
         if not messages:
-            return {"facts_created": 0}
+            return {"facts_created": 0, "facts_updated": 0}
         
         # Get existing facts
-        facts_ref = self.db.collection("users").document(user.uid).collection("facts")
-        facts_docs = list(facts_ref.stream())
-        existing_facts = [Fact(id=doc.id, **doc.to_dict()) for doc in facts_docs]
+        existing_facts = await self.repo.get_all_facts(user.uid)
         
         # Extract new facts
         new_facts = await self.llm.extract_facts(messages, existing_facts)
         
-        # Store new facts
-        facts_created = 0
-        for fact_data in new_facts:
+        # Merge duplicates into existing facts instead of appending them
+        plan = plan_fact_merge(new_facts, existing_facts)
+        
+        creates = {}
+        for fact_data in plan.creates:
             fact_id = str(uuid.uuid4())
-            facts_ref.document(fact_id).set({
+            creates[fact_id] = {
                 **fact_data,
                 "id": fact_id,
                 "scope": "global",
@@ -85,41 +154,55 @@ class MemoryService:
                 },
                 "createdAt": firestore.SERVER_TIMESTAMP,
                 "updatedAt": firestore.SERVER_TIMESTAMP,
+            }
+        
+        updates = {
+            fact_id: {**changes, "updatedAt": firestore.SERVER_TIMESTAMP}
+            for fact_id, changes in plan.updates.items()
+        }
+        
+        # Store all fact writes in one batch
+        if creates or updates:
+            await self.repo.write_facts(user.uid, creates, updates)
+            await self.context_cache.invalidate(user.uid)
+        
+        # Embed new facts and changed values for retrieval
+        if self.fact_retriever is not None:
+            keys = {f.id: f.key for f in existing_facts}
+            texts = {
+                fact_id: fact_text(data["key"], data["value"])
+                for fact_id, data in creates.items()
+            }
+            texts.update({
+                fact_id: fact_text(keys[fact_id], changes["value"])
+                for fact_id, changes in plan.updates.items()
+                if "value" in changes
             })
-            facts_created += 1
+            try:
+                await self.fact_retriever.index_facts(user.uid, texts)
+            except Exception as e:
+                # Backfill picks up anything missing from the index
+                logger.warning("⚠️ Failed to index facts for user %s: %s", user.uid, e)
         
-        return {"facts_created": facts_created}
+        return {"facts_created": len(creates), "facts_updated": len(updates)}
     
     async def get_user_facts(self, user: AuthenticatedUser) -> list:
         """Get all active facts for a user."""
-        facts_ref = (
-            self.db.collection("users")
-            .document(user.uid)
-            .collection("facts")
-            .where("status", "==", "active")
-            .order_by("importance", direction=firestore.Query.DESCENDING)
-        )
-        
-        facts_docs = list(facts_ref.stream())
-        return [{"id": doc.id, **doc.to_dict()} for doc in facts_docs]
+        return await self.repo.get_active_facts_by_importance(user.uid)
     
     async def delete_fact(self, user: AuthenticatedUser, fact_id: str) -> bool:
         """Delete (deprecate) a fact."""
-        fact_ref = (
-            self.db.collection("users")
-            .document(user.uid)
-            .collection("facts")
-            .document(fact_id)
-        )
-        
-        fact_doc = fact_ref.get()
-        if not fact_doc.exists:
+        fact_data = await self.repo.get_fact(user.uid, fact_id)
+        if fact_data is None:
             return False
         
-        fact_ref.update({
+        await self.repo.update_fact(user.uid, fact_id, {
             "status": "deprecated",
             "updatedAt": firestore.SERVER_TIMESTAMP,
         })
+        await self.context_cache.invalidate(user.uid)
+        if self.fact_retriever is not None:
+            await self.fact_retriever.remove_facts(user.uid, [fact_id])
         
         return True
 
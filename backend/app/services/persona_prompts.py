@@ -1,5 +1,13 @@
 """Persona system prompts for the AI companion."""
 
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from typing import Tuple
+
+logger = logging.getLogger(__name__)
+
 PERSONA_PROMPTS = {
     "einstein": """You are embodying the conversational style and intellectual approach inspired by Albert Einstein.
 
@@ -119,6 +127,20 @@ Core traits:
 - Adapts to user's emotional state
 - Balances fun and depth""",
 }
+
+
+_EMOJI_INSTRUCTIONS = {
+    "none": "\n\nCOMMUNICATION STYLE: Do not use emojis in your responses.",
+    "minimal": "\n\nCOMMUNICATION STYLE: Use emojis very sparingly.",
+    "moderate": "\n\nCOMMUNICATION STYLE: Use emojis naturally to express emotions.",
+    "expressive": "\n\nCOMMUNICATION STYLE: Use emojis freely to add warmth and expressiveness.",
+}
+
+_CLOSING_INSTRUCTION = (
+    "\n\nMaintain your persona consistently while being emotionally present and genuinely helpful."
+)
+
+
 def _format_relationship(relationship: str) -> str:
     mapping = {
         "girlfriend": "girlfriend",
@@ -187,7 +209,7 @@ def get_persona_prompt(
     """
     persona_lower = persona_name.lower()
     
-    print(f"🎯 get_persona_prompt - persona: {persona_lower}, custom_name: {custom_name}")
+    logger.debug("🎯 get_persona_prompt - persona: %s, custom_name: %s", persona_lower, custom_name)
     
     # Custom companion persona
     if persona_lower == "custom":
@@ -197,36 +219,51 @@ def get_persona_prompt(
     return PERSONA_PROMPTS.get(persona_lower, PERSONA_PROMPTS["amora"])
 
 
-def build_full_system_prompt(
+_PREFIX_CACHE_MAX_ENTRIES = 4096
+_prefix_cache: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+
+
+def _prefix_cache_key(**inputs) -> str:
+    """Content hash of everything that shapes the static prompt sections."""
+    canonical = json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def build_static_prompt_sections(
     persona_name: str,
     user_name: str,
     user_gender: str,
     preferences: dict,
-    facts: list,
-    summary: dict = None,
     custom_persona_name: str = None,
     user_age: int | None = None,
     user_bio: str | None = None,
     companion_profile: dict | None = None,
-) -> str:
-    """Build complete system prompt combining persona and user preferences.
+) -> Tuple[str, str]:
+    """Build the parts of the system prompt that are stable across a thread.
     
-    Args:
-        persona_name: Selected persona
-        user_name: User's display name
-        user_gender: User's gender (optional)
-        user_age: User's age (optional)
-        user_bio: User's bio (optional)
-        companion_profile: Optional custom companion profile
-        preferences: User preferences dict
-        facts: List of user facts
-        summary: Optional conversation summary
-        custom_persona_name: Optional custom name override
-        
-    Returns:
-        Complete system prompt
+    Returns the sections before the facts (persona, user information and
+    style) and after them (boundaries and closing). They depend only on
+    persona, user profile and preferences, so they are memoized by a
+    content hash of those inputs. Identical inputs always return identical
+    strings, which keeps the prompt prefix byte-stable across turns for
+    provider-side prompt caching.
     """
-    print(f"🎭 Building system prompt for persona: {persona_name}")
+    key = _prefix_cache_key(
+        persona_name=persona_name,
+        user_name=user_name,
+        user_gender=user_gender,
+        emoji_level=preferences.get("emojiLevel", "moderate"),
+        topics_to_avoid=preferences.get("topicsToAvoid") or [],
+        phrases_to_avoid=preferences.get("phrasesToAvoid") or [],
+        custom_persona_name=custom_persona_name,
+        user_age=user_age,
+        user_bio=user_bio,
+        companion_profile=companion_profile,
+    )
+    cached = _prefix_cache.get(key)
+    if cached is not None:
+        _prefix_cache.move_to_end(key)
+        return cached
     
     # Get base persona prompt
     persona_prompt = get_persona_prompt(persona_name, custom_persona_name, user_gender, companion_profile)
@@ -241,15 +278,33 @@ def build_full_system_prompt(
         user_context += f"\n- Bio: {user_bio}"
     
     # Emoji usage
-    emoji_map = {
-        "none": "\n\nCOMMUNICATION STYLE: Do not use emojis in your responses.",
-        "minimal": "\n\nCOMMUNICATION STYLE: Use emojis very sparingly.",
-        "moderate": "\n\nCOMMUNICATION STYLE: Use emojis naturally to express emotions.",
-        "expressive": "\n\nCOMMUNICATION STYLE: Use emojis freely to add warmth and expressiveness.",
-    }
     emoji_level = preferences.get("emojiLevel", "moderate")
-    emoji_instruction = emoji_map.get(emoji_level, emoji_map["moderate"])
+    emoji_instruction = _EMOJI_INSTRUCTIONS.get(emoji_level, _EMOJI_INSTRUCTIONS["moderate"])
+    
+    # Boundaries
+    boundaries = []
+    if preferences.get("topicsToAvoid"):
+        boundaries.append(f"Avoid these topics: {', '.join(preferences['topicsToAvoid'])}")
+    if preferences.get("phrasesToAvoid"):
+        boundaries.append(f"Avoid these phrases: {', '.join(preferences['phrasesToAvoid'])}")
     
+    boundaries_section = ""
+    if boundaries:
+        boundaries_section = f"\n\nBOUNDARIES:\n" + "\n".join([f"- {b}" for b in boundaries])
+    
+    sections = (
+        persona_prompt + user_context + emoji_instruction,
+        boundaries_section + _CLOSING_INSTRUCTION,
+    )
+    
+    _prefix_cache[key] = sections
+    if len(_prefix_cache) > _PREFIX_CACHE_MAX_ENTRIES:
+        _prefix_cache.popitem(last=False)
+    return sections
+
+
+def build_volatile_prompt_sections(user_name: str, facts: list, summary: dict = None) -> str:
+    """Build the per-turn facts and summary sections of the system prompt."""
     # Build facts section
     facts_section = ""
     if facts:
@@ -263,26 +318,51 @@ def build_full_system_prompt(
     if summary and summary.get("text"):
         summary_section = f"\n\nRECENT CONVERSATION SUMMARY:\n{summary['text']}"
     
-    # Boundaries
-    boundaries = []
-    if preferences.get("topicsToAvoid"):
-        boundaries.append(f"Avoid these topics: {', '.join(preferences['topicsToAvoid'])}")
-    if preferences.get("phrasesToAvoid"):
-        boundaries.append(f"Avoid these phrases: {', '.join(preferences['phrasesToAvoid'])}")
+    return facts_section + summary_section
+
+
+def build_full_system_prompt(
+    persona_name: str,
+    user_name: str,
+    user_gender: str,
+    preferences: dict,
+    facts: list,
+    summary: dict = None,
+    custom_persona_name: str = None,
+    user_age: int | None = None,
+    user_bio: str | None = None,
+    companion_profile: dict | None = None,
+) -> str:
+    """Build complete system prompt combining persona and user preferences.
     
-    boundaries_section = ""
-    if boundaries:
-        boundaries_section = f"\n\nBOUNDARIES:\n" + "\n".join([f"- {b}" for b in boundaries])
+    The static sections (persona, user information and style, then
+    boundaries and closing) are memoized; facts and summary go between them.
     
-    # Combine all sections
-    full_prompt = (
-        persona_prompt +
-        user_context +
-        emoji_instruction +
-        facts_section +
-        summary_section +
-        boundaries_section +
-        "\n\nMaintain your persona consistently while being emotionally present and genuinely helpful."
-    )
+    Args:
+        persona_name: Selected persona
+        user_name: User's display name
+        user_gender: User's gender (optional)
+        user_age: User's age (optional)
+        user_bio: User's bio (optional)
+        companion_profile: Optional custom companion profile
+        preferences: User preferences dict
+        facts: List of user facts
+        summary: Optional conversation summary
+        custom_persona_name: Optional custom name override
+        
+    Returns:
+        Complete system prompt
+    """
+    logger.debug("🎭 Building system prompt for persona: %s", persona_name)
     
-    return full_prompt
+    prefix, suffix = build_static_prompt_sections(
+        persona_name=persona_name,
+        user_name=user_name,
+        user_gender=user_gender,
+        preferences=preferences,
+        custom_persona_name=custom_persona_name,
+        user_age=user_age,
+        user_bio=user_bio,
+        companion_profile=companion_profile,
+    )
+    return prefix + build_volatile_prompt_sections(user_name, facts, summary) + suffix
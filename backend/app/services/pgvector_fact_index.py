@@ -0,0 +1,117 @@
+import asyncio
+from typing import Dict, Iterable, List, Optional
+
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import Column, DateTime, MetaData, String, Table, func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from .fact_index import FactMatches
+
+
+class PgVectorFactIndex:
+    """
+    Fact embeddings in Postgres with pgvector.
+    
+    Searches are exact nearest-neighbour scans over one user's rows, which
+    the `(uid, fact_id)` primary key narrows down. With at most a few
+    thousand facts per user this stays fast and, unlike a global ANN index
+    filtered by uid afterwards, always returns a full result.
+    """
+    
+    def __init__(self, database_url: str, dimensions: int):
+        self.engine = create_async_engine(database_url, pool_size=5, pool_pre_ping=True)
+        self.metadata = MetaData()
+        self.table = Table(
+            "fact_embeddings",
+            self.metadata,
+            Column("uid", String, primary_key=True),
+            Column("fact_id", String, primary_key=True),
+            Column("embedding", Vector(dimensions), nullable=False),
+            Column(
+                "updated_at",
+                DateTime(timezone=True),
+                server_default=func.now(),
+                onupdate=func.now(),
+            ),
+        )
+        self._schema_ready: Optional[asyncio.Future] = None
+    
+    async def _ensure_schema(self) -> None:
+        if self._schema_ready is None:
+            self._schema_ready = asyncio.ensure_future(self._create_schema())
+        try:
+            await asyncio.shield(self._schema_ready)
+        except Exception:
+            # Retry on the next call
+            self._schema_ready = None
+            raise
+    
+    async def _create_schema(self) -> None:
+        async with self.engine.begin() as conn:
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+            await conn.run_sync(self.metadata.create_all)
+    
+    async def upsert(self, uid: str, vectors: Dict[str, List[float]]) -> None:
+        if not vectors:
+            return
+        await self._ensure_schema()
+        statement = insert(self.table).values([
+            {"uid": uid, "fact_id": fact_id, "embedding": vector}
+            for fact_id, vector in vectors.items()
+        ])
+        statement = statement.on_conflict_do_update(
+            index_elements=["uid", "fact_id"],
+            set_={"embedding": statement.excluded.embedding, "updated_at": func.now()},
+        )
+        async with self.engine.begin() as conn:
+            await conn.execute(statement)
+    
+    async def delete(self, uid: str, fact_ids: Iterable[str]) -> None:
+        fact_ids = list(fact_ids)
+        if not fact_ids:
+            return
+        await self._ensure_schema()
+        async with self.engine.begin() as conn:
+            await conn.execute(self.table.delete().where(
+                self.table.c.uid == uid,
+                self.table.c.fact_id.in_(fact_ids),
+            ))
+    
+    async def delete_user(self, uid: str) -> None:
+        await self._ensure_schema()
+        async with self.engine.begin() as conn:
+            await conn.execute(self.table.delete().where(self.table.c.uid == uid))
+    
+    async def missing(self, uid: str, fact_ids: Iterable[str]) -> List[str]:
+        fact_ids = list(fact_ids)
+        if not fact_ids:
+            return []
+        await self._ensure_schema()
+        async with self.engine.connect() as conn:
+            result = await conn.execute(select(self.table.c.fact_id).where(
+                self.table.c.uid == uid,
+                self.table.c.fact_id.in_(fact_ids),
+            ))
+            indexed = set(result.scalars())
+        return [fact_id for fact_id in fact_ids if fact_id not in indexed]
+    
+    async def search(self, uid: str, vector: List[float], limit: int) -> FactMatches:
+        await self._ensure_schema()
+        distance = self.table.c.embedding.cosine_distance(vector).label("distance")
+        query = (
+            select(self.table.c.fact_id, distance)
+            .where(self.table.c.uid == uid)
+            .order_by(distance)
+            .limit(limit)
+        )
+        async with self.engine.connect() as conn:
+            result = await conn.execute(query)
+            return [(row.fact_id, 1.0 - row.distance) for row in result]
+    
+    async def ping(self) -> None:
+        async with self.engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    
+    async def close(self) -> None:
+        await self.engine.dispose()
@@ -0,0 +1,131 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from .token_budget import ContextBudget
+
+_Converted = Tuple[str, Dict, bool]
+
+
+@dataclass(frozen=True)
+class GenerationPolicy:
+    """Sampling parameters for a persona."""
+    temperature: float = 0.9
+    max_tokens: int = 1024
+
+
+@dataclass
+class ChatRequest:
+    """Provider-independent chat completion request."""
+    messages: List[Dict]
+    has_images: bool
+    temperature: float
+    max_tokens: int
+
+
+def convert_message(message: Dict) -> Tuple[Dict, bool]:
+    """
+    Convert a stored message to the OpenAI format.
+    
+    Image attachments become `image_url` content parts. Returns the
+    converted message and whether it contains an image.
+    """
+    role = "assistant" if message.get("role") == "assistant" else "user"
+    content = message.get("content", "")
+    images = [
+        att["downloadUrl"]
+        for att in message.get("attachments") or []
+        if att.get("kind") == "image" and att.get("downloadUrl")
+    ]
+    if not images:
+        return {"role": role, "content": content}, False
+    
+    parts: List[Dict] = [{"type": "text", "text": content}] if content else []
+    parts.extend({"type": "image_url", "image_url": {"url": url}} for url in images)
+    return {"role": role, "content": parts}, True
+
+
+class RequestBuilder:
+    """
+    Turns a system prompt and message history into a `ChatRequest`.
+    
+    History is trimmed to the token budget and converted to the OpenAI
+    format. Converted messages are cached per thread by message id, so on
+    each turn only messages not seen before (normally just the new user
+    message) are converted; a cached message whose content changed is
+    converted again. Sampling parameters come from the persona's
+    policy, or `default_policy`.
+    """
+    
+    def __init__(
+        self,
+        budget: ContextBudget,
+        default_policy: GenerationPolicy,
+        persona_policies: Optional[Mapping[str, GenerationPolicy]] = None,
+        max_cached_threads: int = 1000,
+    ):
+        self.budget = budget
+        self.default_policy = default_policy
+        self.persona_policies = dict(persona_policies or {})
+        self.max_cached_threads = max_cached_threads
+        # thread id -> message id -> (source content, converted, has image)
+        self._threads: "OrderedDict[str, Dict[str, _Converted]]" = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0}
+    
+    def policy(self, persona: str) -> GenerationPolicy:
+        return self.persona_policies.get(persona, self.default_policy)
+    
+    def build(
+        self,
+        system_prompt: str,
+        messages: List[Dict],
+        persona: str,
+        thread_id: Optional[str] = None,
+    ) -> ChatRequest:
+        """Build the request for `messages`, the last being the current user turn."""
+        messages = self.budget.fit_history(messages, system_prompt)
+        cached = self._thread_cache(thread_id)
+        seen: Dict[str, _Converted] = {}
+        
+        api_messages = [{"role": "system", "content": system_prompt}]
+        has_images = False
+        for message in messages:
+            message_id = message.get("id")
+            content = message.get("content", "")
+            entry = cached.get(message_id) if message_id else None
+            if entry is None or entry[0] != content:
+                entry = (content, *convert_message(message))
+                self._stats["misses"] += 1
+            else:
+                self._stats["hits"] += 1
+            if message_id:
+                seen[message_id] = entry
+            api_messages.append(entry[1])
+            has_images = has_images or entry[2]
+        
+        # Keep only the messages still in the window
+        if thread_id is not None:
+            self._threads[thread_id] = seen
+        
+        policy = self.policy(persona)
+        return ChatRequest(
+            messages=api_messages,
+            has_images=has_images,
+            temperature=policy.temperature,
+            max_tokens=policy.max_tokens,
+        )
+    
+    def stats(self) -> Dict:
+        """Converted-message cache hits/misses and cached thread count."""
+        return {**self._stats, "threads": len(self._threads)}
+    
+    def _thread_cache(self, thread_id: Optional[str]) -> Dict[str, _Converted]:
+        if thread_id is None:
+            return {}
+        cached = self._threads.get(thread_id)
+        if cached is None:
+            while len(self._threads) >= self.max_cached_threads:
+                self._threads.popitem(last=False)
+            return {}
+        self._threads.move_to_end(thread_id)
+        return cached
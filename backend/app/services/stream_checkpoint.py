@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import time
+from typing import List, Optional
+
+from ..core.config import get_settings
+from ..repositories.firestore_repository import FirestoreRepository, get_repository
+
+logger = logging.getLogger(__name__)
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class ReplyCheckpointer:
+    """
+    Buffer for a streamed reply that periodically persists partial content.
+    
+    Chunks are collected in a list and joined only when the text is needed.
+    The partial content is written to the assistant message once at least
+    `every_chars` new characters or `every_seconds` have accumulated, with
+    at most one write in flight, so a crashed worker loses a bounded amount
+    of text without a write per token. Each checkpoint also refreshes
+    `streamState.updatedAt`, which tells the sweeper the stream is alive.
+    """
+    
+    def __init__(
+        self,
+        repo: FirestoreRepository,
+        thread_id: str,
+        message_id: str,
+        durable: "asyncio.Future[None]",
+        every_chars: int = 400,
+        every_seconds: float = 2.0,
+    ):
+        self.repo = repo
+        self.thread_id = thread_id
+        self.message_id = message_id
+        self.durable = durable
+        self.every_chars = every_chars
+        self.every_seconds = every_seconds
+        self.length = 0
+        self.checkpoints = 0
+        self._parts: List[str] = []
+        self._saved_length = 0
+        self._saved_at = time.monotonic()
+        self._pending: Optional[asyncio.Task] = None
+    
+    def append(self, chunk: str) -> None:
+        self._parts.append(chunk)
+        self.length += len(chunk)
+        if self._pending is None and (
+            self.length - self._saved_length >= self.every_chars
+            or time.monotonic() - self._saved_at >= self.every_seconds
+        ):
+            self._checkpoint()
+    
+    def text(self) -> str:
+        """The reply so far."""
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+    
+    async def flush(self) -> None:
+        """Wait for the checkpoint in flight, so it cannot overwrite a later write."""
+        if self._pending is not None:
+            await asyncio.gather(self._pending, return_exceptions=True)
+    
+    def _checkpoint(self) -> None:
+        content = self.text()
+        self._saved_length = len(content)
+        self._saved_at = time.monotonic()
+        self._pending = asyncio.ensure_future(self._save(content))
+        self._pending.add_done_callback(self._finish_checkpoint)
+    
+    async def _save(self, content: str) -> None:
+        # The placeholder must exist before it can be updated
+        await self.durable
+        await self.repo.update_message(self.thread_id, self.message_id, {
+            "content": content,
+            "streamState.cursor": len(content),
+            "streamState.updatedAt": _now_ms(),
+        })
+        self.checkpoints += 1
+    
+    def _finish_checkpoint(self, task: asyncio.Task) -> None:
+        self._pending = None
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(
+                "⚠️ Failed to checkpoint message %s: %s", self.message_id, task.exception()
+            )
+
+
+async def sweep_interrupted_streams(repo: Optional[FirestoreRepository] = None) -> int:
+    """
+    Finalize assistant messages left `streaming` by a worker that died.
+    
+    A placeholder whose stream state has not been updated for
+    `stream_stale_after_seconds` is marked `cancelled`, keeping the partial
+    content it was checkpointed with; retrying the request with the same
+    X-Request-Id generates the reply again. Returns the number of messages
+    finalized.
+    """
+    repo = repo or get_repository()
+    cutoff_ms = _now_ms() - get_settings().stream_stale_after_seconds * 1000
+    swept = 0
+    
+    async for msg_doc in repo.stream_messages_with_status("streaming"):
+        data = msg_doc.to_dict()
+        stream_state = data.get("streamState") or {}
+        updated_at = stream_state.get("updatedAt")
+        if updated_at is None and data.get("createdAt") is not None:
+            updated_at = int(data["createdAt"].timestamp() * 1000)
+        if updated_at is not None and updated_at > cutoff_ms:
+            continue
+        
+        content = data.get("content", "")
+        await msg_doc.reference.update({
+            "streamState": {
+                **stream_state,
+                "status": "cancelled",
+                "cursor": len(content),
+                "cancelledAt": _now_ms(),
+                "reason": "interrupted",
+            },
+        })
+        swept += 1
+    
+    if swept:
+        logger.info("🧹 Finalized %d interrupted streaming messages", swept)
+    return swept
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+from typing import Dict, Optional
+
+from google.cloud import firestore
+
+from ..core.config import get_settings
+from ..repositories.firestore_repository import get_repository
+from .llm_service import get_llm_service
+
+logger = logging.getLogger(__name__)
+
+
+class SummaryService:
+    """
+    Incremental rolling summaries for long threads.
+    
+    Once enough messages have fallen out of the recent-history window, the
+    new range `(summary.toSeq, messageCount - keep_recent]` is folded into
+    the existing summary in the background. Only that range is read and
+    sent to the LLM, and the result is written with a compare-and-set on
+    `toSeq`, so concurrent folds from several workers cannot clobber each
+    other.
+    """
+    
+    def __init__(self):
+        settings = get_settings()
+        self.repo = get_repository()
+        self.llm = get_llm_service()
+        self.trigger_messages = settings.summary_trigger_messages
+        self.keep_recent_messages = settings.summary_keep_recent_messages
+        self.max_fold_messages = settings.summary_max_fold_messages
+        self.max_tokens = settings.summary_max_tokens
+        self._inflight: Dict[str, asyncio.Task] = {}
+    
+    def needs_fold(self, message_count: int, summary_state: Optional[Dict]) -> bool:
+        """Whether enough unsummarized messages have left the recent window."""
+        to_seq = (summary_state or {}).get("toSeq", 0)
+        fold_to = message_count - self.keep_recent_messages
+        return fold_to - to_seq >= self.trigger_messages
+    
+    def maybe_schedule(
+        self,
+        thread_id: str,
+        message_count: int,
+        summary_state: Optional[Dict],
+    ) -> Optional[asyncio.Task]:
+        """Start a background fold for the thread if one is due."""
+        if not self.needs_fold(message_count, summary_state):
+            return None
+        if thread_id in self._inflight:
+            return None
+        
+        task = asyncio.ensure_future(self._catch_up(thread_id))
+        self._inflight[thread_id] = task
+        task.add_done_callback(lambda t: self._finish(thread_id, t))
+        return task
+    
+    def _finish(self, thread_id: str, task: asyncio.Task) -> None:
+        self._inflight.pop(thread_id, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("❌ Summary fold failed for thread %s: %s", thread_id, task.exception())
+    
+    async def _catch_up(self, thread_id: str) -> None:
+        """Fold ranges until the summary is caught up or a fold is skipped."""
+        while await self._fold(thread_id):
+            pass
+    
+    async def _fold(self, thread_id: str) -> bool:
+        """Fold the next unsummarized range into the thread summary."""
+        thread_data = await self.repo.get_thread(thread_id)
+        if thread_data is None:
+            return False
+        
+        summary_state = thread_data.get("summary") or {}
+        message_count = thread_data.get("messageCount", 0)
+        if not self.needs_fold(message_count, summary_state):
+            return False
+        
+        to_seq = summary_state.get("toSeq", 0)
+        fold_to = min(
+            message_count - self.keep_recent_messages,
+            to_seq + self.max_fold_messages,
+        )
+        
+        messages = await self.repo.get_messages_in_range(thread_id, to_seq + 1, fold_to)
+        messages = [m for m in messages if m.get("content")]
+        if not messages:
+            return False
+        
+        text = await self.llm.summarize_conversation(
+            summary_state.get("text"),
+            messages,
+            max_tokens=self.max_tokens,
+        )
+        if not text:
+            return False
+        
+        updated = await self.repo.compare_and_set_summary(thread_id, to_seq, {
+            "text": text,
+            "fromSeq": summary_state.get("fromSeq") or 1,
+            "toSeq": fold_to,
+            "updatedAt": firestore.SERVER_TIMESTAMP,
+        })
+        if updated:
+            logger.info("🧾 Summary for thread %s now covers up to seq %d", thread_id, fold_to)
+        return updated
+
+
+# Singleton
+_summary_service: Optional[SummaryService] = None
+
+
+def get_summary_service() -> SummaryService:
+    """Get summary service singleton."""
+    global _summary_service
+    if _summary_service is None:
+        _summary_service = SummaryService()
+    return _summary_service
@@ -0,0 +1,130 @@
+"""Token counting and context-window budgeting for chat prompts."""
+
+import logging
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from ..models.schemas import Fact
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken is a declared dependency
+    tiktoken = None
+
+
+logger = logging.getLogger(__name__)
+
+
+# Used when no tokenizer is available for the model
+_FALLBACK_CHARS_PER_TOKEN = 4
+
+# Chat format overhead per message (role and separators)
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+# Approximate cost of one image attachment at default detail
+_IMAGE_ATTACHMENT_TOKENS = 765
+
+
+@lru_cache(maxsize=16)
+def _get_encoding(model: Optional[str]):
+    """Tokenizer for `model`, or None to fall back to a character estimate."""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("o200k_base")
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # Encodings are downloaded on first use; stay usable without them
+        logger.warning("⚠️ Tokenizer unavailable for %s, estimating tokens: %s", model, e)
+        return None
+
+
+def warm_tokenizer(model: Optional[str]) -> None:
+    """Load the tokenizer ahead of the first request (blocking)."""
+    _get_encoding(model)
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Count tokens in `text` for `model`."""
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return max(1, len(text) // _FALLBACK_CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def message_tokens(message: Dict, model: Optional[str] = None) -> int:
+    """
+    Prompt tokens a chat message costs.
+    
+    Uses the `tokenCount` stored on the message document when present, so
+    history is tokenized once when written rather than on every turn.
+    """
+    tokens = message.get("tokenCount")
+    if tokens is None:
+        tokens = count_tokens(message.get("content", ""), model)
+    images = sum(1 for a in message.get("attachments") or [] if a.get("kind") == "image")
+    return tokens + _MESSAGE_OVERHEAD_TOKENS + images * _IMAGE_ATTACHMENT_TOKENS
+
+
+class ContextBudget:
+    """
+    Packs facts and history into a fixed prompt token budget.
+    
+    The system prompt (persona, summary and the most important facts that
+    fit `facts_tokens`) is built first; history then gets whatever is left
+    of `total_tokens` after reserving `max_output_tokens` for the reply.
+    """
+    
+    def __init__(
+        self,
+        total_tokens: int,
+        max_output_tokens: int,
+        facts_tokens: int,
+        model: Optional[str] = None,
+    ):
+        self.total_tokens = total_tokens
+        self.max_output_tokens = max_output_tokens
+        self.facts_tokens = facts_tokens
+        self.model = model
+    
+    def select_facts(self, facts: List[Fact]) -> List[Fact]:
+        """Most important facts that fit the facts budget."""
+        ranked = sorted(facts, key=lambda f: f.importance * f.confidence, reverse=True)
+        selected = []
+        used = 0
+        for fact in ranked:
+            cost = count_tokens(f"- {fact.key}: {fact.value}", self.model) + 1
+            if used + cost > self.facts_tokens:
+                continue
+            selected.append(fact)
+            used += cost
+        return selected
+    
+    def fit_history(self, messages: List[Dict], system_prompt: str) -> List[Dict]:
+        """
+        Keep the most recent messages that fit next to `system_prompt`.
+        
+        The last message (the current user turn) is always kept.
+        """
+        if not messages:
+            return messages
+        
+        available = (
+            self.total_tokens
+            - self.max_output_tokens
+            - count_tokens(system_prompt, self.model)
+            - _MESSAGE_OVERHEAD_TOKENS
+        )
+        
+        kept = 1
+        used = message_tokens(messages[-1], self.model)
+        for message in reversed(messages[:-1]):
+            used += message_tokens(message, self.model)
+            if used > available:
+                break
+            kept += 1
+        
+        return messages[-kept:]
@@ -0,0 +1,73 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from ..core.tracing import traced
+from ..repositories.firestore_repository import FirestoreRepository, get_repository
+
+logger = logging.getLogger(__name__)
+
+
+class TurnWrites:
+    """Pending Firestore writes for one chat turn."""
+    
+    def __init__(self, thread_id: str):
+        self.thread_id = thread_id
+        self.messages: List[Tuple[str, Dict]] = []
+        self.thread_update: Dict = {}
+    
+    def set_message(self, message_id: str, data: Dict) -> "TurnWrites":
+        self.messages.append((message_id, data))
+        return self
+    
+    def update_thread(self, data: Dict) -> "TurnWrites":
+        self.thread_update.update(data)
+        return self
+
+
+class WritePipeline:
+    """
+    Write-behind persistence for chat turns.
+    
+    All writes of a turn are committed as one atomic batch in a background
+    task, so the caller can start the LLM request right away. The returned
+    future resolves once the batch is durable; anything that depends on the
+    documents existing (like the final assistant update) must await it.
+    """
+    
+    def __init__(self, repo: Optional[FirestoreRepository] = None):
+        self.repo = repo or get_repository()
+    
+    def submit(self, writes: TurnWrites) -> "asyncio.Future[None]":
+        """Start committing `writes` and return a durability future."""
+        future = asyncio.ensure_future(self._commit(writes))
+        future.add_done_callback(self._report_failure)
+        return future
+    
+    @traced("firestore.commit_turn", collection="messages")
+    async def _commit(self, writes: TurnWrites) -> None:
+        batch = self.repo.batch()
+        for message_id, data in writes.messages:
+            batch.set(self.repo.messages_ref(writes.thread_id).document(message_id), data)
+        if writes.thread_update:
+            batch.update(self.repo.thread_ref(writes.thread_id), writes.thread_update)
+        await batch.commit()
+    
+    @staticmethod
+    def _report_failure(future: "asyncio.Future[None]") -> None:
+        # Retrieve the exception so a turn that fails before awaiting its
+        # durability future does not leave an unobserved task error behind.
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("❌ Turn write failed: %s", future.exception())
+
+
+# Singleton
+_write_pipeline: Optional[WritePipeline] = None
+
+
+def get_write_pipeline() -> WritePipeline:
+    """Get write pipeline singleton."""
+    global _write_pipeline
+    if _write_pipeline is None:
+        _write_pipeline = WritePipeline()
+    return _write_pipeline
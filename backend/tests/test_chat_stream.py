@@ -0,0 +1,70 @@
+from types import SimpleNamespace
+
+import httpx
+from fastapi import FastAPI
+
+from app.api import chat
+from app.core.auth import AuthenticatedUser, get_current_user
+from app.core.rate_limit import enforce_rate_limit
+from app.services.chat_service import ChatService
+from app.services.generation_registry import GenerationStream
+
+
+def _chat_service(stream: GenerationStream) -> ChatService:
+    service = ChatService.__new__(ChatService)
+    service.generations = SimpleNamespace(
+        find_stream=lambda uid, generation_id: stream if generation_id == "gen-1" else None
+    )
+    service.heartbeat_seconds = 0
+    return service
+
+
+def _client(monkeypatch, stream: GenerationStream) -> httpx.AsyncClient:
+    app = FastAPI()
+    app.include_router(chat.router)
+    app.dependency_overrides[get_current_user] = lambda: AuthenticatedUser(uid="uid")
+    app.dependency_overrides[enforce_rate_limit] = lambda: None
+    monkeypatch.setattr(chat, "get_chat_service", lambda: _chat_service(stream))
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+def _frames(body: str):
+    frames = []
+    for block in body.replace("\r\n", "\n").strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        frames.append(fields)
+    return frames
+
+
+def _finished_stream() -> GenerationStream:
+    stream = GenerationStream("gen-1")
+    stream.append("meta", {"generationId": "gen-1"})
+    stream.append("delta", {"cursor": 5, "text": "Hello"})
+    stream.append("delta", {"cursor": 11, "text": " world"})
+    stream.append("final", {"cursor": 11, "finishReason": "stop"})
+    stream.finish()
+    return stream
+
+
+async def test_stream_events_carry_cursor_as_id(monkeypatch):
+    async with _client(monkeypatch, _finished_stream()) as client:
+        response = await client.get("/v1/chat/streams/gen-1")
+    
+    frames = _frames(response.text)
+    assert [(f["event"], f.get("id")) for f in frames] == [
+        ("meta", None),
+        ("delta", "5"),
+        ("delta", "11"),
+        ("final", "11"),
+    ]
+    assert frames[1]["data"] == '{"cursor": 5, "text": "Hello"}'
+
+
+async def test_resume_from_last_event_id_header(monkeypatch):
+    async with _client(monkeypatch, _finished_stream()) as client:
+        response = await client.get("/v1/chat/streams/gen-1", headers={"Last-Event-ID": "8"})
+        missing = await client.get("/v1/chat/streams/gen-2", headers={"Last-Event-ID": "8"})
+    
+    deltas = [f for f in _frames(response.text) if f["event"] == "delta"]
+    assert [(f["id"], f["data"]) for f in deltas] == [("11", '{"cursor": 11, "text": "rld"}')]
+    assert missing.status_code == 404
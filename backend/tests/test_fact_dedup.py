@@ -0,0 +1,91 @@
+from app.models.schemas import Fact
+from app.services.fact_dedup import normalize_key, plan_fact_merge, value_similarity
+
+
+def _fact(fact_id: str, key: str, value: str, **fields) -> Fact:
+    return Fact(id=fact_id, type=fields.pop("type", "preference"), key=key, value=value, **fields)
+
+
+def _extracted(key: str, value: str, **fields) -> dict:
+    return {"type": "preference", "key": key, "value": value, **fields}
+
+
+def test_keys_and_values_are_normalized():
+    assert normalize_key("Favorite Food") == normalize_key("favorite-food") == "favorite_food"
+    assert value_similarity("Sushi!", "sushi") == 1.0
+    assert value_similarity("sushi", "hiking") < 0.5
+
+
+def test_new_facts_are_created():
+    plan = plan_fact_merge([_extracted("favorite_food", "sushi")], [])
+    
+    assert plan.creates == [_extracted("favorite_food", "sushi")]
+    assert plan.updates == {}
+
+
+def test_repeated_fact_is_a_duplicate():
+    existing = [_fact("f1", "favorite_food", "Sushi", confidence=0.9, importance=0.6)]
+    
+    plan = plan_fact_merge([_extracted("Favorite Food", "sushi", confidence=0.8)], existing)
+    
+    assert plan.creates == [] and plan.updates == {}
+    assert plan.duplicates == 1
+
+
+def test_similar_value_only_raises_confidence_and_importance():
+    existing = [_fact("f1", "favorite_food", "sushi", confidence=0.6, importance=0.4)]
+    
+    plan = plan_fact_merge(
+        [_extracted("favorite_food", "sushi.", confidence=0.9, importance=0.3)], existing
+    )
+    
+    assert plan.updates == {"f1": {"confidence": 0.9}}
+
+
+def test_same_key_with_new_value_replaces_it():
+    existing = [_fact("f1", "city", "Berlin", type="profile", confidence=0.9)]
+    
+    plan = plan_fact_merge([_extracted("City", "Lisbon", type="profile", confidence=0.7)], existing)
+    
+    assert plan.updates == {"f1": {"value": "Lisbon", "confidence": 0.7}}
+    assert plan.creates == []
+
+
+def test_near_identical_value_under_other_key_matches_same_type_only():
+    existing = [_fact("f1", "favorite_food", "spicy ramen")]
+    
+    same_type = plan_fact_merge([_extracted("loves_to_eat", "spicy ramen!")], existing)
+    other_type = plan_fact_merge(
+        [_extracted("loves_to_eat", "spicy ramen", type="profile")], existing
+    )
+    
+    assert same_type.duplicates == 1 and same_type.creates == []
+    assert len(other_type.creates) == 1
+
+
+def test_deprecated_facts_are_not_matched():
+    existing = [_fact("f1", "favorite_food", "sushi", status="deprecated")]
+    
+    plan = plan_fact_merge([_extracted("favorite_food", "sushi")], existing)
+    
+    assert len(plan.creates) == 1 and plan.updates == {}
+
+
+def test_duplicates_within_extraction_are_merged():
+    plan = plan_fact_merge(
+        [
+            _extracted("hobby", "hiking", importance=0.3),
+            _extracted("Hobby", "Hiking", importance=0.8),
+            _extracted("pet", "a cat"),
+        ],
+        [],
+    )
+    
+    assert [fact["key"] for fact in plan.creates] == ["hobby", "pet"]
+    assert plan.creates[0]["importance"] == 0.8
+
+
+def test_invalid_extracted_facts_are_skipped():
+    plan = plan_fact_merge([{"key": "", "value": "x"}, {"key": "k", "value": None}, {}], [])
+    
+    assert plan.creates == [] and plan.duplicates == 0
@@ -0,0 +1,46 @@
+from app.models.schemas import Fact
+from app.services import fact_index
+from app.services.fact_index import FactRetriever, InMemoryFactIndex
+
+
+class _FakeLLM:
+    def __init__(self):
+        self.embedded = []
+    
+    async def embed(self, texts):
+        self.embedded.extend(texts)
+        return [[1.0, float(len(text) % 3)] for text in texts]
+
+
+def _facts(count: int):
+    return [
+        Fact(id=f"fact-{i}", type="profile", key=f"key_{i}", value=f"value {i}")
+        for i in range(count)
+    ]
+
+
+def _retriever(monkeypatch, top_k: int = 3):
+    llm = _FakeLLM()
+    monkeypatch.setattr(fact_index, "get_llm_service", lambda: llm)
+    return FactRetriever(InMemoryFactIndex(), top_k=top_k), llm
+
+
+async def test_search_skips_embedding_when_all_facts_fit(monkeypatch):
+    retriever, llm = _retriever(monkeypatch)
+    facts = _facts(3)
+    
+    assert await retriever.search("uid", "what do I like?", facts) is None
+    assert retriever.select(facts, None) == facts
+    assert llm.embedded == []
+
+
+async def test_search_embeds_query_for_users_with_many_facts(monkeypatch):
+    retriever, llm = _retriever(monkeypatch)
+    facts = _facts(5)
+    await retriever.index_facts("uid", {f.id: f"{f.key}: {f.value}" for f in facts})
+    
+    matches = await retriever.search("uid", "what do I like?", facts)
+    
+    assert llm.embedded[-1] == "what do I like?"
+    assert len(retriever.select(facts, matches)) == 3
+    assert await retriever.search("uid", "   ", facts) is None
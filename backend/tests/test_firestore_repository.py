@@ -0,0 +1,125 @@
+"""Repository tests against the Firestore emulator (set FIRESTORE_EMULATOR_HOST)."""
+
+import asyncio
+import os
+import uuid
+
+import pytest
+from google.cloud.firestore import AsyncClient
+
+from app.repositories.firestore_repository import MAX_BATCH_WRITES, FirestoreRepository
+
+pytestmark = pytest.mark.skipif(
+    not os.environ.get("FIRESTORE_EMULATOR_HOST"),
+    reason="needs the Firestore emulator",
+)
+
+
+@pytest.fixture
+async def repo():
+    db = AsyncClient(project="amorae-test")
+    yield FirestoreRepository(db)
+    db.close()
+
+
+def _fact(index: int) -> dict:
+    return {
+        "type": "profile",
+        "key": f"key_{index}",
+        "value": f"value {index}",
+        "status": "active",
+    }
+
+
+async def test_concurrent_message_writes_read_back_in_order(repo):
+    thread_id = f"thread-{uuid.uuid4()}"
+    
+    await asyncio.gather(*(
+        repo.set_message(thread_id, f"msg-{seq:02d}", {"seq": seq, "content": str(seq)})
+        for seq in range(1, 21)
+    ))
+    
+    recent = await repo.get_recent_messages(thread_id, 5)
+    assert [message["seq"] for message in recent] == [16, 17, 18, 19, 20]
+    in_range = await repo.get_messages_in_range(thread_id, 3, 6)
+    assert [message["seq"] for message in in_range] == [3, 4, 5, 6]
+    streamed = [doc.id async for doc in repo.stream_messages(thread_id)]
+    assert streamed == [f"msg-{seq:02d}" for seq in range(1, 21)]
+
+
+async def test_concurrent_thread_updates_all_land(repo):
+    uid = f"user-{uuid.uuid4()}"
+    thread_ids = [f"thread-{uuid.uuid4()}" for _ in range(3)]
+    for thread_id in thread_ids:
+        await repo.thread_ref(thread_id).set({"userId": uid})
+    await repo.thread_ref(f"thread-{uuid.uuid4()}").set({"userId": "someone-else"})
+    
+    await asyncio.gather(*(
+        repo.update_thread(thread_ids[0], {f"field{i}": i}) for i in range(5)
+    ))
+    
+    thread = await repo.get_thread(thread_ids[0])
+    assert {f"field{i}" for i in range(5)} <= set(thread)
+    owned = sorted([doc.id async for doc in repo.stream_user_threads(uid)])
+    assert owned == sorted(thread_ids)
+    assert await repo.get_thread(f"missing-{uuid.uuid4()}") is None
+
+
+async def test_facts_use_document_id(repo):
+    uid = f"user-{uuid.uuid4()}"
+    # Curated fact documents also store their own id
+    await repo.set_fact(uid, "fact-1", {**_fact(1), "id": "stale"})
+    await repo.set_fact(uid, "fact-2", {**_fact(2), "status": "deprecated"})
+    
+    assert [fact.id for fact in await repo.get_active_facts(uid)] == ["fact-1"]
+    assert sorted(fact.id for fact in await repo.get_all_facts(uid)) == ["fact-1", "fact-2"]
+
+
+async def test_concurrent_summary_updates_have_one_winner(repo):
+    thread_id = f"thread-{uuid.uuid4()}"
+    await repo.thread_ref(thread_id).set({"summary": {"toSeq": 10}})
+    
+    results = await asyncio.gather(*(
+        repo.compare_and_set_summary(thread_id, 10, {"toSeq": 20 + i, "text": str(i)})
+        for i in range(4)
+    ))
+    
+    assert results.count(True) == 1
+    summary = (await repo.get_thread(thread_id))["summary"]
+    assert summary["toSeq"] == 20 + results.index(True)
+
+
+async def test_summary_update_is_refused_once_advanced(repo):
+    thread_id = f"thread-{uuid.uuid4()}"
+    await repo.thread_ref(thread_id).set({"summary": {"toSeq": 10}})
+    
+    assert await repo.compare_and_set_summary(thread_id, 10, {"toSeq": 20})
+    assert not await repo.compare_and_set_summary(thread_id, 10, {"toSeq": 30})
+    assert not await repo.compare_and_set_summary(f"missing-{uuid.uuid4()}", 0, {"toSeq": 1})
+
+
+async def test_concurrent_fact_writes_span_batches(repo):
+    uid = f"user-{uuid.uuid4()}"
+    count = MAX_BATCH_WRITES + 20
+    creates = {f"fact-{i:04d}": _fact(i) for i in range(count)}
+    half = count // 2
+    
+    await asyncio.gather(
+        repo.write_facts(uid, dict(list(creates.items())[:half]), {}),
+        repo.write_facts(uid, dict(list(creates.items())[half:]), {}),
+    )
+    await repo.write_facts(uid, {}, {"fact-0000": {"value": "updated"}})
+    
+    paged = [doc.id async for doc in repo.stream_facts(uid, page_size=100)]
+    assert paged == sorted(creates)
+    assert (await repo.get_fact(uid, "fact-0000"))["value"] == "updated"
+
+
+async def test_delete_in_batches_empties_collection(repo):
+    uid = f"user-{uuid.uuid4()}"
+    await repo.write_facts(uid, {f"fact-{i}": _fact(i) for i in range(25)}, {})
+    
+    deleted = [n async for n in repo.delete_in_batches(repo.facts_ref(uid), batch_size=10)]
+    
+    assert deleted == [10, 10, 5]
+    assert await repo.get_all_facts(uid) == []
@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+
+from app.services.generation_registry import (
+    DeltaCoalescer,
+    GenerationRegistry,
+    GenerationStream,
+    IdempotencyConflictError,
+)
+
+
+async def _collect(stream: GenerationStream, cursor: int = 0):
+    return [event async for event in stream.subscribe(cursor)]
+
+
+async def test_retried_run_shares_one_generation():
+    registry = GenerationRegistry()
+    calls = 0
+    release = asyncio.Event()
+    
+    async def generate():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return "reply"
+    
+    first = registry.run("uid", "req-1", "fp", generate)
+    retry = registry.run("uid", "req-1", "fp", generate)
+    release.set()
+    
+    assert await asyncio.gather(first, retry) == ["reply", "reply"]
+    assert await registry.run("uid", "req-1", "fp", generate) == "reply"
+    assert calls == 1
+    assert registry.stats()["reattached"] == 2
+
+
+async def test_request_id_reused_for_other_request_conflicts():
+    registry = GenerationRegistry()
+    await registry.run("uid", "req-1", "fp-a", lambda: asyncio.sleep(0, "a"))
+    
+    with pytest.raises(IdempotencyConflictError):
+        registry.run("uid", "req-1", "fp-b", lambda: asyncio.sleep(0, "b"))
+    # Request ids are scoped to the user
+    assert await registry.run("other", "req-1", "fp-b", lambda: asyncio.sleep(0, "b")) == "b"
+
+
+async def test_failed_run_is_dropped_so_retry_runs_again():
+    registry = GenerationRegistry()
+    
+    async def fail():
+        raise RuntimeError("provider down")
+    
+    with pytest.raises(RuntimeError):
+        await registry.run("uid", "req-1", "fp", fail)
+    await asyncio.sleep(0)
+    
+    assert await registry.run("uid", "req-1", "fp", lambda: asyncio.sleep(0, "ok")) == "ok"
+
+
+async def test_stream_replays_buffer_to_late_and_resuming_subscribers():
+    registry = GenerationRegistry()
+    
+    async def produce(stream: GenerationStream):
+        stream.append("meta", {"id": "m1"})
+        stream.append("delta", {"cursor": 5, "text": "Hello"})
+        stream.append("delta", {"cursor": 11, "text": " world"})
+        stream.append("final", {"text": "Hello world"})
+        stream.finish()
+    
+    stream = registry.stream("uid", "req-1", "fp", "gen-1", produce)
+    await stream.task
+    
+    assert [event for event, _ in await _collect(stream)] == ["meta", "delta", "delta", "final"]
+    retried = registry.stream("uid", "req-1", "fp", "gen-2", produce)
+    assert retried is stream
+    
+    resumed = registry.find_stream("uid", "gen-1")
+    deltas = [data["text"] for event, data in await _collect(resumed, cursor=8) if event == "delta"]
+    assert deltas == ["rld"]
+    assert registry.find_stream("someone-else", "gen-1") is None
+
+
+async def test_live_subscriber_follows_new_events():
+    stream = GenerationStream("gen-1")
+    received = asyncio.ensure_future(_collect(stream))
+    await asyncio.sleep(0)
+    
+    coalescer = DeltaCoalescer(stream, window_ms=0)
+    coalescer.add("Hi")
+    coalescer.add(" there")
+    stream.finish()
+    
+    assert await received == [
+        ("delta", {"cursor": 2, "text": "Hi"}),
+        ("delta", {"cursor": 8, "text": " there"}),
+    ]
+
+
+async def test_stream_without_subscribers_is_abandoned():
+    registry = GenerationRegistry(abandon_after_seconds=0.01)
+    
+    async def produce(stream: GenerationStream):
+        stream.append("delta", {"cursor": 1, "text": "a"})
+        await asyncio.sleep(60)
+    
+    stream = registry.stream("uid", "req-1", "fp", "gen-1", produce)
+    events = stream.subscribe()
+    await events.__anext__()
+    # The client goes away after the first event
+    await events.aclose()
+    
+    with pytest.raises(asyncio.CancelledError):
+        await stream.task
+    await asyncio.sleep(0)
+    
+    assert stream.abandoned and stream.failed
+    assert registry.stats()["cancelled"] == 1
+    assert registry.find_stream("uid", "gen-1") is None
+
+
+async def test_connected_subscriber_keeps_stream_alive():
+    registry = GenerationRegistry(abandon_after_seconds=0.01)
+    
+    async def produce(stream: GenerationStream):
+        await asyncio.sleep(0.05)
+        stream.append("final", {"text": "done"})
+        stream.finish()
+    
+    stream = registry.stream("uid", "req-1", "fp", "gen-1", produce)
+    
+    assert await _collect(stream) == [("final", {"text": "done"})]
+    assert not stream.abandoned
@@ -0,0 +1,163 @@
+import asyncio
+import os
+
+import pytest
+from redis.asyncio import Redis
+
+from app.core import redis_client
+from app.services.job_queue import InProcessJobBackend, Job, JobQueue, RedisJobBackend
+
+
+def _merge_items(queued: dict, new: dict) -> dict:
+    return {"items": queued["items"] + new["items"]}
+
+
+async def _wait_finished(queue: JobQueue, job_id: str):
+    for _ in range(500):
+        job = await queue.get(job_id)
+        if job.status in ("succeeded", "failed"):
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+@pytest.fixture
+async def queue():
+    queue = JobQueue(InProcessJobBackend(), workers=4, job_timeout_seconds=5)
+    yield queue
+    await queue.stop()
+
+
+async def test_jobs_with_same_key_are_coalesced(queue):
+    handled = []
+    
+    async def handle(payload):
+        handled.append(payload["items"])
+        return len(payload["items"])
+    
+    queue.register("curate", handle, merge=_merge_items)
+    first = await queue.submit("curate", {"items": [1]}, uid="uid", key="uid")
+    second = await queue.submit("curate", {"items": [2]}, uid="uid", key="uid")
+    other = await queue.submit("curate", {"items": [3]}, uid="other", key="other")
+    
+    assert second.id == first.id
+    assert (await _wait_finished(queue, first.id)).result == 2
+    await _wait_finished(queue, other.id)
+    assert sorted(handled) == [[1, 2], [3]]
+    assert queue.stats()["coalesced"] == 1
+
+
+async def test_running_job_is_not_merged_into(queue):
+    started = asyncio.Event()
+    release = asyncio.Event()
+    handled = []
+    
+    async def handle(payload):
+        handled.append(payload["items"])
+        started.set()
+        await release.wait()
+    
+    queue.register("curate", handle, merge=_merge_items)
+    first = await queue.submit("curate", {"items": [1]}, uid="uid", key="uid")
+    await started.wait()
+    second = await queue.submit("curate", {"items": [2]}, uid="uid", key="uid")
+    release.set()
+    
+    assert second.id != first.id
+    await _wait_finished(queue, second.id)
+    assert handled == [[1], [2]]
+
+
+async def test_key_lease_runs_same_key_jobs_one_at_a_time(queue):
+    running = {"uid": 0, "other": 0}
+    peak = {"uid": 0, "other": 0}
+    
+    async def handle(payload):
+        key = payload["key"]
+        running[key] += 1
+        peak[key] = max(peak[key], running[key])
+        await asyncio.sleep(0.02)
+        running[key] -= 1
+    
+    queue.register("work", handle)
+    jobs = [
+        await queue.submit("work", {"key": key}, uid=key, key=key)
+        for key in ("uid", "uid", "uid", "other")
+    ]
+    
+    for job in jobs:
+        assert (await _wait_finished(queue, job.id)).status == "succeeded"
+    assert peak == {"uid": 1, "other": 1}
+    assert queue.stats()["deferred"] > 0
+
+
+async def test_failed_and_timed_out_jobs_are_recorded(queue):
+    async def fail(payload):
+        raise ValueError("bad payload")
+    
+    queue.register("fail", fail)
+    queue.register("slow", lambda payload: asyncio.sleep(1), timeout_seconds=0.01)
+    failed = await queue.submit("fail", {}, uid="uid")
+    slow = await queue.submit("slow", {}, uid="uid")
+    
+    assert (await _wait_finished(queue, failed.id)).error == "bad payload"
+    assert (await _wait_finished(queue, slow.id)).status == "failed"
+    assert queue.stats()["failed"] == 2
+
+
+async def test_backend_errors_do_not_stop_workers():
+    backend = InProcessJobBackend()
+    failures = {"acquire": 1, "release": 1}
+    acquire, release = backend.acquire, backend.release
+    
+    async def flaky_acquire(key, ttl_seconds):
+        if failures["acquire"]:
+            failures["acquire"] -= 1
+            raise ConnectionError("redis down")
+        return await acquire(key, ttl_seconds)
+    
+    async def flaky_release(key):
+        if failures["release"]:
+            failures["release"] -= 1
+            raise ConnectionError("redis down")
+        await release(key)
+    
+    backend.acquire, backend.release = flaky_acquire, flaky_release
+    queue = JobQueue(backend, workers=1, job_timeout_seconds=5)
+    queue.register("work", lambda payload: asyncio.sleep(0, payload["n"]))
+    try:
+        first = await queue.submit("work", {"n": 1}, uid="uid", key="a")
+        second = await queue.submit("work", {"n": 2}, uid="uid", key="b")
+        
+        assert (await _wait_finished(queue, first.id)).result == 1
+        assert (await _wait_finished(queue, second.id)).result == 2
+        assert queue.stats()["workers"] == 1
+    finally:
+        await queue.stop()
+
+
+async def test_unknown_kind_is_rejected(queue):
+    with pytest.raises(ValueError):
+        await queue.submit("unknown", {}, uid="uid")
+
+
+@pytest.mark.skipif(not os.environ.get("REDIS_URL"), reason="needs Redis")
+async def test_job_of_dead_worker_is_queued_again_then_failed(monkeypatch):
+    redis = Redis.from_url(os.environ["REDIS_URL"], decode_responses=True)
+    monkeypatch.setattr(redis_client, "_redis_client", redis)
+    await redis.flushdb()
+    backend = RedisJobBackend()
+    job = Job(kind="curate", payload={}, uid="uid", key="uid")
+    await backend.put(job)
+    try:
+        for attempt in range(1, 4):
+            # The worker claims the job, then dies before saving it
+            claimed = await backend.take(lambda job: 0)
+            assert (claimed.id, claimed.attempts) == (job.id, attempt)
+            assert await backend.reap_expired() == 1
+        
+        stored = await backend.get(job.id)
+        assert stored.status == "failed"
+        assert await backend.reap_expired() == 0
+    finally:
+        await redis.aclose()
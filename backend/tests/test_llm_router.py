@@ -0,0 +1,187 @@
+import asyncio
+from typing import List, Optional, Tuple
+
+import httpx
+import openai
+import pytest
+
+from app.services.llm_router import AllProvidersFailedError, LLMProvider, LLMRouter
+from app.services.llm_transport import AdaptiveLimiter, LLMTransport
+
+
+def _status_error(status: int) -> openai.APIStatusError:
+    request = httpx.Request("POST", "https://llm.test/v1/chat/completions")
+    return openai.APIStatusError(
+        f"status {status}", response=httpx.Response(status, request=request), body=None
+    )
+
+
+class _FakeStream:
+    def __init__(self, chunks: List[str], first_chunk_delay: float = 0):
+        self.chunks = chunks
+        self.first_chunk_delay = first_chunk_delay
+        self.closed = False
+    
+    async def __aiter__(self):
+        await asyncio.sleep(self.first_chunk_delay)
+        for chunk in self.chunks:
+            yield chunk
+    
+    async def close(self) -> None:
+        self.closed = True
+
+
+class _FakeProvider:
+    """What one provider does with each request: an error to raise or a response."""
+    
+    def __init__(self, name: str, *outcomes):
+        self.name = name
+        self.outcomes = list(outcomes)
+        self.calls = 0
+    
+    async def __call__(self):
+        self.calls += 1
+        outcome = self.outcomes[min(self.calls, len(self.outcomes)) - 1]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def _router(*fakes: _FakeProvider, hedge_after_seconds: float = 0) -> LLMRouter:
+    providers = [
+        LLMProvider(
+            name=fake.name,
+            client=None,
+            transport=LLMTransport(httpx.AsyncClient(), AdaptiveLimiter(), max_retries=0),
+            model="model",
+            vision_model="vision-model",
+        )
+        for fake in fakes
+    ]
+    return LLMRouter(providers, hedge_after_seconds=hedge_after_seconds, cooldown_seconds=60)
+
+
+def _request(*fakes: _FakeProvider):
+    by_name = {fake.name: fake for fake in fakes}
+    return lambda provider: by_name[provider.name]()
+
+
+async def _read(router: LLMRouter, request) -> Tuple[Optional[str], List[str]]:
+    name, chunks = None, []
+    async for provider, chunk in router.stream(request):
+        name = provider.name
+        chunks.append(chunk)
+    return name, chunks
+
+
+async def test_complete_fails_over_on_server_errors():
+    primary = _FakeProvider("primary", _status_error(503))
+    fallback = _FakeProvider("fallback", "reply")
+    router = _router(primary, fallback)
+    
+    response, provider = await router.complete(_request(primary, fallback))
+    
+    assert (response, provider.name) == ("reply", "fallback")
+    assert router.stats()["failovers"] == 1
+    assert router.providers[0].stats.failures == 1
+
+
+@pytest.mark.parametrize("error", [
+    _status_error(429),
+    _status_error(408),
+    httpx.ConnectError("connection refused"),
+    TimeoutError(),
+])
+async def test_complete_fails_over_on_transient_errors(error):
+    primary = _FakeProvider("primary", error)
+    fallback = _FakeProvider("fallback", "reply")
+    
+    _, provider = await _router(primary, fallback).complete(_request(primary, fallback))
+    
+    assert provider.name == "fallback"
+
+
+@pytest.mark.parametrize("status", [400, 401, 404, 422])
+async def test_complete_raises_client_errors_without_failover(status):
+    primary = _FakeProvider("primary", _status_error(status))
+    fallback = _FakeProvider("fallback", "reply")
+    router = _router(primary, fallback)
+    
+    with pytest.raises(openai.APIStatusError):
+        await router.complete(_request(primary, fallback))
+    
+    assert fallback.calls == 0
+    assert router.providers[0].stats.failures == 0
+
+
+async def test_complete_reports_every_failure():
+    primary = _FakeProvider("primary", _status_error(500))
+    fallback = _FakeProvider("fallback", _status_error(502))
+    
+    with pytest.raises(AllProvidersFailedError):
+        await _router(primary, fallback).complete(_request(primary, fallback))
+
+
+async def test_failing_provider_cools_down():
+    primary = _FakeProvider("primary", _status_error(500))
+    fallback = _FakeProvider("fallback", "reply")
+    router = _router(primary, fallback)
+    router.providers[0].stats.record_success(0.1)
+    router.providers[1].stats.record_success(10.0)
+    
+    for _ in range(3):
+        await router.complete(_request(primary, fallback))
+    
+    assert router.providers[0].stats.cooling_down
+    assert [p.name for p in router.ranked()] == ["fallback", "primary"]
+    await router.complete(_request(primary, fallback))
+    assert primary.calls == 3
+
+
+async def test_faster_provider_is_preferred():
+    router = _router(_FakeProvider("slow"), _FakeProvider("fast"))
+    router.providers[0].stats.record_success(2.0)
+    router.providers[1].stats.record_success(0.5)
+    
+    assert [p.name for p in router.ranked()] == ["fast", "slow"]
+
+
+async def test_stream_fails_over_before_first_chunk():
+    primary = _FakeProvider("primary", _status_error(500))
+    fallback = _FakeProvider("fallback", _FakeStream(["Hel", "lo"]))
+    router = _router(primary, fallback)
+    
+    assert await _read(router, _request(primary, fallback)) == ("fallback", ["Hel", "lo"])
+    assert router.stats()["failovers"] == 1
+
+
+async def test_stream_raises_client_errors_without_failover():
+    primary = _FakeProvider("primary", _status_error(400))
+    fallback = _FakeProvider("fallback", _FakeStream(["Hi"]))
+    
+    with pytest.raises(openai.APIStatusError):
+        await _read(_router(primary, fallback), _request(primary, fallback))
+    
+    assert fallback.calls == 0
+
+
+async def test_slow_stream_is_hedged_and_loser_closed():
+    slow_stream = _FakeStream(["slow"], first_chunk_delay=5)
+    primary = _FakeProvider("primary", slow_stream)
+    fallback = _FakeProvider("fallback", _FakeStream(["fast"]))
+    router = _router(primary, fallback, hedge_after_seconds=0.01)
+    
+    assert await _read(router, _request(primary, fallback)) == ("fallback", ["fast"])
+    stats = router.stats()
+    assert (stats["hedged"], stats["hedge_wins"]) == (1, 1)
+    assert slow_stream.closed
+
+
+async def test_fast_stream_is_not_hedged():
+    primary = _FakeProvider("primary", _FakeStream(["a", "b"]))
+    fallback = _FakeProvider("fallback", _FakeStream(["c"]))
+    router = _router(primary, fallback, hedge_after_seconds=1)
+    
+    assert await _read(router, _request(primary, fallback)) == ("primary", ["a", "b"])
+    assert fallback.calls == 0
+    assert router.stats()["hedged"] == 0
@@ -0,0 +1,104 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.core import rate_limit
+from app.core.auth import AuthenticatedUser
+from app.core.rate_limit import InMemoryRateLimiter, RateLimiter
+
+
+class _Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+    
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(rate_limit, "time", SimpleNamespace(monotonic=clock, time=clock))
+    return clock
+
+
+async def test_token_bucket_allows_burst_then_refills(clock):
+    backend = InMemoryRateLimiter()
+    
+    for _ in range(3):
+        assert await backend.take_token("requests:uid", 3, 60) == 0
+    assert await backend.take_token("requests:uid", 3, 60) == pytest.approx(20)
+    # Other users have their own bucket
+    assert await backend.take_token("requests:other", 3, 60) == 0
+    
+    clock.now += 20
+    assert await backend.take_token("requests:uid", 3, 60) == 0
+    assert await backend.take_token("requests:uid", 3, 60) > 0
+
+
+async def test_token_bucket_does_not_refill_past_capacity(clock):
+    backend = InMemoryRateLimiter()
+    await backend.take_token("requests:uid", 2, 60)
+    
+    clock.now += 3600
+    assert await backend.take_token("requests:uid", 2, 60) == 0
+    assert await backend.take_token("requests:uid", 2, 60) == 0
+    assert await backend.take_token("requests:uid", 2, 60) > 0
+
+
+async def test_daily_window_counts_each_request_once(clock):
+    backend = InMemoryRateLimiter()
+    day = 24 * 60 * 60
+    
+    assert await backend.record_in_window("messages:uid", 2, day, "req-1") == 0
+    clock.now += 100
+    assert await backend.record_in_window("messages:uid", 2, day, "req-2") == 0
+    # A retry of a counted request is free, even at the limit
+    assert await backend.record_in_window("messages:uid", 2, day, "req-1") == 0
+    assert await backend.record_in_window("messages:uid", 2, day, "req-3") == pytest.approx(
+        day - 100
+    )
+    
+    # The oldest message leaves the window after a day
+    clock.now += day - 100
+    assert await backend.record_in_window("messages:uid", 2, day, "req-3") == 0
+    assert await backend.record_in_window("messages:uid", 2, day, "req-4") > 0
+
+
+async def test_zero_limits_disable_checks():
+    limiter = RateLimiter(InMemoryRateLimiter(), requests_per_minute=0, messages_per_day=0)
+    
+    for i in range(100):
+        assert await limiter.check_request("uid") == 0
+        assert await limiter.check_message("uid", f"req-{i}") == 0
+
+
+async def test_backend_errors_let_requests_through():
+    class _DownBackend:
+        async def take_token(self, *args):
+            raise ConnectionError("redis down")
+        
+        async def record_in_window(self, *args):
+            raise ConnectionError("redis down")
+    
+    limiter = RateLimiter(_DownBackend(), requests_per_minute=1, messages_per_day=1)
+    
+    assert await limiter.check_request("uid") == 0
+    assert await limiter.check_message("uid", "req-1") == 0
+    assert limiter.stats()["backend_errors"] == 2
+
+
+async def test_message_quota_dependency_raises_429(monkeypatch, clock):
+    limiter = RateLimiter(InMemoryRateLimiter(), requests_per_minute=60, messages_per_day=1)
+    monkeypatch.setattr(rate_limit, "_rate_limiter", limiter)
+    user = AuthenticatedUser(uid="uid")
+    
+    assert await rate_limit.enforce_message_quota(user, "req-1") is user
+    assert await rate_limit.enforce_message_quota(user, "req-1") is user
+    with pytest.raises(HTTPException) as raised:
+        await rate_limit.enforce_message_quota(user, "req-2")
+    
+    assert raised.value.status_code == 429
+    assert raised.value.headers["Retry-After"] == str(24 * 60 * 60)
+    assert limiter.stats()["limited_messages"] == 1
@@ -0,0 +1,73 @@
+from app.models.schemas import Fact
+from app.services.token_budget import ContextBudget, count_tokens, message_tokens
+
+
+def _message(index: int, tokens: int = 96, **fields) -> dict:
+    return {"role": "user", "content": f"message {index}", "tokenCount": tokens, **fields}
+
+
+def _fact(key: str, value: str, importance: float, confidence: float = 1.0) -> Fact:
+    return Fact(
+        id=key, type="profile", key=key, value=value, importance=importance, confidence=confidence
+    )
+
+
+def test_message_tokens_prefers_stored_count():
+    assert message_tokens({"content": "x" * 4000, "tokenCount": 3}) == 3 + 4
+    assert message_tokens({"content": ""}) == 4
+    image = {"kind": "image", "url": "https://example.com/a.png"}
+    assert message_tokens(_message(0, tokens=10, attachments=[image])) == 10 + 4 + 765
+
+
+def test_count_tokens_of_empty_text_is_zero():
+    assert count_tokens("") == 0
+    assert count_tokens("hello there") > 0
+
+
+def test_fit_history_keeps_most_recent_messages_that_fit():
+    budget = ContextBudget(total_tokens=1000, max_output_tokens=200, facts_tokens=100)
+    messages = [_message(i) for i in range(10)]
+    
+    # 796 tokens are left for history; each message costs 100
+    assert budget.fit_history(messages, "") == messages[-7:]
+    assert budget.fit_history(messages[:3], "") == messages[:3]
+    assert budget.fit_history([], "") == []
+
+
+def test_fit_history_leaves_room_for_system_prompt():
+    budget = ContextBudget(total_tokens=1000, max_output_tokens=200, facts_tokens=100)
+    messages = [_message(i) for i in range(10)]
+    
+    kept = budget.fit_history(messages, "word " * 400)
+    
+    assert 1 <= len(kept) < 7
+    assert kept == messages[-len(kept):]
+
+
+def test_fit_history_always_keeps_current_turn():
+    budget = ContextBudget(total_tokens=100, max_output_tokens=50, facts_tokens=10)
+    messages = [_message(0), _message(1, tokens=5000)]
+    
+    assert budget.fit_history(messages, "") == [messages[-1]]
+
+
+def test_select_facts_prefers_important_facts():
+    budget = ContextBudget(total_tokens=1000, max_output_tokens=200, facts_tokens=1000)
+    facts = [
+        _fact("hobby", "hiking", importance=0.3),
+        _fact("name", "Sam", importance=0.9),
+        _fact("job", "nurse", importance=0.9, confidence=0.5),
+    ]
+    
+    assert [f.key for f in budget.select_facts(facts)] == ["name", "job", "hobby"]
+
+
+def test_select_facts_skips_facts_over_budget():
+    budget = ContextBudget(total_tokens=1000, max_output_tokens=200, facts_tokens=50)
+    facts = [
+        _fact("life_story", "long story " * 400, importance=1.0),
+        _fact("name", "Sam", importance=0.5),
+    ]
+    
+    assert [f.key for f in budget.select_facts(facts)] == ["name"]
+    assert ContextBudget(1000, 200, facts_tokens=0).select_facts(facts) == []